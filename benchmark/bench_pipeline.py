@@ -0,0 +1,379 @@
+"""
+解析、表格处理、切割各阶段的性能测试
+
+宏观测试：在test/demo.pdf和合成pdf（多页文本、表格密集、图片密集、中文文本）上测试parse_pdf、parse_and_split_pdf，
+每个用例在独立的进程中执行，记录pages/s、chunks/s和峰值内存；
+微观测试：deal_table_nest、deal_block_include_table、split_pdf_page_lst、RecursiveCharacterTextSplitter
+
+python -m benchmark.bench_pipeline                                   # 运行并与benchmark/baseline.json对比
+                                                                     # 基准在其他机器上生成时只提示，不判定退化
+python -m benchmark.bench_pipeline --save_baseline                   # 运行并更新基准
+python -m benchmark.bench_pipeline --only macro/demo --output res.json
+"""
+
+import os
+import sys
+import copy
+import json
+import time
+import platform
+import argparse
+import multiprocessing
+from typing import Dict, Callable, List, Tuple, Optional
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz
+from loguru import logger
+
+try:
+    # resource只在Unix下可用
+    import resource
+except ImportError:
+    resource = None
+
+from benchmark.synthetic_pdfs import ensure_synthetic_pdfs
+from benchmark.bench_split_text import make_cjk_text, make_english_text
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEMO_PDF = os.path.join(ROOT_DIR, 'test', 'demo.pdf')
+BASELINE_PATH = os.path.join(ROOT_DIR, 'benchmark', 'baseline.json')
+
+
+def _quiet_logger():
+    logger.remove()
+    logger.add(sys.stderr, level='WARNING')
+
+
+def _peak_rss_mb() -> Optional[float]:
+    """
+    当前进程的RSS峰值；Linux下读取/proc/self/status的VmHWM，exec后重新计算，
+    ru_maxrss在spawn的子进程中会保留父进程的RSS，不能反映用例本身的内存
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    if resource is None or sys.platform != 'darwin':
+        return None
+    # macOS下ru_maxrss单位为字节，spawn的子进程不继承父进程的峰值
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 / 1024, 1)
+
+
+def timeit(func: Callable[[], object], repeat: int) -> Tuple[float, object]:
+    """ 运行repeat次，返回最快一次的耗时和最后一次的结果 """
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def calibrate(repeat: int = 5) -> float:
+    """
+    固定的纯Python负载的耗时（取最快一次），用于折算同一台机器在不同时间的整体速度差异（如CPU降频、其他负载）
+    """
+    def _run():
+        data = {str(i): i * 2 for i in range(300_000)}
+        return sorted(data, key=len)
+
+    seconds, _ = timeit(_run, repeat)
+    return round(seconds, 4)
+
+
+# ---------------- 宏观测试，在子进程中执行 ----------------
+
+def _macro_parse(path: str, repeat: int) -> dict:
+    from utils.utils_pymupdf_parse import parse_pdf
+    _quiet_logger()
+    seconds, all_pdf_pages = timeit(lambda: parse_pdf(path, use_cache=False), repeat)
+    page_count = len(all_pdf_pages.pdf_pages)
+    return {
+        'pages': page_count,
+        'seconds': round(seconds, 4),
+        'pages_per_second': round(page_count / seconds, 2),
+        'peak_rss_mb': _peak_rss_mb(),
+    }
+
+
+def _macro_parse_and_split(path: str, repeat: int) -> dict:
+    from utils.utils_pdf import parse_and_split_pdf_multi
+    from utils.env import CHUNK_SIZE_LIST, CHUNK_OVERLAP_LIST
+    _quiet_logger()
+    with fitz.open(path) as pdf:
+        page_count = pdf.page_count
+
+    def _run():
+        return parse_and_split_pdf_multi(path, CHUNK_SIZE_LIST, CHUNK_OVERLAP_LIST, use_cache=False)
+
+    seconds, split_docs = timeit(_run, repeat)
+    chunk_count = len(split_docs)
+    return {
+        'pages': page_count,
+        'chunks': chunk_count,
+        'seconds': round(seconds, 4),
+        'pages_per_second': round(page_count / seconds, 2),
+        'chunks_per_second': round(chunk_count / seconds, 2),
+        'peak_rss_mb': _peak_rss_mb(),
+    }
+
+
+def run_in_subprocess(func: Callable, *args) -> dict:
+    # 每个用例使用新的进程，峰值内存互不影响
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(func, *args).result()
+
+
+# ---------------- 微观测试 ----------------
+
+def _load_page_tables(path: str) -> List[tuple]:
+    """ 获取每页的块和表格识别的原始结果，作为表格处理阶段的输入 """
+    from utils.utils_pymupdf_parse import get_page_blocks, parse_block_content, find_page_tables
+    pages = []
+    with fitz.open(path) as pdf:
+        for num_page, page in enumerate(pdf):
+            block_lst = [parse_block_content(block) for block in get_page_blocks(page, num_page)]
+            pages.append((block_lst, find_page_tables(page)))
+    return pages
+
+
+def _micro_deal_table_nest(pages: List[tuple], repeat: int, number: int = 100) -> dict:
+    from utils.utils_pymupdf_parse import deal_table_nest
+    # 单页耗时很短，每次处理number遍全部页；deal_table_nest会修改输入，提前复制好每次运行的输入，复制不计入耗时
+    page_count = len(pages) * number
+    best = float('inf')
+    for _ in range(repeat):
+        tables = [copy.deepcopy(table_lst) for _, table_lst in pages for _ in range(number)]
+        start = time.perf_counter()
+        for table_lst in tables:
+            deal_table_nest(table_lst)
+        best = min(best, time.perf_counter() - start)
+    return {'pages': page_count, 'seconds': round(best, 4), 'pages_per_second': round(page_count / best, 2)}
+
+
+def _micro_deal_block_include_table(pages: List[tuple], repeat: int, number: int = 100) -> dict:
+    from utils.utils_pymupdf_parse import deal_table_nest, deal_block_include_table
+    inputs = [(block_lst, deal_table_nest(copy.deepcopy(table_lst))) for block_lst, table_lst in pages]
+    page_count = len(inputs) * number
+
+    def _run():
+        for _ in range(number):
+            for block_lst, table_lst in inputs:
+                deal_block_include_table(block_lst, table_lst)
+
+    seconds, _ = timeit(_run, repeat)
+    return {'pages': page_count, 'seconds': round(seconds, 4), 'pages_per_second': round(page_count / seconds, 2)}
+
+
+def _micro_split_pdf_page_lst(path: str, repeat: int) -> dict:
+    from utils.utils_pymupdf_parse import iter_page_records
+    from utils.utils_pdf import split_pdf_page_lst
+    page_lst = list(iter_page_records(path, use_cache=False))
+
+    def _run():
+        return split_pdf_page_lst(page_lst, chunk_size=400, chunk_overlap=80)
+
+    seconds, split_docs = timeit(_run, repeat)
+    chunk_count = len(split_docs)
+    return {
+        'pages': len(page_lst),
+        'chunks': chunk_count,
+        'seconds': round(seconds, 4),
+        'pages_per_second': round(len(page_lst) / seconds, 2),
+        'chunks_per_second': round(chunk_count / seconds, 2),
+    }
+
+
+def _micro_text_splitter(text: str, repeat: int) -> dict:
+    from utils.utils_split_text import RecursiveCharacterTextSplitter
+    splitter = RecursiveCharacterTextSplitter(chunk_size=400, chunk_overlap=80)
+    seconds, chunks = timeit(lambda: splitter.split_text(text), repeat)
+    chunk_count = len(chunks)
+    return {
+        'chars': len(text),
+        'chunks': chunk_count,
+        'seconds': round(seconds, 4),
+        'chars_per_second': round(len(text) / seconds, 2),
+        'chunks_per_second': round(chunk_count / seconds, 2),
+    }
+
+
+def build_cases(pdf_paths: Dict[str, str], repeat: int, macro_repeat: int = 3) -> Dict[str, Callable[[], dict]]:
+    """
+    生成全部测试用例，key为用例名称
+    :param pdf_paths: 名称到pdf路径的映射
+    :param repeat: 微观测试的重复次数，取最快的一次
+    :param macro_repeat: 宏观测试的重复次数，取最快的一次
+    :return:
+    """
+    cases = dict()
+    for name, path in pdf_paths.items():
+        cases[f'macro/{name}/parse'] = lambda path=path: run_in_subprocess(_macro_parse, path, macro_repeat)
+        cases[f'macro/{name}/parse_and_split'] = lambda path=path: run_in_subprocess(_macro_parse_and_split, path,
+                                                                                    macro_repeat)
+
+    table_pages = dict()
+
+    def _table_pages():
+        if 'pages' not in table_pages:
+            table_pages['pages'] = _load_page_tables(pdf_paths['table_dense'])
+        return table_pages['pages']
+
+    cases['micro/deal_table_nest'] = lambda: _micro_deal_table_nest(_table_pages(), repeat)
+    cases['micro/deal_block_include_table'] = lambda: _micro_deal_block_include_table(_table_pages(), repeat)
+    cases['micro/split_pdf_page_lst'] = lambda: _micro_split_pdf_page_lst(pdf_paths['demo'], repeat)
+    cases['micro/text_splitter/cjk'] = lambda: _micro_text_splitter(make_cjk_text(1_000_000), repeat)
+    cases['micro/text_splitter/english'] = lambda: _micro_text_splitter(make_english_text(1_000_000), repeat)
+    return cases
+
+
+def host_fingerprint() -> dict:
+    """
+    运行环境的标识，基准只在相同环境下用于判定退化；不包含主机名，相同配置的机器之间共用基准，
+    机器之间的整体速度差异由calibrate折算
+    """
+    return {
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version(),
+        'pymupdf': fitz.VersionBind,
+    }
+
+
+def best_metrics(metrics: dict, other: dict) -> dict:
+    """ 合并同一用例的两次结果，每项取较好的值：吞吐取大，耗时、峰值内存取小 """
+    best = dict(metrics)
+    for metric, value in other.items():
+        if metric.endswith('_per_second'):
+            best[metric] = max(best[metric], value)
+        elif metric in ('seconds', 'peak_rss_mb') and value is not None:
+            best[metric] = value if best[metric] is None else min(best[metric], value)
+    return best
+
+
+def compare_with_baseline(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float,
+                          speed: float = 1.0) -> List[str]:
+    """
+    与基准对比，吞吐（*_per_second）下降或峰值内存上升超过tolerance时视为退化
+    :param results:
+    :param baseline:
+    :param tolerance:
+    :param speed: 本次运行时机器相对于生成基准时的速度（见calibrate），吞吐按此折算后再对比
+    :return: 退化项的说明
+    """
+    regressions = []
+    for case, metrics in results.items():
+        base_metrics = baseline.get(case)
+        if not base_metrics:
+            continue
+        for metric, value in metrics.items():
+            base_value = base_metrics.get(metric)
+            if not base_value or value is None:
+                continue
+            ratio = value / base_value
+            if metric.endswith('_per_second') and ratio / speed < 1 - tolerance:
+                regressions.append(f'{case} {metric}: {base_value} -> {value} ({ratio:.2f}x，折算后{ratio / speed:.2f}x)')
+            elif metric == 'peak_rss_mb' and ratio > 1 + tolerance:
+                regressions.append(f'{case} {metric}: {base_value} -> {value} ({ratio:.2f}x)')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='解析、表格处理、切割各阶段的性能测试')
+    parser.add_argument('--work_dir', type=str, default='/tmp/pdf_bench', help='合成pdf的存放目录')
+    parser.add_argument('--repeat', type=int, default=5, help='微观测试的重复次数，取最快的一次')
+    parser.add_argument('--macro_repeat', type=int, default=3, help='宏观测试的重复次数，取最快的一次')
+    parser.add_argument('--only', type=str, default=None, help='只运行名称以此开头的用例，如macro/demo')
+    parser.add_argument('--baseline', type=str, default=BASELINE_PATH, help='基准结果路径')
+    parser.add_argument('--save_baseline', action='store_true', help='将本次结果保存为基准')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='允许的退化比例')
+    parser.add_argument('--require_baseline', action='store_true',
+                        help='基准不是在相同配置的环境中生成时返回非0，用于CI中确保退化检查生效')
+    parser.add_argument('--output', type=str, default=None, help='本次结果的保存路径')
+    args = parser.parse_args()
+    _quiet_logger()
+
+    pdf_paths = {'demo': DEMO_PDF}
+    pdf_paths.update(ensure_synthetic_pdfs(args.work_dir))
+    cases = build_cases(pdf_paths, args.repeat, args.macro_repeat)
+
+    calibration_seconds = calibrate()
+    results = dict()
+    for case, run in cases.items():
+        if args.only and not case.startswith(args.only):
+            continue
+        results[case] = run()
+        metrics = '  '.join(f'{k}={v}' for k, v in results[case].items())
+        print(f'{case:<40} {metrics}', flush=True)
+    # 运行前后各测一次，取较快的一次
+    calibration_seconds = min(calibration_seconds, calibrate())
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'pymupdf': fitz.VersionBind,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'repeat': args.repeat,
+            'macro_repeat': args.macro_repeat,
+            'host': host_fingerprint(),
+            'calibration_seconds': calibration_seconds,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.save_baseline:
+        baseline_report = dict(report)
+        if args.only and os.path.isfile(args.baseline):
+            # 只运行了部分用例时，保留基准中的其他用例
+            with open(args.baseline, encoding='utf-8') as f:
+                baseline_report['results'] = {**json.load(f)['results'], **results}
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline_report, f, ensure_ascii=False, indent=2)
+        print(f'基准已保存：{args.baseline}')
+        return
+
+    if not os.path.isfile(args.baseline):
+        print(f'基准不存在：{args.baseline}，使用--save_baseline生成')
+        return
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    # 不同机器之间的耗时不可比，基准不是在当前环境生成时只输出差异，不判定退化
+    same_host = baseline.get('meta', {}).get('host') == host_fingerprint()
+    if not same_host:
+        print('注意：基准不是在当前环境生成的，对比结果仅供参考，可使用--save_baseline在本机重新生成')
+        print(f"  基准：{baseline.get('meta', {}).get('host')}")
+        print(f'  当前：{host_fingerprint()}')
+        if args.require_baseline:
+            sys.exit(2)
+    base_calibration = baseline.get('meta', {}).get('calibration_seconds')
+    speed = base_calibration / calibration_seconds if base_calibration else 1.0
+    print(f'机器速度（相对于生成基准时）：{speed:.2f}x')
+    regressions = compare_with_baseline(results, baseline['results'], args.tolerance, speed=speed)
+    if regressions and same_host:
+        # 单次波动不判定为退化：退化的用例重新运行一次，取两次中较好的结果
+        for case in [case for case in results
+                     if compare_with_baseline({case: results[case]}, baseline['results'], args.tolerance, speed)]:
+            print(f'重新运行：{case}', flush=True)
+            results[case] = best_metrics(results[case], cases[case]())
+        regressions = compare_with_baseline(results, baseline['results'], args.tolerance, speed=speed)
+    if regressions:
+        print('性能退化：' if same_host else '与基准的差异：')
+        for line in regressions:
+            print(f'  {line}')
+        if same_host:
+            sys.exit(1)
+        return
+    print(f'与基准对比：无超过{args.tolerance:.0%}的退化')
+
+
+if __name__ == '__main__':
+    main()
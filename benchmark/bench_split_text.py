@@ -0,0 +1,86 @@
+
+"""
+RecursiveCharacterTextSplitter分隔符扫描的性能测试
+
+对比预编译分隔符 + str.split 的实现与原先每次调用都re.escape、re.search、re.split的实现，
+在大段中文、英文文本上的耗时，并校验两者切割结果一致
+
+python -m benchmark.bench_split_text
+"""
+
+import re
+import time
+import argparse
+from typing import List
+
+from utils.utils_split_text import RecursiveCharacterTextSplitter, _split_text_with_regex
+
+
+class LegacySeparatorSplitter(RecursiveCharacterTextSplitter):
+    """ 原先的分隔符查找、切割方式，作为对比基准 """
+
+    def _has_separator(self, text: str, separator: str) -> bool:
+        _separator = separator if self._is_separator_regex else re.escape(separator)
+        return re.search(_separator, text) is not None
+
+    def _split_text_with_separator(self, text: str, separator: str) -> List[str]:
+        _separator = separator if self._is_separator_regex else re.escape(separator)
+        return _split_text_with_regex(text, _separator, self._keep_separator)
+
+
+def make_cjk_text(size: int) -> str:
+    sentence = '人工智能在教育领域的应用越来越广泛，研究者从不同角度分析了其影响'
+    paragraph = '。'.join([sentence] * 6) + '。\n'
+    text = (paragraph * 4 + '\n') * (size // (len(paragraph) * 4 + 1) + 1)
+    return text[:size]
+
+
+def make_cjk_dense_text(size: int) -> str:
+    # 没有换行、空格的中文，需要逐级检查到'。'才能切割
+    sentence = '这是一段没有换行也没有空格的中文文本用于测试分隔符的查找' * 4 + '。'
+    return (sentence * (size // len(sentence) + 1))[:size]
+
+
+def make_english_text(size: int) -> str:
+    sentence = 'Artificial intelligence has been applied in education for decades. '
+    paragraph = sentence * 8 + '\n'
+    text = (paragraph * 5 + '\n') * (size // (len(paragraph) * 5 + 1) + 1)
+    return text[:size]
+
+
+def timeit(func, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='分隔符扫描性能测试')
+    parser.add_argument('--size', type=int, default=2_000_000, help='文本长度')
+    parser.add_argument('--repeat', type=int, default=3, help='重复次数，取最快的一次')
+    args = parser.parse_args()
+
+    texts = {
+        'cjk': make_cjk_text(args.size),
+        'cjk_dense': make_cjk_dense_text(args.size),
+        'english': make_english_text(args.size),
+    }
+    print(f'{"text":<10} {"chunk":>6} {"legacy(s)":>10} {"current(s)":>11} {"speedup":>8}')
+    for name, text in texts.items():
+        for chunk_size in (200, 400, 800):
+            kwargs = dict(chunk_size=chunk_size, chunk_overlap=chunk_size // 5)
+            legacy = LegacySeparatorSplitter(**kwargs)
+            current = RecursiveCharacterTextSplitter(**kwargs)
+            assert legacy.split_text(text) == current.split_text(text)
+
+            legacy_time = timeit(lambda: legacy.split_text(text), args.repeat)
+            current_time = timeit(lambda: current.split_text(text), args.repeat)
+            print(f'{name:<10} {chunk_size:>6} {legacy_time:>10.3f} {current_time:>11.3f} '
+                  f'{legacy_time / current_time:>7.2f}x')
+
+
+if __name__ == '__main__':
+    main()
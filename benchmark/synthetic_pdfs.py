@@ -0,0 +1,123 @@
+"""
+性能测试用的合成pdf：多页文本、表格密集、图片密集、中文文本
+
+python -m benchmark.synthetic_pdfs --out_dir /tmp/pdf_bench
+"""
+
+import os
+import argparse
+from typing import Dict, Callable
+
+import fitz
+
+CJK_SENTENCE = '人工智能在教育领域的应用越来越广泛，研究者从不同角度分析了其影响。'
+EN_SENTENCE = 'Artificial intelligence has been applied in education for decades. '
+
+
+def _insert_paragraphs(page: fitz.Page, sentence: str, lines: int, fontname: str = 'helv', y0: float = 50) -> None:
+    # 每行一句，写满lines行
+    text = '\n'.join([sentence] * lines)
+    page.insert_textbox(fitz.Rect(50, y0, 545, 800), text, fontname=fontname, fontsize=9)
+
+
+def _draw_grid(page: fitz.Page, x0: float, y0: float, rows: int, cols: int,
+               cell_width: float, row_height: float, prefix: str) -> None:
+    for r in range(rows + 1):
+        page.draw_line((x0, y0 + r * row_height), (x0 + cols * cell_width, y0 + r * row_height))
+    for c in range(cols + 1):
+        page.draw_line((x0 + c * cell_width, y0), (x0 + c * cell_width, y0 + rows * row_height))
+    for r in range(rows):
+        for c in range(cols):
+            page.insert_text((x0 + c * cell_width + 3, y0 + r * row_height + 13), f'{prefix}{r}-{c}', fontsize=8)
+
+
+def make_many_pages_pdf(path: str, pages: int = 200) -> None:
+    """ 纯文本，页数多，表格识别可以全部跳过 """
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        _insert_paragraphs(page, EN_SENTENCE, 60)
+    doc.save(path)
+
+
+def make_table_dense_pdf(path: str, pages: int = 6) -> None:
+    """ 每页三个表格，其中一个嵌套了内层表格 """
+    doc = fitz.open()
+    for n in range(pages):
+        page = doc.new_page()
+        page.insert_text((50, 40), f'Table page {n}. ' + EN_SENTENCE, fontsize=9)
+        _draw_grid(page, 50, 60, 8, 4, 120, 18, 'a')
+        page.insert_text((50, 240), EN_SENTENCE * 2, fontsize=8)
+        _draw_grid(page, 50, 260, 6, 5, 96, 18, 'b')
+        # 外层表格的大单元格中嵌套一个内层表格
+        _draw_grid(page, 50, 420, 2, 2, 240, 140, 'o')
+        _draw_grid(page, 60, 440, 3, 3, 60, 18, 'i')
+    doc.save(path)
+
+
+def make_image_heavy_pdf(path: str, pages: int = 30, images_per_page: int = 6) -> None:
+    """ 每页多张图片，图片之间有少量文本 """
+    doc = fitz.open()
+    xrefs = []
+    for n in range(pages):
+        page = doc.new_page()
+        page.insert_text((50, 40), f'Image page {n}. ' + EN_SENTENCE, fontsize=9)
+        for i in range(images_per_page):
+            rect = fitz.Rect(50 + (i % 2) * 250, 60 + (i // 2) * 240, 290 + (i % 2) * 250, 280 + (i // 2) * 240)
+            if len(xrefs) < images_per_page:
+                # 每张图片内容不同，避免被压缩成很小的数据
+                pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 400, 300), False)
+                pix.set_rect(pix.irect, (40 * i % 256, 90, 160))
+                pix.set_rect(fitz.IRect(0, 0, 200, 150), (200, 40 * i % 256, 30))
+                xrefs.append(page.insert_image(rect, stream=pix.tobytes('png')))
+            else:
+                page.insert_image(rect, xref=xrefs[i])
+            page.insert_text((rect.x0, rect.y1 + 12), f'Figure {n}-{i}', fontsize=8)
+    doc.save(path)
+
+
+def make_cjk_pdf(path: str, pages: int = 50) -> None:
+    """ 中文文本 """
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        _insert_paragraphs(page, CJK_SENTENCE, 60, fontname='china-s')
+    doc.save(path)
+
+
+SYNTHETIC_PDFS: Dict[str, Callable[[str], None]] = {
+    'many_pages': make_many_pages_pdf,
+    'table_dense': make_table_dense_pdf,
+    'image_heavy': make_image_heavy_pdf,
+    'cjk': make_cjk_pdf,
+}
+
+
+def ensure_synthetic_pdfs(out_dir: str, rebuild: bool = False) -> Dict[str, str]:
+    """
+    生成合成pdf，已存在时直接复用
+    :param out_dir:
+    :param rebuild: 是否重新生成
+    :return: 名称到路径的映射
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    paths = dict()
+    for name, make in SYNTHETIC_PDFS.items():
+        path = os.path.join(out_dir, f'{name}.pdf')
+        if rebuild or not os.path.isfile(path):
+            make(path)
+        paths[name] = path
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成性能测试用的合成pdf')
+    parser.add_argument('--out_dir', type=str, default='/tmp/pdf_bench', help='输出目录')
+    args = parser.parse_args()
+    for name, path in ensure_synthetic_pdfs(args.out_dir, rebuild=True).items():
+        with fitz.open(path) as doc:
+            print(f'{name:<12} {doc.page_count:>4} pages {os.path.getsize(path) / 1024:>10.1f} KB  {path}')
+
+
+if __name__ == '__main__':
+    main()
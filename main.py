@@ -1,29 +1,115 @@
 
+import sys
 import argparse
-import time
 from loguru import logger
-from utils import parse_pdf, save_pdf_data
+from utils import iter_pdf_pages
+from utils.utils_pymupdf_parse import ImageMode, TableStrategy
+from utils.utils_batch import collect_pdf_files, run_batch
+from utils.utils_stats import ParseStats
+from utils.utils_pdf import iter_pdf_chunks
+from utils.utils_writer import OutputFormat, Compression, save_pages, save_chunks, output_suffix, \
+    ZSTD_AVAILABLE
+from utils.env import IMAGE_MODE, TABLE_STRATEGY, SERVER_HOST, SERVER_PORT, SERVER_WORKERS, SERVER_QUEUE_SIZE, \
+    SERVER_MAX_BODY_SIZE, ASYNC_TIMEOUT
 
 
 def parse_args():
     parser = argparse.ArgumentParser(description='PDF解析工具')
-    parser.add_argument('--pdf_path', type=str, required=True, help='输入PDF文件路径')
-    parser.add_argument('--out_path', type=str, default='test.txt', help='输出文件路径')
-    return parser.parse_args()
+    parser.add_argument('--pdf_path', type=str, default=None, help='输入PDF文件路径')
+    parser.add_argument('--out_path', type=str, default=None, help='输出文件路径，默认为test加输出格式对应的后缀')
+    parser.add_argument('--format', type=str, default=OutputFormat.txt.value, choices=[f.value for f in OutputFormat],
+                        help='输出格式，txt：文本；jsonl：每个元素一行，含坐标、类型、页码；markdown：Markdown；'
+                             'chunks：parse_pdf_chunk的切割结果，每个文档一行')
+    parser.add_argument('--compress', type=str, default=Compression.none.value, choices=[c.value for c in Compression],
+                        help='输出压缩方式，zstd需要安装zstandard')
+    parser.add_argument('--workers', type=int, default=1, help='并行解析的进程数，批量模式下为同时处理的文件数')
+    # 批量模式
+    parser.add_argument('--input_dir', type=str, default=None, help='批量模式：递归处理目录下的PDF文件')
+    parser.add_argument('--glob', type=str, default=None, help='批量模式：按glob模式查找PDF文件，如"data/**/*.pdf"')
+    parser.add_argument('--file_list', type=str, default=None, help='批量模式：文件列表，每行一个PDF路径')
+    parser.add_argument('--out_dir', type=str, default='output', help='批量模式：输出目录')
+    parser.add_argument('--manifest', type=str, default=None, help='批量模式：清单路径，默认为out_dir下的manifest.jsonl')
+    parser.add_argument('--timeout', type=int, default=None, help='批量模式：单个文件的超时时间（秒）')
+    parser.add_argument('--max_tasks_per_child', type=int, default=None, help='批量模式：工作进程处理多少个文件后重启')
+    parser.add_argument('--image_mode', type=str, default=IMAGE_MODE, choices=[m.value for m in ImageMode],
+                        help='图片处理方式，skip：不输出图片；reference：只输出图片引用；inline：输出图片内容')
+    parser.add_argument('--table_strategy', type=str, default=TABLE_STRATEGY, choices=[s.value for s in TableStrategy],
+                        help='表格识别策略，always：每页都识别；auto：页内没有表格线条时跳过；never：不识别')
+    parser.add_argument('--pages', type=str, default=None, help='要解析的页码，从1开始，如1-20,45，默认解析全部页；批量模式下对每个文件生效')
+    parser.add_argument('--stats_path', type=str, default=None, help='保存各阶段耗时、每页耗时等统计结果的JSON文件路径')
+    parser.add_argument('--trace_memory', action='store_true', help='用tracemalloc统计每页的内存分配峰值，解析会变慢')
+    args = parser.parse_args()
+    if not any([args.pdf_path, args.input_dir, args.glob, args.file_list]):
+        parser.error('需要指定--pdf_path，或批量模式的--input_dir、--glob、--file_list之一')
+    if args.pdf_path and any([args.input_dir, args.glob, args.file_list]):
+        parser.error('--pdf_path不能与批量模式的参数同时使用')
+    if args.compress == Compression.zstd and not ZSTD_AVAILABLE:
+        parser.error('--compress zstd需要安装zstandard：pip install zstandard')
+    if args.out_path is None:
+        args.out_path = 'test' + output_suffix(args.format, args.compress)
+    return args
 
 
-def process_pdf(pdf_path, out_path):
-    start_time = time.time()
+def parse_serve_args(argv):
+    parser = argparse.ArgumentParser(prog='main.py serve', description='本机HTTP解析服务')
+    parser.add_argument('--host', type=str, default=SERVER_HOST, help='监听地址，服务没有鉴权，默认只监听本机')
+    parser.add_argument('--port', type=int, default=SERVER_PORT, help='监听端口')
+    parser.add_argument('--workers', type=int, default=SERVER_WORKERS, help='常驻的工作进程数，即同时解析的文档数')
+    parser.add_argument('--queue_size', type=int, default=SERVER_QUEUE_SIZE, help='排队请求数上限，超出时返回503')
+    parser.add_argument('--timeout', type=float, default=ASYNC_TIMEOUT, help='单个文档的默认超时时间（秒），0为不限制')
+    parser.add_argument('--max_body_size', type=int, default=SERVER_MAX_BODY_SIZE, help='请求体（pdf）大小上限（字节）')
+    return parser.parse_args(argv)
 
-    all_pdf_pages = parse_pdf(pdf_path)
-    page_lst = all_pdf_pages.pdf_pages
-    end_time = time.time()
-    logger.info(f'页数：{len(page_lst)}， 解析耗时：{round(end_time - start_time, 2)}s')
 
-    save_pdf_data(page_lst, out_path)
+def process_pdf(pdf_path, out_path, workers=1, image_mode=IMAGE_MODE, table_strategy=TABLE_STRATEGY, pages=None,
+                stats_path=None, trace_memory=False, output_format=OutputFormat.txt, compression=Compression.none):
+    stats = ParseStats(trace_memory=trace_memory)
+    stats.start()
+
+    # 边解析边写入
+    if output_format == OutputFormat.chunks:
+        docs = iter_pdf_chunks(pdf_path, pages=pages, workers=workers, image_mode=image_mode,
+                               table_strategy=table_strategy, stats=stats)
+        save_chunks(docs, out_path, compression=compression, stats=stats)
+    else:
+        page_iter = iter_pdf_pages(pdf_path, workers=workers, image_mode=image_mode, table_strategy=table_strategy,
+                                   pages=pages, stats=stats)
+        save_pages(page_iter, out_path, output_format=output_format, compression=compression, stats=stats)
+    stats.stop()
+    logger.info(stats.summary_line())
     logger.info(f'输出文件：{out_path}')
+    if stats_path:
+        stats.save(stats_path)
+        logger.info(f'统计结果：{stats_path}')
+
+
+def process_batch(args):
+    files = collect_pdf_files(input_dir=args.input_dir, pattern=args.glob, file_list=args.file_list)
+    run_batch(files,
+              out_dir=args.out_dir,
+              manifest_path=args.manifest,
+              workers=args.workers,
+              timeout=args.timeout,
+              image_mode=args.image_mode,
+              table_strategy=args.table_strategy,
+              max_tasks_per_child=args.max_tasks_per_child,
+              output_format=args.format,
+              compression=args.compress,
+              pages=args.pages)
 
 
 if __name__ == '__main__':
+    if sys.argv[1:2] == ['serve']:
+        from utils.utils_server import serve
+
+        serve_args = parse_serve_args(sys.argv[2:])
+        serve(host=serve_args.host, port=serve_args.port, workers=serve_args.workers,
+              queue_size=serve_args.queue_size, timeout=serve_args.timeout or None,
+              max_body_size=serve_args.max_body_size)
+        sys.exit(0)
     args = parse_args()
-    process_pdf(args.pdf_path, args.out_path)
+    if args.pdf_path:
+        process_pdf(args.pdf_path, args.out_path, args.workers, args.image_mode, args.table_strategy,
+                    args.pages, args.stats_path, args.trace_memory, args.format, args.compress)
+    else:
+        process_batch(args)
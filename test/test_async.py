@@ -0,0 +1,78 @@
+"""
+异步接口的超时、提前退出：超时立即抛出，并发名额在后台任务结束后释放
+
+python -m pytest test/test_async.py
+"""
+
+import os
+import time
+import asyncio
+from contextlib import aclosing
+
+import pytest
+
+from benchmark.synthetic_pdfs import make_image_heavy_pdf
+from utils.utils_async import AsyncPdfParser
+
+DEMO_PDF = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'demo.pdf')
+
+
+@pytest.fixture(scope='module')
+def long_pdf(tmp_path_factory) -> str:
+    # 页数多于一批（DOC_SUM_NUM），切割结果要等整批页解析完才产出，一批页的解析耗时在1秒以上
+    path = str(tmp_path_factory.mktemp('pdf') / 'image_heavy.pdf')
+    make_image_heavy_pdf(path, pages=150)
+    return path
+
+
+async def _wait_released(parser: AsyncPdfParser, timeout: float = 10) -> None:
+    deadline = time.perf_counter() + timeout
+    while parser.running or parser.waiting:
+        assert time.perf_counter() < deadline, '并发名额没有释放'
+        await asyncio.sleep(0.02)
+
+
+@pytest.mark.parametrize('executor_type', ['thread', 'process'])
+def test_stream_timeout_raises_promptly(executor_type, long_pdf):
+    async def _main():
+        parser = AsyncPdfParser(max_concurrency=1, executor_type=executor_type)
+        try:
+            if executor_type == 'process':
+                await asyncio.to_thread(parser.warm_up)
+            start = time.perf_counter()
+            with pytest.raises(TimeoutError):
+                async for _ in parser.iter_pdf_chunks(long_pdf, timeout=0.05):
+                    pass
+            # 不等待后台正在解析的一批页
+            assert time.perf_counter() - start < 0.5
+            await _wait_released(parser)
+            # 名额释放后可以继续解析
+            pages = [page async for page in parser.iter_pdf_pages(DEMO_PDF)]
+            assert len(pages) == 18
+        finally:
+            await asyncio.to_thread(parser.shutdown)
+
+    asyncio.run(_main())
+
+
+def test_stream_break_releases_slot(long_pdf):
+    async def _main():
+        parser = AsyncPdfParser(max_concurrency=1, executor_type='thread', stream_queue_size=1)
+        try:
+            # 未被引用的生成器在break后立即关闭
+            async for _ in parser.iter_pdf_pages(DEMO_PDF):
+                break
+            await _wait_released(parser)
+
+            # 保留了引用的生成器需要用aclosing关闭，关闭时不等待后台正在解析的一批页
+            start = time.perf_counter()
+            async with aclosing(parser.iter_pdf_chunks(long_pdf)) as docs:
+                async for _ in docs:
+                    break
+            assert time.perf_counter() - start < 5
+            await _wait_released(parser)
+            assert await parser.parse_pdf_chunk(DEMO_PDF)
+        finally:
+            await asyncio.to_thread(parser.shutdown)
+
+    asyncio.run(_main())
@@ -0,0 +1,86 @@
+"""
+批量处理：主进程终止卡住的工作进程、中断后续跑、进程池损坏后的重试
+
+python -m pytest test/test_batch.py
+"""
+
+import os
+import json
+import time
+import shutil
+
+import pytest
+
+import utils.utils_batch as utils_batch
+from utils.utils_batch import run_batch, process_file
+
+DEMO_PDF = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'demo.pdf')
+
+
+def _fake_process_file(pdf_path: str, out_path: str, *args) -> dict:
+    # 在工作进程中执行：hang模拟卡在C代码中（time_limit无法中断），crash模拟工作进程崩溃
+    name = os.path.basename(pdf_path)
+    if name.startswith('hang'):
+        time.sleep(60)
+    elif name.startswith('crash'):
+        os._exit(1)
+    return process_file(pdf_path, out_path, *args)
+
+
+@pytest.fixture
+def fake_process_file(monkeypatch):
+    monkeypatch.setattr(utils_batch, 'process_file', _fake_process_file)
+    monkeypatch.setattr(utils_batch, 'KILL_GRACE_SECONDS', 0.5)
+
+
+def make_files(directory, names) -> list:
+    files = []
+    for name in names:
+        path = str(directory / f'{name}.pdf')
+        shutil.copy(DEMO_PDF, path)
+        files.append(path)
+    return files
+
+
+def read_manifest(path) -> dict:
+    with open(path, encoding='utf-8') as f:
+        return {os.path.basename(record['path']): record for record in map(json.loads, f)}
+
+
+def test_timeout_kills_worker(tmp_path, fake_process_file):
+    files = make_files(tmp_path, ['a', 'hang', 'b'])
+    out_dir = tmp_path / 'out'
+    start = time.time()
+    summary = run_batch(files, out_dir=str(out_dir), workers=2, timeout=2, pages='1-2')
+    assert time.time() - start < 30
+    assert summary['ok'] == 2 and summary['failed'] == 1
+
+    records = read_manifest(out_dir / 'manifest.jsonl')
+    assert records['hang.pdf']['status'] == 'timeout'
+    assert records['a.pdf']['status'] == records['b.pdf']['status'] == 'ok'
+    assert not any(name.endswith('.part') for name in os.listdir(out_dir))
+
+
+def test_resume_skips_done(tmp_path):
+    files = make_files(tmp_path, ['a', 'b'])
+    out_dir = tmp_path / 'out'
+    assert run_batch(files[:1], out_dir=str(out_dir), pages='1')['ok'] == 1
+    # 中断时可能留下不完整的一行
+    with open(out_dir / 'manifest.jsonl', 'a', encoding='utf-8') as f:
+        f.write('{"path": "')
+
+    summary = run_batch(files, out_dir=str(out_dir), pages='1')
+    assert summary['skipped'] == 1 and summary['ok'] == 1
+    assert os.path.isfile(out_dir / 'a.txt') and os.path.isfile(out_dir / 'b.txt')
+
+
+def test_broken_pool_retry(tmp_path, fake_process_file):
+    files = make_files(tmp_path, ['a', 'crash', 'b', 'c'])
+    out_dir = tmp_path / 'out'
+    summary = run_batch(files, out_dir=str(out_dir), workers=2, pages='1')
+    assert summary['ok'] == 3 and summary['failed'] == 1
+
+    records = read_manifest(out_dir / 'manifest.jsonl')
+    assert records['crash.pdf']['status'] == 'error'
+    assert 'BrokenProcessPool' in records['crash.pdf']['error']
+    assert all(records[name]['status'] == 'ok' for name in ('a.pdf', 'b.pdf', 'c.pdf'))
@@ -0,0 +1,77 @@
+"""
+解析缓存：按meta中记录的大小累计总大小并淘汰、删除过期的临时目录、读取过程中条目被淘汰时继续解析
+
+python -m pytest test/test_cache.py
+"""
+
+import os
+import time
+import shutil
+
+from utils.utils_cache import ParseCache, TMP_MAX_AGE
+from utils.utils_pymupdf_parse import iter_page_records
+import utils.utils_pymupdf_parse as pymupdf_parse
+
+DEMO_PDF = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'demo.pdf')
+
+
+def write_entry(cache: ParseCache, key: str, page_count: int = 2, page_size: int = 1000) -> None:
+    writer = cache.writer(key)
+    for _ in range(page_count):
+        writer.add(b'x' * page_size)
+    writer.commit()
+
+
+def test_evict_by_recorded_size(tmp_path, monkeypatch):
+    cache = ParseCache(str(tmp_path), max_size=7000)
+    write_entry(cache, 'first')
+    assert cache.meta('first')['size'] > 2000
+
+    # 总大小未超过上限时不再遍历缓存目录
+    evict_calls = []
+    evict = cache.evict
+    monkeypatch.setattr(cache, 'evict', lambda: evict_calls.append(1) or evict())
+    write_entry(cache, 'second')
+    assert not evict_calls
+
+    # 超过上限时从最久未使用的条目开始淘汰
+    os.utime(os.path.join(cache.entry_dir('second'), 'meta.json'), (time.time() - 10, time.time() - 10))
+    list(cache.iter_pages('first'))
+    for key in ('third', 'fourth'):
+        write_entry(cache, key)
+    assert evict_calls
+    assert not cache.has('second')
+    assert all(cache.has(key) for key in ('first', 'third', 'fourth'))
+
+
+def test_evict_removes_stale_tmp_dirs(tmp_path):
+    cache = ParseCache(str(tmp_path))
+    stale = cache.writer('stale')
+    stale.add(b'x')
+    old_time = time.time() - TMP_MAX_AGE - 60
+    os.utime(stale.tmp_dir, (old_time, old_time))
+    # 正在写入的临时目录不删除
+    active = cache.writer('active')
+    active.add(b'x')
+
+    cache.evict()
+    assert not os.path.exists(stale.tmp_dir)
+    assert os.path.exists(active.tmp_dir)
+    active.commit()
+    assert cache.has('active')
+
+
+def test_evicted_while_reading_falls_back_to_parse(tmp_path, monkeypatch):
+    cache = ParseCache(str(tmp_path / 'cache'))
+    monkeypatch.setattr(pymupdf_parse, 'get_parse_cache', lambda: cache)
+    expected = [page.to_model() for page in iter_page_records(DEMO_PDF, use_cache=False, pages='2-6')]
+    list(iter_page_records(DEMO_PDF))
+
+    pages = []
+    for page in iter_page_records(DEMO_PDF, pages='2-6'):
+        if not pages:
+            # 读取第一页后整个缓存目录被淘汰
+            for name in os.listdir(cache.cache_dir):
+                shutil.rmtree(os.path.join(cache.cache_dir, name))
+        pages.append(page.to_model())
+    assert [page.model_dump() for page in pages] == [page.model_dump() for page in expected]
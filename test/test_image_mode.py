@@ -0,0 +1,60 @@
+"""
+图片处理方式：reference与inline的结果一致，通过load_image读取的图片与inline输出的图片内容相同；skip不输出图片
+
+python -m pytest test/test_image_mode.py
+"""
+
+import os
+
+import pytest
+
+from benchmark.synthetic_pdfs import make_image_heavy_pdf
+from utils.utils_pymupdf_parse import parse_pdf, load_image, ImageRef, ElementType
+from utils.utils_pdf import iter_pdf_chunks
+
+DEMO_PDF = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'demo.pdf')
+
+
+@pytest.fixture(scope='module')
+def image_pdf(tmp_path_factory) -> str:
+    path = str(tmp_path_factory.mktemp('pdf') / 'image_heavy.pdf')
+    make_image_heavy_pdf(path, pages=3)
+    return path
+
+
+def dump_docs(docs) -> list:
+    return [(doc.page_content, doc.metadata) for doc in docs]
+
+
+@pytest.mark.parametrize('pdf_name', ['demo', 'image'])
+def test_reference_images_match_inline(pdf_name, image_pdf):
+    path = DEMO_PDF if pdf_name == 'demo' else image_pdf
+    inline = parse_pdf(path, use_cache=False, image_mode='inline').pdf_pages
+    reference = parse_pdf(path, use_cache=False, image_mode='reference').pdf_pages
+
+    image_count = 0
+    assert [len(page.page_elements) for page in reference] == [len(page.page_elements) for page in inline]
+    for inline_page, reference_page in zip(inline, reference):
+        for inline_element, reference_element in zip(inline_page.page_elements, reference_page.page_elements):
+            assert reference_element.element_no == inline_element.element_no
+            assert reference_element.element_type == inline_element.element_type
+            assert reference_element.element_bbox == inline_element.element_bbox
+            if inline_element.element_type == ElementType.image:
+                assert isinstance(reference_element.element_value, ImageRef)
+                assert load_image(path, reference_element.element_value) == inline_element.element_value
+                image_count += 1
+            else:
+                assert reference_element.element_value == inline_element.element_value
+    assert image_count > 0
+
+
+def test_reference_chunks_match_inline(image_pdf):
+    inline = iter_pdf_chunks(image_pdf, image_mode='inline')
+    reference = iter_pdf_chunks(image_pdf, image_mode='reference')
+    assert dump_docs(reference) == dump_docs(inline)
+
+
+def test_skip_has_no_images(image_pdf):
+    pages = parse_pdf(image_pdf, use_cache=False, image_mode='skip').pdf_pages
+    assert pages
+    assert not any(element.element_type == ElementType.image for page in pages for element in page.page_elements)
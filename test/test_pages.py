@@ -0,0 +1,70 @@
+"""
+页码选择：解析页码字符串，只解析选中的页并保留原页码，命中解析缓存时页码选择不需要打开pdf
+
+python -m pytest test/test_pages.py
+"""
+
+import os
+
+import pytest
+
+from utils.utils_pymupdf_parse import parse_pdf, iter_page_records, resolve_pages
+from utils.utils_cache import ParseCache
+import utils.utils_pymupdf_parse as pymupdf_parse
+
+DEMO_PDF = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'demo.pdf')
+
+
+def dump_pages(page_lst) -> list:
+    """ 页列表转换为可直接比较的结构 """
+    return [(page.page_number, page.page_width, page.page_height,
+             [(element.element_no, element.element_type, tuple(element.element_bbox), element.element_value)
+              for element in page.page_elements])
+            for page in page_lst]
+
+
+@pytest.mark.parametrize('pages, expected', [
+    (None, list(range(10))),
+    ('1-3,5', [0, 1, 2, 4]),
+    (' 2 , 2-3 ,', [1, 2]),
+    ('-3', [0, 1, 2]),
+    ('8-', [7, 8, 9]),
+    ('9-20', [8, 9]),
+    (4, [3]),
+    ([5, 1, 5, 30], [0, 4]),
+])
+def test_resolve_pages(pages, expected):
+    assert resolve_pages(pages, 10) == expected
+
+
+@pytest.mark.parametrize('pages', ['5-3', 'a-b', 'x'])
+def test_resolve_pages_invalid(pages):
+    with pytest.raises(ValueError):
+        resolve_pages(pages, 10)
+
+
+def test_parse_selected_pages():
+    all_pages = parse_pdf(DEMO_PDF, use_cache=False).pdf_pages
+    selected = parse_pdf(DEMO_PDF, use_cache=False, pages='2-4,9').pdf_pages
+    assert [page.page_number for page in selected] == [2, 3, 4, 9]
+    assert dump_pages(selected) == dump_pages([all_pages[i] for i in (1, 2, 3, 8)])
+
+
+def test_cache_hits_match_parse(tmp_path, monkeypatch):
+    cache = ParseCache(str(tmp_path / 'cache'))
+    monkeypatch.setattr(pymupdf_parse, 'get_parse_cache', lambda: cache)
+    expected_all = dump_pages(iter_page_records(DEMO_PDF, use_cache=False))
+    expected_pages = dump_pages(iter_page_records(DEMO_PDF, use_cache=False, pages='2-4,9'))
+
+    # 部分页的缓存：第一次写入，第二次命中
+    assert dump_pages(iter_page_records(DEMO_PDF, pages='2-4,9')) == expected_pages
+    assert dump_pages(iter_page_records(DEMO_PDF, pages='2-4,9')) == expected_pages
+    # 整个文档的缓存命中时，页码选择不需要打开pdf
+    assert dump_pages(iter_page_records(DEMO_PDF)) == expected_all
+
+    def _no_open(*args, **kwargs):
+        raise AssertionError('命中缓存时不应打开pdf')
+
+    monkeypatch.setattr(pymupdf_parse, 'open_pdf', _no_open)
+    assert dump_pages(iter_page_records(DEMO_PDF)) == expected_all
+    assert dump_pages(iter_page_records(DEMO_PDF, pages=[9, 2, 3, 4])) == expected_pages
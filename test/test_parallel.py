@@ -0,0 +1,47 @@
+"""
+并行解析与串行解析的结果一致；每页的坐标与解析顺序、进程无关，demo.pdf各元素的坐标固定为test/demo_bboxes.json
+
+python -m pytest test/test_parallel.py
+"""
+
+import os
+import json
+
+import pytest
+
+from utils.utils_pymupdf_parse import parse_pdf
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+DEMO_PDF = os.path.join(TEST_DIR, 'demo.pdf')
+
+
+def dump_pages(page_lst) -> list:
+    """ 页列表转换为可直接比较的结构 """
+    return [(page.page_number, page.page_width, page.page_height,
+             [(element.element_no, element.element_type, tuple(element.element_bbox), element.element_value)
+              for element in page.page_elements])
+            for page in page_lst]
+
+
+@pytest.fixture(scope='module')
+def expected_bboxes() -> dict:
+    with open(os.path.join(TEST_DIR, 'demo_bboxes.json'), encoding='utf-8') as f:
+        return {int(page_number): bboxes for page_number, bboxes in json.load(f).items()}
+
+
+def test_parallel_matches_serial():
+    serial = parse_pdf(DEMO_PDF, use_cache=False)
+    parallel = parse_pdf(DEMO_PDF, workers=2, use_cache=False)
+    assert dump_pages(parallel.pdf_pages) == dump_pages(serial.pdf_pages)
+
+
+@pytest.mark.parametrize('workers, pages', [(1, None), (2, None), (1, '12-18'), (1, [18, 9])])
+def test_demo_bboxes(expected_bboxes, workers, pages):
+    # 表格识别不改变之后各页的文本坐标：单独解析后面的页与从第一页开始解析的结果相同
+    result = parse_pdf(DEMO_PDF, workers=workers, use_cache=False, pages=pages)
+    assert result.pdf_pages
+    for page in result.pdf_pages:
+        expected = expected_bboxes[page.page_number]
+        assert len(page.page_elements) == len(expected)
+        for element, bbox in zip(page.page_elements, expected):
+            assert list(element.element_bbox) == pytest.approx(bbox, abs=1e-3), page.page_number
@@ -0,0 +1,117 @@
+"""
+HTTP解析服务：在系统分配的端口上启动服务，检查/health、/parse、/chunk、参数错误和排队已满时的返回
+
+python -m pytest test/test_server.py
+"""
+
+import os
+import json
+import threading
+import http.client
+
+import pytest
+
+from utils.utils_pdf import parse_pdf_chunk
+from utils.utils_server import ParseService, create_server
+
+DEMO_PDF = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'demo.pdf')
+
+
+@pytest.fixture(scope='module')
+def server():
+    service = ParseService(workers=1, queue_size=1, timeout=60)
+    service.start()
+    server = create_server(service, '127.0.0.1', 0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    service.close()
+
+
+@pytest.fixture(scope='module')
+def demo_data() -> bytes:
+    with open(DEMO_PDF, 'rb') as f:
+        return f.read()
+
+
+def request(server, method: str, path: str, body: bytes = None, headers: dict = None):
+    conn = http.client.HTTPConnection('127.0.0.1', server.server_port, timeout=60)
+    try:
+        if body is None or headers:
+            conn.putrequest(method, path)
+            for name, value in (headers or dict()).items():
+                conn.putheader(name, value)
+            conn.endheaders(body)
+        else:
+            conn.request(method, path, body=body)
+        response = conn.getresponse()
+        return response.status, response.read().decode('utf-8')
+    finally:
+        conn.close()
+
+
+def read_ndjson(text: str) -> list:
+    return [json.loads(line) for line in text.splitlines() if line]
+
+
+def test_health(server):
+    status, body = request(server, 'GET', '/health')
+    assert status == 200
+    assert json.loads(body)['status'] == 'ok'
+
+
+def test_parse(server, demo_data):
+    status, body = request(server, 'POST', '/parse?pages=1-3', demo_data)
+    assert status == 200
+    lines = read_ndjson(body)
+    assert lines and all('error' not in line for line in lines)
+
+
+def test_chunk(server, demo_data):
+    status, body = request(server, 'POST', '/chunk?image_mode=inline&table_strategy=always', demo_data)
+    assert status == 200
+    expected = [{'page_content': doc.page_content, 'metadata': doc.metadata} for doc in parse_pdf_chunk(DEMO_PDF)]
+    assert read_ndjson(body) == expected
+
+
+@pytest.mark.parametrize('path, body, headers', [
+    ('/parse', b'not a pdf', None),
+    ('/parse?image_mode=unknown', None, None),
+    ('/chunk?workers=0', None, None),
+    ('/chunk?ud_chunk_size=abc', None, None),
+    ('/parse', b'%PDF', {'Content-Length': 'abc'}),
+])
+def test_bad_request(server, demo_data, path, body, headers):
+    before = json.loads(request(server, 'GET', '/metrics')[1])
+    status, text = request(server, 'POST', path, demo_data if body is None else body, headers)
+    assert status == 400
+    assert 'error' in json.loads(text)
+    after = json.loads(request(server, 'GET', '/metrics')[1])
+    assert after['failed'] == before['failed'] + 1
+    assert after['requests'] == before['requests'] + 1
+
+
+def test_queue_full(server, demo_data):
+    # 占满名额（workers=1，queue_size=1）后请求返回503；服务不读取请求体，只发送请求头
+    acquired = 0
+    while server.service.try_acquire():
+        acquired += 1
+    try:
+        status, body = request(server, 'POST', '/parse', headers={'Content-Length': str(len(demo_data))})
+    finally:
+        for _ in range(acquired):
+            server.service.release()
+    assert status == 503
+    status, body = request(server, 'POST', '/parse?pages=1', demo_data)
+    assert status == 200
+
+
+def test_metrics_count_pages(server, demo_data):
+    before = json.loads(request(server, 'GET', '/metrics')[1])
+    assert request(server, 'POST', '/parse?pages=1-3', demo_data)[0] == 200
+    assert request(server, 'POST', '/chunk?pages=1-3', demo_data)[0] == 200
+    after = json.loads(request(server, 'GET', '/metrics')[1])
+    assert after['pages'] == before['pages'] + 6
+    assert after['documents'] == before['documents'] + 2
@@ -0,0 +1,51 @@
+"""
+pdf切割：解析一次按多个切割长度切割与逐个长度切割的结果一致，逐页、逐批流式输出与一次性输出的结果一致
+
+python -m pytest test/test_split_pdf.py
+"""
+
+import os
+
+import pytest
+
+from benchmark.synthetic_pdfs import make_table_dense_pdf
+from utils.utils_pymupdf_parse import parse_pdf, iter_page_records, iter_pdf_pages
+from utils.utils_pdf import split_pdf_page_lst, split_pdf_page_lst_multi, parse_pdf_chunk, iter_pdf_chunks
+
+DEMO_PDF = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'demo.pdf')
+
+
+@pytest.fixture(scope='module')
+def table_pdf(tmp_path_factory) -> str:
+    path = str(tmp_path_factory.mktemp('pdf') / 'table_dense.pdf')
+    make_table_dense_pdf(path, pages=1)
+    return path
+
+
+def dump_docs(docs) -> list:
+    return [(doc.page_content, doc.metadata) for doc in docs]
+
+
+@pytest.mark.parametrize('pdf_name', ['demo', 'table'])
+def test_split_multi_matches_single(pdf_name, table_pdf):
+    path = DEMO_PDF if pdf_name == 'demo' else table_pdf
+    page_lst = list(iter_page_records(path, use_cache=False))
+    chunk_size_lst, chunk_overlap_lst = [200, 800], [40, 160]
+
+    expected = []
+    for chunk_size, chunk_overlap in zip(chunk_size_lst, chunk_overlap_lst):
+        for doc in split_pdf_page_lst(page_lst, chunk_size=chunk_size, chunk_overlap=chunk_overlap, sum_num=5):
+            expected.append((doc.page_content, dict(doc.metadata, chunk_size=chunk_size)))
+    docs = split_pdf_page_lst_multi(page_lst, chunk_size_lst, chunk_overlap_lst, sum_num=5)
+    assert dump_docs(docs) == expected
+
+
+def test_iter_pdf_pages_matches_parse_pdf():
+    expected = parse_pdf(DEMO_PDF, use_cache=False).pdf_pages
+    pages = list(iter_pdf_pages(DEMO_PDF, use_cache=False))
+    assert [page.model_dump() for page in pages] == [page.model_dump() for page in expected]
+
+
+def test_iter_pdf_chunks_matches_parse_pdf_chunk():
+    # demo.pdf的页数小于一批的页数，流式输出的顺序与parse_pdf_chunk一致
+    assert dump_docs(iter_pdf_chunks(DEMO_PDF)) == dump_docs(parse_pdf_chunk(DEMO_PDF))
@@ -0,0 +1,117 @@
+"""
+文本切割：切割结果与重构前的实现一致，test/split_baseline.json为首个提交中的实现在test/demo.pdf上的结果（块数、sha256）
+
+python -m pytest test/test_split_text.py
+"""
+
+import os
+import re
+import json
+import hashlib
+
+import pytest
+
+from utils.utils_pymupdf_parse import parse_pdf, ElementType
+from utils.utils_split_text import RecursiveCharacterTextSplitter, _split_text_with_regex
+from utils.utils_pdf import split_pdf_page_lst
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+DEMO_PDF = os.path.join(TEST_DIR, 'demo.pdf')
+
+SPLIT_CONFIGS = {
+    'chunk_50': dict(chunk_size=50, chunk_overlap=10),
+    'chunk_200': dict(chunk_size=200, chunk_overlap=40),
+    'chunk_800': dict(chunk_size=800, chunk_overlap=160),
+    'no_keep_separator': dict(chunk_size=200, chunk_overlap=40, keep_separator=False),
+    'regex_separators': dict(chunk_size=200, chunk_overlap=40, separators=[r'\n+', r'[。；]'], is_separator_regex=True),
+    'no_strip': dict(chunk_size=200, chunk_overlap=40, strip_whitespace=False),
+}
+PAGE_SPLIT_CONFIGS = {
+    'pages_200': dict(chunk_size=200, chunk_overlap=40),
+    'pages_800': dict(chunk_size=800, chunk_overlap=160),
+}
+
+
+@pytest.fixture(scope='module')
+def baseline() -> dict:
+    with open(os.path.join(TEST_DIR, 'split_baseline.json'), encoding='utf-8') as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope='module')
+def demo_pages() -> list:
+    return parse_pdf(DEMO_PDF, use_cache=False).pdf_pages
+
+
+@pytest.fixture(scope='module')
+def demo_text(demo_pages) -> str:
+    return '\n\n'.join('\n'.join(element.element_value for element in page.page_elements
+                                 if element.element_type == ElementType.text)
+                       for page in demo_pages)
+
+
+def digest(items: list) -> dict:
+    return {'count': len(items),
+            'sha256': hashlib.sha256(json.dumps(items, ensure_ascii=False).encode('utf-8')).hexdigest()}
+
+
+@pytest.mark.parametrize('name', list(SPLIT_CONFIGS))
+def test_split_text_matches_baseline(name, baseline, demo_text):
+    chunks = RecursiveCharacterTextSplitter(**SPLIT_CONFIGS[name]).split_text(demo_text)
+    assert digest(chunks) == baseline[name]
+
+
+@pytest.mark.parametrize('name', list(PAGE_SPLIT_CONFIGS))
+def test_split_pdf_page_lst_matches_baseline(name, baseline, demo_pages):
+    page_lst = [page.model_copy(update={'page_elements': [element for element in page.page_elements
+                                                          if element.element_type != ElementType.image]})
+                for page in demo_pages]
+    docs = split_pdf_page_lst(page_lst, sum_num=5, **PAGE_SPLIT_CONFIGS[name])
+    assert digest([[doc.page_content, doc.metadata['page_number']] for doc in docs]) == baseline[name]
+
+
+@pytest.mark.parametrize('chunk_size, chunk_overlap', [(5, 0), (20, 5), (50, 20)])
+def test_merge_splits_respects_chunk_size(chunk_size, chunk_overlap):
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    splits = [format(i, 'x') for i in range(200)]
+    docs = splitter._merge_splits(splits, ' ')
+    # 每个片段都不超过chunk_size时，合并结果也不超过chunk_size，且按顺序覆盖全部片段
+    assert all(len(doc) <= chunk_size for doc in docs)
+    assert docs[0].startswith(splits[0]) and docs[-1].endswith(splits[-1])
+    covered = [split for doc in docs for split in doc.split(' ')]
+    assert list(dict.fromkeys(covered)) == list(dict.fromkeys(splits))
+
+
+@pytest.mark.parametrize('keep_separator', [True, False])
+@pytest.mark.parametrize('separator, is_separator_regex', [
+    ('\n\n', False), ('。', False), ('?', False), (r'\n+', True), (r'[。！？]', True), ('', False),
+])
+def test_split_with_separator_matches_regex(separator, is_separator_regex, keep_separator):
+    # 普通分隔符用str.split、正则分隔符预编译，结果与逐次re.split的_split_text_with_regex一致
+    splitter = RecursiveCharacterTextSplitter(keep_separator=keep_separator, is_separator_regex=is_separator_regex)
+    regex = separator if is_separator_regex else re.escape(separator)
+    texts = ['', '。', '?a?', '第一句。第二句！\n\n第三句？\n\n\n尾', 'no separator here', '\n\n。??。\n\n']
+    for text in texts:
+        assert splitter._split_text_with_separator(text, separator) == \
+               _split_text_with_regex(text, regex, keep_separator), text
+
+
+@pytest.mark.parametrize('name', list(SPLIT_CONFIGS))
+def test_start_index_points_at_chunk(name, demo_text):
+    splitter = RecursiveCharacterTextSplitter(add_start_index=True, **SPLIT_CONFIGS[name])
+    docs = splitter.create_documents([demo_text])
+    assert [doc.page_content for doc in docs] == splitter.split_text(demo_text)
+    for doc in docs:
+        start = doc.metadata['start_index']
+        assert demo_text[start:start + len(doc.page_content)] == doc.page_content
+
+
+def test_start_index_with_repeated_text():
+    # 重叠窗口内有相同文本时，text.find会找到更靠前的位置
+    text = '。'.join(['重复的句子'] * 30 + ['结尾'])
+    splitter = RecursiveCharacterTextSplitter(chunk_size=20, chunk_overlap=10, add_start_index=True)
+    docs = splitter.create_documents([text])
+    starts = [doc.metadata['start_index'] for doc in docs]
+    assert starts == sorted(set(starts))
+    for doc, start in zip(docs, starts):
+        assert text[start:start + len(doc.page_content)] == doc.page_content
@@ -0,0 +1,62 @@
+"""
+解析统计：各阶段耗时、数量，多进程解析时合并，命中缓存的页计入页数
+
+python -m pytest test/test_stats.py
+"""
+
+import os
+import pickle
+import tracemalloc
+
+from utils.utils_pymupdf_parse import parse_pdf, iter_page_records
+from utils.utils_pdf import parse_pdf_chunk
+from utils.utils_cache import ParseCache
+from utils.utils_stats import ParseStats
+import utils.utils_pymupdf_parse as pymupdf_parse
+
+DEMO_PDF = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'demo.pdf')
+
+
+def test_parse_stats():
+    stats = ParseStats()
+    result = parse_pdf(DEMO_PDF, use_cache=False, stats=stats)
+    summary = stats.summary()
+    assert summary['pages'] == len(result.pdf_pages) == 18
+    assert summary['total_seconds'] > 0
+    assert sum(stage['count'] for stage in summary['stages'].values()) > 0
+    assert stats.counts['elements'] == sum(len(page.page_elements) for page in result.pdf_pages)
+    assert sorted(page['page_number'] for page in stats.report()['page_details']) == list(range(1, 19))
+    assert summary['memory']['tracemalloc_peak_mb'] is None
+
+
+def test_parallel_stats_merged():
+    serial, parallel = ParseStats(), ParseStats()
+    parse_pdf(DEMO_PDF, use_cache=False, stats=serial)
+    parse_pdf(DEMO_PDF, workers=2, use_cache=False, stats=parallel)
+    assert parallel.page_count == serial.page_count
+    for name in ('blocks', 'elements', 'tables', 'table_skipped'):
+        assert parallel.counts[name] == serial.counts[name], name
+    # 在工作进程中统计后随结果传回
+    restored = pickle.loads(pickle.dumps(parallel))
+    assert restored.counts == parallel.counts and dict(restored.stages) == dict(parallel.stages)
+
+
+def test_cache_pages_counted(tmp_path, monkeypatch):
+    cache = ParseCache(str(tmp_path / 'cache'))
+    monkeypatch.setattr(pymupdf_parse, 'get_parse_cache', lambda: cache)
+    list(iter_page_records(DEMO_PDF))
+    stats = ParseStats()
+    list(iter_page_records(DEMO_PDF, pages='1-5', stats=stats))
+    assert stats.counts['cache_pages'] == stats.page_count == 5
+
+
+def test_chunk_stats_and_trace_memory():
+    stats = ParseStats(trace_memory=True)
+    try:
+        docs = parse_pdf_chunk(DEMO_PDF, stats=stats)
+    finally:
+        tracemalloc.stop()
+    summary = stats.summary()
+    assert summary['counts']['chunks'] == len(docs)
+    assert summary['memory']['tracemalloc_peak_mb'] > 0
+    assert '文档数' in stats.summary_line()
@@ -0,0 +1,48 @@
+"""
+表格识别策略：auto（页内没有可构成表格的线条时跳过find_tables）与always的结果一致，跳过的页数记录在ParseStats中
+
+python -m pytest test/test_table_strategy.py
+"""
+
+import os
+
+import pytest
+
+from benchmark.synthetic_pdfs import make_table_dense_pdf
+from utils.utils_pymupdf_parse import parse_pdf, ElementType
+from utils.utils_stats import ParseStats
+
+DEMO_PDF = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'demo.pdf')
+
+
+@pytest.fixture(scope='module')
+def table_pdf(tmp_path_factory) -> str:
+    path = str(tmp_path_factory.mktemp('pdf') / 'table_dense.pdf')
+    make_table_dense_pdf(path, pages=1)
+    return path
+
+
+def dump_pages(page_lst) -> list:
+    return [(page.page_number, page.page_width, page.page_height,
+             [(element.element_no, element.element_type, tuple(element.element_bbox), element.element_value)
+              for element in page.page_elements])
+            for page in page_lst]
+
+
+@pytest.mark.parametrize('pdf_name', ['demo', 'table'])
+def test_auto_table_strategy_matches_always(pdf_name, table_pdf):
+    path = DEMO_PDF if pdf_name == 'demo' else table_pdf
+    always = parse_pdf(path, use_cache=False, table_strategy='always')
+    auto = parse_pdf(path, use_cache=False, table_strategy='auto')
+    assert dump_pages(auto.pdf_pages) == dump_pages(always.pdf_pages)
+    if pdf_name == 'table':
+        assert any(element.element_type == ElementType.table
+                   for page in auto.pdf_pages for element in page.page_elements)
+
+
+def test_table_skipped_in_stats():
+    auto_stats, always_stats = ParseStats(), ParseStats()
+    parse_pdf(DEMO_PDF, use_cache=False, table_strategy='auto', stats=auto_stats)
+    parse_pdf(DEMO_PDF, use_cache=False, table_strategy='always', stats=always_stats)
+    assert 0 < auto_stats.counts['table_skipped'] <= auto_stats.page_count
+    assert always_stats.counts['table_skipped'] == 0
@@ -0,0 +1,94 @@
+"""
+流式输出：txt与save_pdf_data一致，jsonl、markdown、切割结果的内容，gzip、zstd压缩
+
+python -m pytest test/test_writer.py
+"""
+
+import os
+import gzip
+import json
+import base64
+
+import pytest
+
+from utils.utils_pymupdf_parse import parse_pdf, iter_pdf_pages, save_pdf_data, ImageRef, ElementType
+from utils.utils_pdf import parse_pdf_chunk, iter_pdf_chunks
+from utils.utils_writer import save_pages, save_chunks, output_suffix
+
+DEMO_PDF = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'demo.pdf')
+
+
+@pytest.fixture(scope='module')
+def demo_pages() -> list:
+    return parse_pdf(DEMO_PDF, use_cache=False, image_mode='inline').pdf_pages
+
+
+def read_text(path) -> str:
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+def test_txt_matches_save_pdf_data(tmp_path, demo_pages):
+    save_pdf_data(demo_pages, str(tmp_path / 'expected.txt'))
+    assert save_pages(iter_pdf_pages(DEMO_PDF, use_cache=False, image_mode='inline'), tmp_path / 'out.txt') == 18
+    assert read_text(tmp_path / 'out.txt') == read_text(tmp_path / 'expected.txt')
+
+
+@pytest.mark.parametrize('image_mode', ['inline', 'reference'])
+def test_jsonl(tmp_path, demo_pages, image_mode):
+    path = tmp_path / 'out.jsonl'
+    save_pages(iter_pdf_pages(DEMO_PDF, use_cache=False, image_mode=image_mode), path, output_format='jsonl')
+    with open(path, encoding='utf-8') as f:
+        records = [json.loads(line) for line in f]
+
+    elements = [(page, element) for page in demo_pages for element in page.page_elements]
+    assert len(records) == len(elements)
+    for record, (page, element) in zip(records, elements):
+        assert record['page_number'] == page.page_number
+        assert record['element_type'] == element.element_type.value
+        assert record['element_bbox'] == pytest.approx(list(element.element_bbox))
+        if element.element_type != ElementType.image:
+            assert record['element_value'] == element.element_value
+        elif image_mode == 'inline':
+            assert base64.b64decode(record['element_value']) == element.element_value
+        else:
+            assert ImageRef(**record['element_value']).page_number == page.page_number
+
+
+def test_markdown(tmp_path, demo_pages):
+    path = tmp_path / 'out.md'
+    save_pages(demo_pages, path, output_format='markdown')
+    text = read_text(path)
+    assert [f'<!-- page_number: {i} -->' in text for i in range(1, 19)] == [True] * 18
+    table_count = sum(element.element_type == ElementType.table for page in demo_pages for element in page.page_elements)
+    assert text.count('\n| ') >= table_count
+
+
+def test_save_pages_rejects_chunks_format(tmp_path, demo_pages):
+    with pytest.raises(ValueError):
+        save_pages(demo_pages, tmp_path / 'out.jsonl', output_format='chunks')
+
+
+def test_chunks(tmp_path):
+    path = tmp_path / 'out.chunks.jsonl'
+    assert save_chunks(iter_pdf_chunks(DEMO_PDF), path) > 0
+    with open(path, encoding='utf-8') as f:
+        records = [json.loads(line) for line in f]
+    assert records == [{'page_content': doc.page_content, 'metadata': doc.metadata} for doc in parse_pdf_chunk(DEMO_PDF)]
+
+
+@pytest.mark.parametrize('compression', ['gzip', 'zstd'])
+def test_compression(tmp_path, demo_pages, compression):
+    if compression == 'zstd':
+        zstandard = pytest.importorskip('zstandard')
+    save_pages(demo_pages, tmp_path / 'plain.jsonl', output_format='jsonl')
+    # 按后缀判断压缩方式
+    path = tmp_path / f'out{output_suffix("jsonl", compression)}'
+    save_pages(demo_pages, path, output_format='jsonl')
+    with open(path, 'rb') as f:
+        data = f.read()
+    if compression == 'gzip':
+        data = gzip.decompress(data)
+    else:
+        data = zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    assert data.decode('utf-8') == read_text(tmp_path / 'plain.jsonl')
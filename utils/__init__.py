@@ -1,3 +1,3 @@
 
-from utils.utils_pdf import parse_pdf
-from utils.utils_pymupdf_parse import save_pdf_data
\ No newline at end of file
+from utils.utils_pdf import parse_pdf, iter_pdf_pages
+from utils.utils_pymupdf_parse import save_pdf_data
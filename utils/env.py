@@ -20,5 +20,16 @@ CHUNK_SIZE_LIST = get_env("CHUNK_SIZE_LIST", "200,400,800", arg_formatter=lambda
 CHUNK_OVERLAP_LIST = get_env("CHUNK_OVERLAP_LIST", "40,80,160", arg_formatter=lambda x: [int(i) for i in x.split(',')])
 TABLE_FORMAT = get_env("TABLE_FORMAT", "markdown")
 DOC_SUM_NUM = get_env("DOC_SUM_NUM", 100, arg_formatter=int)
-
-
+REPEAT_OVERLAP_TABLE = get_env("REPEAT_OVERLAP_TABLE", "false", arg_formatter=lambda x: str(x).lower() in ('1', 'true'))
+PARSE_CACHE_DIR = get_env("PARSE_CACHE_DIR", "")
+PARSE_CACHE_MAX_SIZE = get_env("PARSE_CACHE_MAX_SIZE", 1024 * 1024 * 1024, arg_formatter=int)
+IMAGE_MODE = get_env("IMAGE_MODE", "inline")
+TABLE_STRATEGY = get_env("TABLE_STRATEGY", "auto")
+ASYNC_MAX_CONCURRENCY = get_env("ASYNC_MAX_CONCURRENCY", 4, arg_formatter=int)
+ASYNC_EXECUTOR = get_env("ASYNC_EXECUTOR", "process")
+ASYNC_TIMEOUT = get_env("ASYNC_TIMEOUT", 0, arg_formatter=float)
+SERVER_HOST = get_env("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = get_env("SERVER_PORT", 8000, arg_formatter=int)
+SERVER_WORKERS = get_env("SERVER_WORKERS", 2, arg_formatter=int)
+SERVER_QUEUE_SIZE = get_env("SERVER_QUEUE_SIZE", 16, arg_formatter=int)
+SERVER_MAX_BODY_SIZE = get_env("SERVER_MAX_BODY_SIZE", 200 * 1024 * 1024, arg_formatter=int)
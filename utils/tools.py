@@ -1,15 +1,26 @@
 
 import math
-import copy
+from itertools import islice
+from typing import Iterable, Iterator, List
 
 
 def split_datas(datas, batch=500):
-    # 将数据切割
+    # 将数据切割，只做切片，不拷贝数据本身
     batch_num = math.ceil(len(datas) / batch)
     action_list = []
     for num in range(batch_num):
         # 将数据每 batch 条切割
-        data_model = copy.deepcopy(datas[num * batch: (num + 1) * batch])
+        data_model = datas[num * batch: (num + 1) * batch]
         action_list.append(data_model)
 
     return action_list
+
+
+def iter_split_datas(datas: Iterable, batch=500) -> Iterator[List]:
+    # 惰性切割数据，datas可以是生成器，同一时间只保留一批数据
+    datas = iter(datas)
+    while True:
+        data_model = list(islice(datas, batch))
+        if not data_model:
+            break
+        yield data_model
@@ -0,0 +1,378 @@
+
+import os
+import queue
+import asyncio
+import threading
+import multiprocessing
+from enum import Enum
+from pathlib import Path
+from functools import partial
+from contextlib import asynccontextmanager
+from weakref import WeakKeyDictionary
+from typing import Optional, Callable, AsyncIterator, Iterator, Union, List
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+from utils.utils_pymupdf_parse import parse_pdf, iter_pdf_pages, load_pdf_source, PdfSource, AllPdfPage, PdfPage
+from utils.utils_pdf import parse_pdf_chunk, iter_pdf_chunks
+from utils.utils_split_text import Document
+from utils.utils_batch import time_limit
+from utils.env import ASYNC_MAX_CONCURRENCY, ASYNC_EXECUTOR, ASYNC_TIMEOUT
+
+
+class ExecutorType(str, Enum):
+    process = 'process'
+    thread = 'thread'
+
+
+def _call_with_time_limit(func: Callable, timeout: Optional[float], args: tuple, kwargs: dict):
+    # 在进程池的工作进程中执行，超时后中断解析，工作进程可以继续处理后续任务；
+    # stats在工作进程中是副本，随结果一起返回
+    with time_limit(timeout):
+        result = func(*args, **kwargs)
+    return result, kwargs.get('stats')
+
+
+def _stream_worker(iter_func: Callable[..., Iterator], path: Union[str, Path, bytes], kwargs: dict,
+                   item_queue, stop, timeout: Optional[float] = None) -> None:
+    """
+    在执行器中逐个产出结果放入item_queue，消息为(类型, 内容)：item为结果，done为结束（内容为stats），error为异常；
+    item_queue有长度上限，消费慢时暂停解析，stop被设置后在产出下一项（一页或一批切割结果）时退出
+    :param iter_func: iter_pdf_pages、iter_pdf_chunks
+    :param path:
+    :param kwargs: iter_func的其他参数
+    :param item_queue: queue.Queue，进程池中为Manager().Queue()
+    :param stop: threading.Event，进程池中为Manager().Event()
+    :param timeout: 超时时间（秒），见time_limit，只能在工作进程的主线程中使用
+    :return:
+    """
+    def _put(message) -> bool:
+        while not stop.is_set():
+            try:
+                item_queue.put(message, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        with time_limit(timeout):
+            item_iter = iter_func(path, **kwargs)
+            try:
+                for item in item_iter:
+                    if not _put(('item', item)):
+                        return
+            finally:
+                # 关闭生成器，释放已打开的文档
+                item_iter.close()
+        _put(('done', kwargs.get('stats')))
+    except Exception as e:
+        _put(('error', e))
+
+
+def _get_message(item_queue, future: Future) -> tuple:
+    # 在线程中等待_stream_worker的消息，任务异常结束（如工作进程崩溃）时转换为error消息
+    while True:
+        try:
+            return item_queue.get(timeout=0.1)
+        except queue.Empty:
+            if not future.done():
+                continue
+            try:
+                return item_queue.get_nowait()
+            except queue.Empty:
+                error = None if future.cancelled() else future.exception()
+                return 'error', error or RuntimeError('解析任务异常结束')
+
+
+def _warm_up_worker() -> int:
+    # 工作进程启动时已导入解析模块，这里只需占用工作进程，使每个进程都被创建
+    return os.getpid()
+
+
+class AsyncPdfParser:
+    """
+    parse_pdf、parse_pdf_chunk的异步接口，解析在执行器中进行，不阻塞事件循环；
+    同时解析的文档数不超过max_concurrency，超出的请求排队等待，排队时间不计入超时
+    """
+
+    def __init__(self, max_concurrency: int = ASYNC_MAX_CONCURRENCY,
+                 executor: Optional[Executor] = None,
+                 executor_type: Union[str, ExecutorType] = ASYNC_EXECUTOR,
+                 timeout: Optional[float] = ASYNC_TIMEOUT or None,
+                 stream_queue_size: int = 8):
+        """
+        :param max_concurrency: 同时解析的文档数
+        :param executor: 执行器，为None时按executor_type创建；传入进程池时超时需要工作进程在主线程中执行任务
+        :param executor_type: process：进程池，解析不占用事件循环所在进程的GIL，超时后工作进程中的解析也会中断；
+            thread：线程池，同一进程中的页解析是串行的，超时后后台线程仍会解析完当前文档
+        :param timeout: 单个文档的默认超时时间（秒），为None时不限制
+        :param stream_queue_size: 流式接口中已解析、未被消费的页或文档数上限，消费慢时暂停解析
+        """
+        self.max_concurrency = max_concurrency
+        self.executor_type = ExecutorType(executor_type)
+        self.timeout = timeout
+        self.stream_queue_size = stream_queue_size
+        self._executor = executor
+        self._own_executor = executor is None
+        self._stream_executor: Optional[ThreadPoolExecutor] = None
+        self._manager = None
+        self._lock = threading.Lock()
+        # 正在解析、排队等待的文档数
+        self.running = 0
+        self.waiting = 0
+        # asyncio.Semaphore只能在一个事件循环中使用，每个事件循环各自限制并发
+        self._semaphores = WeakKeyDictionary()
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    async def _acquire_slot(self) -> asyncio.Semaphore:
+        # 占用一个并发名额，同时统计排队、解析中的文档数
+        semaphore = self._get_semaphore()
+        self.waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        return semaphore
+
+    def _release_slot(self, semaphore: asyncio.Semaphore) -> None:
+        self.running -= 1
+        semaphore.release()
+
+    def _release_slot_when_done(self, semaphore: asyncio.Semaphore, future: Future) -> None:
+        # 任务已结束时立即释放名额，否则在任务结束时（执行器的线程中）回到事件循环释放
+        if future.done():
+            self._release_slot(semaphore)
+            return
+        loop = asyncio.get_running_loop()
+
+        def _callback(_):
+            try:
+                loop.call_soon_threadsafe(self._release_slot, semaphore)
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+
+        future.add_done_callback(_callback)
+
+    @asynccontextmanager
+    async def _slot(self):
+        semaphore = await self._acquire_slot()
+        try:
+            yield
+        finally:
+            self._release_slot(semaphore)
+
+    def _get_executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                if self.executor_type == ExecutorType.process:
+                    # 事件循环所在进程通常有多个线程，用spawn启动工作进程，避免fork继承线程持有的锁
+                    self._executor = ProcessPoolExecutor(max_workers=self.max_concurrency,
+                                                         mp_context=multiprocessing.get_context('spawn'))
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                                        thread_name_prefix='pdf_parse')
+            return self._executor
+
+    def _get_stream_executor(self) -> ThreadPoolExecutor:
+        # 等待流式结果的线程
+        with self._lock:
+            if self._stream_executor is None:
+                self._stream_executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                                           thread_name_prefix='pdf_stream')
+            return self._stream_executor
+
+    def _get_manager(self):
+        # 进程池中的流式任务通过Manager的队列返回结果
+        with self._lock:
+            if self._manager is None:
+                self._manager = multiprocessing.get_context('spawn').Manager()
+            return self._manager
+
+    def _get_timeout(self, timeout: Optional[float]) -> Optional[float]:
+        # 为None时使用默认超时，为0时不限制
+        if timeout is None:
+            return self.timeout
+        return timeout or None
+
+    @staticmethod
+    async def _load_source(path: PdfSource) -> Union[str, Path, bytes]:
+        # 文件对象、mmap等不能传给工作进程，先在线程中读出内容
+        if isinstance(path, (str, Path, bytes)):
+            return path
+        return await asyncio.to_thread(load_pdf_source, path)
+
+    async def _run(self, func: Callable, path: PdfSource, timeout: Optional[float], **kwargs):
+        timeout = self._get_timeout(timeout)
+        path = await self._load_source(path)
+        async with self._slot():
+            loop = asyncio.get_running_loop()
+            executor = self._get_executor()
+            if isinstance(executor, ProcessPoolExecutor):
+                stats = kwargs.get('stats')
+                future = loop.run_in_executor(executor, _call_with_time_limit, func, timeout, (path,), kwargs)
+                # 等待中被取消时，未开始的任务会从进程池中移除，已开始的任务在工作进程中超时后停止
+                result, worker_stats = await asyncio.wait_for(future, timeout)
+                if stats is not None and worker_stats is not None:
+                    stats.merge(worker_stats)
+                return result
+            future = loop.run_in_executor(executor, partial(func, path, **kwargs))
+            return await asyncio.wait_for(future, timeout)
+
+    async def _stream(self, iter_func: Callable[..., Iterator], path: PdfSource, timeout: Optional[float],
+                      **kwargs) -> AsyncIterator:
+        timeout = self._get_timeout(timeout)
+        path = await self._load_source(path)
+        semaphore = await self._acquire_slot()
+        future = None
+        try:
+            loop = asyncio.get_running_loop()
+            executor = self._get_executor()
+            stats = kwargs.get('stats')
+            if isinstance(executor, ProcessPoolExecutor):
+                manager = await asyncio.to_thread(self._get_manager)
+                item_queue, stop = manager.Queue(self.stream_queue_size), manager.Event()
+                future = executor.submit(_stream_worker, iter_func, path, kwargs, item_queue, stop, timeout)
+            else:
+                item_queue, stop = queue.Queue(self.stream_queue_size), threading.Event()
+                future = executor.submit(_stream_worker, iter_func, path, kwargs, item_queue, stop)
+            deadline = loop.time() + timeout if timeout else None
+            while True:
+                remaining = None if deadline is None else max(deadline - loop.time(), 0)
+                kind, value = await asyncio.wait_for(
+                    loop.run_in_executor(self._get_stream_executor(), _get_message, item_queue, future), remaining)
+                if kind == 'item':
+                    yield value
+                elif kind == 'done':
+                    if stats is not None and value is not None and value is not stats:
+                        stats.merge(value)
+                    break
+                else:
+                    raise value
+        finally:
+            # 超时、取消或提前退出时通知任务停止，异常立即抛出，不等待任务结束；
+            # 任务在产出下一项（一页或一批切割结果）时退出，进程池中超时后立即中断，退出后才释放并发名额
+            if future is None:
+                self._release_slot(semaphore)
+            else:
+                stop.set()
+                future.cancel()
+                self._release_slot_when_done(semaphore, future)
+
+    async def parse_pdf(self, path: PdfSource, timeout: Optional[float] = None, **kwargs) -> AllPdfPage:
+        """
+        异步解析pdf，参数见parse_pdf
+        :param path: pdf路径、pdf内容或以二进制模式打开的文件对象
+        :param timeout: 超时时间（秒），为None时使用默认超时，为0时不限制；超时抛出TimeoutError
+        :param kwargs: parse_pdf的其他参数
+        :return:
+        """
+        return await self._run(parse_pdf, path, timeout, **kwargs)
+
+    async def parse_pdf_chunk(self, path: PdfSource, timeout: Optional[float] = None, **kwargs) -> List[Document]:
+        """
+        异步解析、切割pdf，参数见parse_pdf_chunk
+        :param path: pdf路径、pdf内容或以二进制模式打开的文件对象
+        :param timeout: 超时时间（秒），为None时使用默认超时，为0时不限制；超时抛出TimeoutError
+        :param kwargs: parse_pdf_chunk的其他参数
+        :return:
+        """
+        return await self._run(parse_pdf_chunk, path, timeout, **kwargs)
+
+    def iter_pdf_pages(self, path: PdfSource, timeout: Optional[float] = None, **kwargs) -> AsyncIterator[PdfPage]:
+        """
+        逐页异步返回解析结果，参数见iter_pdf_pages；消费慢时解析暂停，提前退出后解析在当前页结束时停止；
+        保留了引用的生成器在break后用contextlib.aclosing关闭，否则并发名额要到生成器被回收时才释放
+        :param path: pdf路径、pdf内容或以二进制模式打开的文件对象
+        :param timeout: 整个文档的超时时间（秒），为None时使用默认超时，为0时不限制；超时抛出TimeoutError
+        :param kwargs: iter_pdf_pages的其他参数
+        :return:
+        """
+        return self._stream(iter_pdf_pages, path, timeout, **kwargs)
+
+    def iter_pdf_chunks(self, path: PdfSource, timeout: Optional[float] = None, **kwargs) -> AsyncIterator[Document]:
+        """
+        异步返回切割结果，每批页切割完即返回，参数见iter_pdf_chunks；超时或提前退出时立即返回，
+        后台解析在当前一批页处理完时停止，之后才释放并发名额
+        :param path: pdf路径、pdf内容或以二进制模式打开的文件对象
+        :param timeout: 整个文档的超时时间（秒），为None时使用默认超时，为0时不限制；超时抛出TimeoutError
+        :param kwargs: iter_pdf_chunks的其他参数
+        :return:
+        """
+        return self._stream(iter_pdf_chunks, path, timeout, **kwargs)
+
+    def warm_up(self) -> None:
+        """
+        提前创建执行器；进程池时启动全部工作进程，避免第一批请求等待进程启动、导入模块
+        :return:
+        """
+        executor = self._get_executor()
+        if isinstance(executor, ProcessPoolExecutor):
+            futures = [executor.submit(_warm_up_worker) for _ in range(self.max_concurrency)]
+            for future in futures:
+                future.result()
+            self._get_manager()
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        关闭执行器，外部传入的执行器不关闭
+        :param wait: 是否等待正在执行的任务完成
+        :return:
+        """
+        with self._lock:
+            if self._own_executor and self._executor is not None:
+                self._executor.shutdown(wait=wait, cancel_futures=True)
+                self._executor = None
+            if self._stream_executor is not None:
+                self._stream_executor.shutdown(wait=wait, cancel_futures=True)
+                self._stream_executor = None
+            if self._manager is not None:
+                self._manager.shutdown()
+                self._manager = None
+
+    async def __aenter__(self) -> 'AsyncPdfParser':
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await asyncio.to_thread(self.shutdown)
+
+
+_async_parser: Optional[AsyncPdfParser] = None
+
+
+def get_async_parser() -> AsyncPdfParser:
+    """
+    获取由环境变量ASYNC_MAX_CONCURRENCY、ASYNC_EXECUTOR、ASYNC_TIMEOUT配置的默认异步解析器
+    :return:
+    """
+    global _async_parser
+    if _async_parser is None:
+        _async_parser = AsyncPdfParser()
+    return _async_parser
+
+
+async def aparse_pdf(path: PdfSource, timeout: Optional[float] = None, **kwargs) -> AllPdfPage:
+    """ 使用默认异步解析器解析pdf，见AsyncPdfParser.parse_pdf """
+    return await get_async_parser().parse_pdf(path, timeout=timeout, **kwargs)
+
+
+async def aparse_pdf_chunk(path: PdfSource, timeout: Optional[float] = None, **kwargs) -> List[Document]:
+    """ 使用默认异步解析器解析、切割pdf，见AsyncPdfParser.parse_pdf_chunk """
+    return await get_async_parser().parse_pdf_chunk(path, timeout=timeout, **kwargs)
+
+
+def aiter_pdf_pages(path: PdfSource, timeout: Optional[float] = None, **kwargs) -> AsyncIterator[PdfPage]:
+    """ 使用默认异步解析器逐页返回解析结果，见AsyncPdfParser.iter_pdf_pages """
+    return get_async_parser().iter_pdf_pages(path, timeout=timeout, **kwargs)
+
+
+def aiter_pdf_chunks(path: PdfSource, timeout: Optional[float] = None, **kwargs) -> AsyncIterator[Document]:
+    """ 使用默认异步解析器返回切割结果，见AsyncPdfParser.iter_pdf_chunks """
+    return get_async_parser().iter_pdf_chunks(path, timeout=timeout, **kwargs)
@@ -0,0 +1,345 @@
+
+import os
+import json
+import glob
+import time
+import signal
+from pathlib import Path
+from contextlib import contextmanager
+from collections import deque
+from typing import List, Optional, Union, Dict, Set, Iterable
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from loguru import logger
+
+from utils.utils_pymupdf_parse import iter_pdf_pages, ImageMode, TableStrategy
+from utils.utils_pdf import iter_pdf_chunks
+from utils.utils_stats import ParseStats
+from utils.utils_writer import OutputFormat, Compression, save_pages, save_chunks, output_suffix, infer_compression
+from utils.env import IMAGE_MODE, TABLE_STRATEGY
+
+# 工作进程内的time_limit无法中断C代码，超过timeout后再等待这么久（秒）仍未返回时，由主进程终止进程池
+KILL_GRACE_SECONDS = 5
+
+
+def collect_pdf_files(input_dir: Optional[str] = None,
+                      pattern: Optional[str] = None,
+                      file_list: Optional[str] = None) -> List[str]:
+    """
+    收集待处理的pdf文件，结果为去重后的绝对路径，保持输入顺序
+
+    :param input_dir: 目录，递归查找其中的pdf文件
+    :param pattern: glob模式，如"data/**/*.pdf"
+    :param file_list: 文件列表，每行一个pdf路径
+    :return:
+    """
+    files = []
+    if input_dir:
+        files.extend(sorted(str(p) for p in Path(input_dir).rglob('*') if p.suffix.lower() == '.pdf' and p.is_file()))
+    if pattern:
+        files.extend(sorted(glob.glob(pattern, recursive=True)))
+    if file_list:
+        with open(file_list, encoding='utf-8') as f:
+            files.extend(line.strip() for line in f if line.strip())
+
+    return list(dict.fromkeys(os.path.abspath(file) for file in files))
+
+
+def get_out_paths(files: List[str], out_dir: Union[str, Path], suffix: str = '.txt') -> Dict[str, str]:
+    """
+    按文件相对于公共目录的路径生成输出路径，避免不同目录下的同名文件互相覆盖
+
+    :param files:
+    :param out_dir:
+    :param suffix:
+    :return:
+    """
+    if not files:
+        return dict()
+    root = os.path.commonpath([os.path.dirname(file) for file in files])
+    return {file: str(Path(out_dir) / Path(os.path.relpath(file, root)).with_suffix(suffix)) for file in files}
+
+
+def load_manifest(manifest_path: Union[str, Path]) -> Set[str]:
+    """
+    读取清单中已成功处理的文件
+    :param manifest_path:
+    :return:
+    """
+    done = set()
+    if not os.path.isfile(manifest_path):
+        return done
+    with open(manifest_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # 上次运行中断时可能留下不完整的一行
+                continue
+            if record.get('status') == 'ok':
+                done.add(record['path'])
+    return done
+
+
+def _raise_timeout(signum, frame):
+    raise TimeoutError('解析超时')
+
+
+@contextmanager
+def time_limit(timeout: Optional[float] = None):
+    """
+    限制代码块的执行时间，超时抛出TimeoutError；通过SIGALRM实现，只能在进程的主线程中使用，
+    PyMuPDF在C代码中执行时要等其返回才能中断；timeout为空或不支持SIGALRM时不限制
+    :param timeout: 超时时间（秒）
+    :return:
+    """
+    use_alarm = bool(timeout) and hasattr(signal, 'SIGALRM')
+    if use_alarm:
+        old_handler = signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        yield
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, old_handler)
+
+
+def process_file(pdf_path: str, out_path: str, timeout: Optional[float] = None,
+                 image_mode: Union[str, ImageMode] = IMAGE_MODE,
+                 table_strategy: Union[str, TableStrategy] = TABLE_STRATEGY,
+                 output_format: Union[str, OutputFormat] = OutputFormat.txt,
+                 compression: Union[str, Compression, None] = None,
+                 pages: Union[str, int, Iterable[int], None] = None) -> dict:
+    """
+    解析单个pdf并保存结果，在进程池的工作进程中执行，异常转换为结果记录返回；
+    结果先写入out_path.part，成功后再重命名为out_path，失败、超时时删除，不留下不完整的输出
+
+    :param pdf_path:
+    :param out_path:
+    :param timeout: 超时时间（秒），见time_limit
+    :param image_mode:
+    :param table_strategy:
+    :param output_format: 输出格式，见OutputFormat
+    :param compression: 输出压缩方式，为None时按out_path的后缀判断
+    :param pages: 要解析的页码，从1开始，如"1-20,45"，为None时解析全部页
+    :return:
+    """
+    start_time = time.time()
+    record = {'path': pdf_path, 'out_path': out_path, 'pages': 0}
+    part_path = out_path + '.part'
+    if compression is None:
+        # 临时文件的后缀不能用于判断压缩方式
+        compression = infer_compression(out_path)
+    try:
+        with time_limit(timeout):
+            os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+            if OutputFormat(output_format) == OutputFormat.chunks:
+                # 边解析边写入，页数由stats统计，没有切出文档的页也计入
+                stats = ParseStats()
+                docs = iter_pdf_chunks(pdf_path, pages=pages, image_mode=image_mode, table_strategy=table_strategy,
+                                       stats=stats)
+                chunk_count = save_chunks(docs, part_path, compression=compression)
+                os.replace(part_path, out_path)
+                record.update(status='ok', pages=stats.page_count, chunks=chunk_count)
+            else:
+                page_iter = iter_pdf_pages(pdf_path, image_mode=image_mode, table_strategy=table_strategy,
+                                           pages=pages)
+                page_count = save_pages(page_iter, part_path, output_format=output_format, compression=compression)
+                os.replace(part_path, out_path)
+                record.update(status='ok', pages=page_count)
+    except TimeoutError as e:
+        record.update(status='timeout', error=str(e))
+    except Exception as e:
+        record.update(status='error', error=f'{type(e).__name__}: {e}')
+    if record['status'] != 'ok' and os.path.exists(part_path):
+        os.remove(part_path)
+    record['seconds'] = round(time.time() - start_time, 3)
+    return record
+
+
+class BatchStats:
+    """ 批量处理的吞吐统计 """
+
+    def __init__(self, total: int, skipped: int = 0):
+        self.total = total
+        self.skipped = skipped
+        self.ok = 0
+        self.failed = 0
+        self.pages = 0
+        self.start_time = time.time()
+
+    def add(self, record: dict) -> None:
+        if record['status'] == 'ok':
+            self.ok += 1
+            self.pages += record['pages']
+        else:
+            self.failed += 1
+
+    @property
+    def done(self) -> int:
+        return self.ok + self.failed
+
+    def summary(self) -> dict:
+        elapsed = max(time.time() - self.start_time, 1e-9)
+        return {
+            'total': self.total,
+            'skipped': self.skipped,
+            'ok': self.ok,
+            'failed': self.failed,
+            'pages': self.pages,
+            'seconds': round(elapsed, 2),
+            'pages_per_second': round(self.pages / elapsed, 2),
+            'files_per_second': round(self.done / elapsed, 2),
+        }
+
+
+def run_batch(files: List[str],
+              out_dir: Union[str, Path] = 'output',
+              manifest_path: Optional[Union[str, Path]] = None,
+              workers: int = 1,
+              timeout: Optional[int] = None,
+              image_mode: Union[str, ImageMode] = IMAGE_MODE,
+              table_strategy: Union[str, TableStrategy] = TABLE_STRATEGY,
+              max_tasks_per_child: Optional[int] = None,
+              log_every: int = 100,
+              output_format: Union[str, OutputFormat] = OutputFormat.txt,
+              compression: Union[str, Compression, None] = None,
+              pages: Union[str, int, Iterable[int], None] = None) -> dict:
+    """
+    批量解析pdf；工作进程在整个批次中复用，每处理完一个文件即追加写入清单，
+    中断后重新运行时跳过清单中已成功的文件
+
+    :param files: 待处理的pdf文件
+    :param out_dir: 输出目录
+    :param manifest_path: 清单路径，默认为out_dir下的manifest.jsonl
+    :param workers: 进程数
+    :param timeout: 单个文件的超时时间（秒），工作进程内超时抛出TimeoutError；PyMuPDF卡在C代码中时，
+        主进程在超时KILL_GRACE_SECONDS秒后终止进程池，记录该文件超时，其他未完成的文件重新提交
+    :param image_mode:
+    :param table_strategy:
+    :param max_tasks_per_child: 工作进程处理多少个文件后重启，用于限制内存增长，为None时不重启
+    :param log_every: 每处理多少个文件输出一次进度
+    :param output_format: 输出格式，见OutputFormat
+    :param compression: 输出压缩方式
+    :param pages: 每个文件要解析的页码，从1开始，如"1-20,45"，为None时解析全部页
+    :return: 吞吐统计
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    if manifest_path is None:
+        manifest_path = os.path.join(out_dir, 'manifest.jsonl')
+    done = load_manifest(manifest_path)
+    out_paths = get_out_paths(files, out_dir, suffix=output_suffix(output_format, compression))
+    pending = [file for file in files if file not in done]
+    stats = BatchStats(total=len(files), skipped=len(files) - len(pending))
+    logger.info(f'待处理文件数：{len(pending)}，已完成跳过：{stats.skipped}')
+
+    # 同时提交的任务数有上限，文件数很多时不一次性创建全部future；
+    # 设置了超时时只提交空闲工作进程数的任务，提交时间即开始时间，主进程据此判断是否超时
+    max_inflight = max(1, workers) if timeout else max(1, workers) * 2
+    queue = iter(pending)
+    # 进程池损坏时无法区分是哪个文件导致的，同批未完成的文件都需要重试
+    retry = deque()
+    # 进程池因其他文件超时被终止时，未完成的文件重新提交，不计入重试次数
+    requeue = deque()
+    attempts = dict()
+    deadlines = dict()
+
+    def _new_executor():
+        return ProcessPoolExecutor(max_workers=max(1, workers), max_tasks_per_child=max_tasks_per_child)
+
+    def _kill_executor(executor):
+        # shutdown不会停止正在执行的任务，需要直接终止工作进程
+        for process in list((executor._processes or dict()).values()):
+            process.kill()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(executor, inflight):
+        while len(inflight) < max_inflight:
+            if retry:
+                # 重试的文件逐个单独执行，避免再次被其他文件导致的崩溃波及
+                if inflight:
+                    break
+                file = retry.popleft()
+            elif requeue:
+                file = requeue.popleft()
+            else:
+                file = next(queue, None)
+                if file is None:
+                    break
+            attempts[file] = attempts.get(file, 0) + 1
+            future = executor.submit(process_file, file, out_paths[file], timeout, image_mode, table_strategy,
+                                     output_format, compression, pages)
+            inflight[future] = file
+            if timeout:
+                deadlines[future] = time.monotonic() + timeout + KILL_GRACE_SECONDS
+            if attempts[file] > 1:
+                break
+
+    def _write(record):
+        manifest.write(json.dumps(record, ensure_ascii=False) + '\n')
+        manifest.flush()
+        stats.add(record)
+        if record['status'] != 'ok':
+            logger.warning(f"处理失败：{record['path']}，{record['status']}，{record.get('error')}")
+        if stats.done % log_every == 0:
+            logger.info(f'进度：{stats.done}/{len(pending)}，{stats.summary()}')
+
+    with open(manifest_path, 'a', encoding='utf-8') as manifest:
+        executor = _new_executor()
+        inflight = dict()
+        try:
+            _submit(executor, inflight)
+            while inflight:
+                wait_timeout = None
+                if deadlines:
+                    wait_timeout = max(min(deadlines[future] for future in inflight) - time.monotonic(), 0)
+                finished, _ = wait(inflight, timeout=wait_timeout, return_when=FIRST_COMPLETED)
+                broken = False
+                for future in finished:
+                    file = inflight.pop(future)
+                    deadlines.pop(future, None)
+                    try:
+                        record = future.result()
+                    except BrokenProcessPool as e:
+                        # 工作进程异常退出（如PyMuPDF崩溃），重试一次仍失败时记录失败
+                        broken = True
+                        if attempts[file] < 2:
+                            retry.append(file)
+                            continue
+                        record = {'path': file, 'out_path': out_paths[file], 'pages': 0,
+                                  'status': 'error', 'error': f'{type(e).__name__}: {e}'}
+                    _write(record)
+
+                now = time.monotonic()
+                expired = [future for future in inflight if future in deadlines and deadlines[future] <= now]
+                if expired:
+                    # 超时的任务无法单独取消，终止整个进程池；超时的文件记录失败，其他文件重新提交
+                    _kill_executor(executor)
+                    for future in expired:
+                        file = inflight.pop(future)
+                        part_path = out_paths[file] + '.part'
+                        if os.path.exists(part_path):
+                            os.remove(part_path)
+                        _write({'path': file, 'out_path': out_paths[file], 'pages': 0, 'status': 'timeout',
+                                'error': f'解析超过{timeout}秒未返回，已终止工作进程', 'seconds': timeout})
+                    for future, file in inflight.items():
+                        attempts[file] -= 1
+                        requeue.append(file)
+                    inflight.clear()
+                    deadlines.clear()
+                    executor = _new_executor()
+                elif broken:
+                    # 进程池损坏后其余未完成的任务也无法返回结果，重建进程池后重新提交
+                    retry.extend(inflight.values())
+                    inflight.clear()
+                    deadlines.clear()
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    executor = _new_executor()
+                _submit(executor, inflight)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    summary = stats.summary()
+    logger.info(f'批量处理完成：{summary}')
+    return summary
@@ -0,0 +1,238 @@
+
+import os
+import json
+import time
+import shutil
+import pickle
+import hashlib
+import tempfile
+import fitz
+from pathlib import Path
+from typing import Union, Optional, Iterator, Iterable, Any
+from loguru import logger
+
+from utils.env import PARSE_CACHE_DIR, PARSE_CACHE_MAX_SIZE
+
+# 缓存格式版本，缓存内容的结构变化时需要修改，使旧缓存失效
+CACHE_FORMAT_VERSION = 4
+META_FILE = 'meta.json'
+TMP_PREFIX = '.tmp_'
+# 超过该时间（秒）的临时目录视为写入进程已退出，淘汰时删除
+TMP_MAX_AGE = 24 * 3600
+# 淘汰时删除到max_size的该比例以下，避免每次写入都触发淘汰
+EVICT_TARGET_RATIO = 0.9
+
+
+def file_sha256(path: Union[str, Path], block_size: int = 1024 * 1024) -> str:
+    """
+    计算文件内容的sha256
+    :param path:
+    :param block_size:
+    :return:
+    """
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(block_size)
+            if not data:
+                break
+            sha.update(data)
+    return sha.hexdigest()
+
+
+def source_sha256(source: Union[str, Path, bytes]) -> str:
+    """
+    计算pdf输入的sha256，路径按文件内容计算，bytes直接计算
+    :param source:
+    :return:
+    """
+    if isinstance(source, bytes):
+        return hashlib.sha256(source).hexdigest()
+    return file_sha256(source)
+
+
+def dir_size(path: Union[str, Path]) -> int:
+    """
+    计算目录下所有文件的大小
+    :param path:
+    :return:
+    """
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return size
+
+
+class ParseCacheWriter:
+    """ 逐页写入一条缓存，commit后才对读取可见 """
+
+    def __init__(self, cache: 'ParseCache', key: str):
+        self.cache = cache
+        self.key = key
+        self.tmp_dir = tempfile.mkdtemp(prefix=TMP_PREFIX, dir=cache.cache_dir)
+        self.page_count = 0
+        self.size = 0
+
+    def add(self, page: Any) -> None:
+        with open(os.path.join(self.tmp_dir, f'page_{self.page_count:06d}.pkl'), 'wb') as f:
+            pickle.dump(page, f, protocol=pickle.HIGHEST_PROTOCOL)
+            self.size += f.tell()
+        self.page_count += 1
+
+    def commit(self) -> None:
+        # 条目大小记录在meta中，淘汰时不需要遍历条目下的文件
+        with open(os.path.join(self.tmp_dir, META_FILE), 'w') as f:
+            json.dump({'page_count': self.page_count, 'created_at': time.time(), 'size': self.size}, f)
+        try:
+            os.rename(self.tmp_dir, self.cache.entry_dir(self.key))
+        except OSError:
+            # 其他进程已写入相同的缓存
+            shutil.rmtree(self.tmp_dir, ignore_errors=True)
+            return
+        self.cache.add_size(self.size)
+
+    def abort(self) -> None:
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+class ParseCache:
+    """
+    pdf解析结果的磁盘缓存，以文件内容hash、PyMuPDF版本和解析参数为key，按页保存解析结果；
+    缓存总大小超过max_size时按最近使用时间淘汰；总大小在本进程中累计，多个进程共用缓存目录时
+    可能短暂超过max_size，每次淘汰时按目录中的实际条目重新统计
+    """
+
+    def __init__(self, cache_dir: Union[str, Path], max_size: int = PARSE_CACHE_MAX_SIZE):
+        self.cache_dir = str(cache_dir)
+        self.max_size = max_size
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # 缓存总大小，第一次写入时统计
+        self._total_size: Optional[int] = None
+
+    def make_key(self, path: Union[str, Path, bytes], options: Optional[dict] = None,
+                 sha256: Optional[str] = None) -> str:
+        """
+        生成缓存key
+        :param path: pdf路径或pdf内容
+        :param options: 影响解析结果的参数
+        :param sha256: 已计算的pdf内容hash，为None时计算
+        :return:
+        """
+        key_info = {
+            'sha256': sha256 or source_sha256(path),
+            'pymupdf': fitz.VersionBind,
+            'format': CACHE_FORMAT_VERSION,
+            'options': options or {},
+        }
+        key_str = json.dumps(key_info, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(key_str.encode('utf-8')).hexdigest()
+
+    def entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def has(self, key: str) -> bool:
+        return os.path.isfile(os.path.join(self.entry_dir(key), META_FILE))
+
+    def meta(self, key: str) -> dict:
+        with open(os.path.join(self.entry_dir(key), META_FILE)) as f:
+            return json.load(f)
+
+    def iter_pages(self, key: str, positions: Optional[Iterable[int]] = None) -> Iterator[Any]:
+        """
+        逐页读取缓存，并刷新该条缓存的使用时间；该条缓存被淘汰时抛出FileNotFoundError
+        :param key:
+        :param positions: 要读取的页在该条缓存中的位置，为None时读取全部页
+        :return:
+        """
+        entry_dir = self.entry_dir(key)
+        meta_path = os.path.join(entry_dir, META_FILE)
+        if positions is None:
+            positions = range(self.meta(key)['page_count'])
+        os.utime(meta_path)
+
+        for i in positions:
+            with open(os.path.join(entry_dir, f'page_{i:06d}.pkl'), 'rb') as f:
+                yield pickle.load(f)
+
+    def writer(self, key: str) -> ParseCacheWriter:
+        return ParseCacheWriter(self, key)
+
+    def add_size(self, size: int) -> None:
+        """
+        累计新写入条目的大小，总大小超过max_size时淘汰
+        :param size:
+        :return:
+        """
+        if self._total_size is None:
+            self.evict()
+        else:
+            self._total_size += size
+            if self._total_size > self.max_size:
+                self.evict()
+
+    def _entry_size(self, name: str) -> int:
+        try:
+            with open(os.path.join(self.cache_dir, name, META_FILE)) as f:
+                return json.load(f)['size']
+        except (OSError, ValueError, KeyError):
+            # 旧版本写入的条目没有记录大小
+            return dir_size(os.path.join(self.cache_dir, name))
+
+    def evict(self) -> None:
+        """
+        删除超过TMP_MAX_AGE的临时目录；缓存总大小超过max_size时，从最久未使用的缓存开始删除，
+        直到总大小不超过max_size * EVICT_TARGET_RATIO
+        :return:
+        """
+        entries = []
+        total = 0
+        now = time.time()
+        for name in os.listdir(self.cache_dir):
+            entry_dir = os.path.join(self.cache_dir, name)
+            if name.startswith(TMP_PREFIX):
+                # 写入进程被强制终止时留下的临时目录
+                try:
+                    if now - os.path.getmtime(entry_dir) > TMP_MAX_AGE:
+                        shutil.rmtree(entry_dir, ignore_errors=True)
+                        logger.debug(f'删除过期的解析缓存临时目录：{name}')
+                except OSError:
+                    pass
+                continue
+            try:
+                used_at = os.path.getmtime(os.path.join(entry_dir, META_FILE))
+            except OSError:
+                continue
+            size = self._entry_size(name)
+            entries.append((used_at, name, size))
+            total += size
+
+        if total > self.max_size:
+            target = self.max_size * EVICT_TARGET_RATIO
+            entries.sort()
+            for _, name, size in entries:
+                if total <= target:
+                    break
+                shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+                total -= size
+                logger.debug(f'淘汰解析缓存：{name}，大小：{size}')
+        self._total_size = total
+
+
+_parse_cache: Optional[ParseCache] = None
+
+
+def get_parse_cache() -> Optional[ParseCache]:
+    """
+    获取由环境变量PARSE_CACHE_DIR配置的缓存，未配置时返回None
+    :return:
+    """
+    global _parse_cache
+    if not PARSE_CACHE_DIR:
+        return None
+    if _parse_cache is None:
+        _parse_cache = ParseCache(PARSE_CACHE_DIR, PARSE_CACHE_MAX_SIZE)
+    return _parse_cache
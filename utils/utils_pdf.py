@@ -1,55 +1,110 @@
 
-from typing import List, Dict, Optional
+import re
+from bisect import bisect_right
+from typing import List, Dict, Optional, Iterable, Iterator, Tuple, Union, Callable
 
 from utils.utils_split_text import simple_split_text_list, Document
-from utils.utils_pymupdf_parse import parse_pdf, PdfPage, ElementType
-from utils.tools import split_datas
-from utils.env import TABLE_FORMAT, CHUNK_SIZE_LIST, CHUNK_OVERLAP_LIST, DOC_SUM_NUM
+from utils.utils_pymupdf_parse import parse_pdf, iter_pdf_pages, iter_page_records, PdfPage, PdfPageRecord, ElementType, ImageMode, \
+    TableStrategy, PdfSource
+from utils.tools import iter_split_datas
+from utils.utils_stats import ParseStats, stats_stage
+from utils.env import TABLE_FORMAT, CHUNK_SIZE_LIST, CHUNK_OVERLAP_LIST, DOC_SUM_NUM, REPEAT_OVERLAP_TABLE, IMAGE_MODE, \
+    TABLE_STRATEGY
 
-from functools import partial
-from collections import defaultdict
 
+def _cell_str(cell) -> str:
+    return str(cell) if cell else ''
 
-def list_to_markdown(datas: List[List[str]]) -> str:
+
+def write_markdown_table(datas: List[List[str]], write: Callable[[str], object]) -> None:
+    """
+    将表格按Markdown格式逐行写入write，如list.append、文件的write
+
+    :param datas:
+    :param write:
+    :return:
+    """
     if not datas:
-        return ''
+        return
     # 获取列名和数据
     headers = datas[0]
-    data = datas[1:]
 
     # 构建Markdown表格字符串
-    markdown_table = "| " + " | ".join(str(head) if head else '' for head in headers) + " |\n"
-    markdown_table += "| " + " | ".join(["---"] * len(headers)) + " |\n"
+    write("| " + " | ".join([_cell_str(head) for head in headers]) + " |\n")
+    write("| " + " | ".join(["---"] * len(headers)) + " |\n")
 
-    for row in data:
-        markdown_table += "| " + " | ".join(str(cell) if cell else '' for cell in row) + " |\n"
+    for row in datas[1:]:
+        write("| " + " | ".join([_cell_str(cell) for cell in row]) + " |\n")
 
-    return markdown_table
 
+def write_html_table(datas: List[List[str]], write: Callable[[str], object]) -> None:
+    """
+    将表格按HTML格式逐行写入write，如list.append、文件的write
 
-def list_to_html(datas: List[List[str]]) -> str:
+    :param datas:
+    :param write:
+    :return:
+    """
     if not datas:
-        return ''
-    # 构建HTML表格字符串
-    html_table = "<table>\n"
+        return
+    write("<table>\n")
 
     # 添加表头
-    html_table += "<tr>"
-    for column in datas[0]:
-        column = column if column else ''
-        html_table += f"<th>{column}</th>"
-    html_table += "</tr>\n"
+    write("<tr>" + "".join([f"<th>{_cell_str(column)}</th>" for column in datas[0]]) + "</tr>\n")
 
     # 添加数据行
     for row in datas[1:]:
-        html_table += "<tr>"
-        for cell in row:
-            cell = cell if cell else ''
-            html_table += f"<td>{cell}</td>"
-        html_table += "</tr>\n"
+        write("<tr>" + "".join([f"<td>{_cell_str(cell)}</td>" for cell in row]) + "</tr>\n")
+
+    write("</table>")
+
+
+def list_to_markdown(datas: List[List[str]]) -> str:
+    buffer = []
+    write_markdown_table(datas, buffer.append)
+    return ''.join(buffer)
+
+
+def list_to_html(datas: List[List[str]]) -> str:
+    buffer = []
+    write_html_table(datas, buffer.append)
+    return ''.join(buffer)
+
+
+def markdown_table_length(datas: List[List[str]]) -> int:
+    """
+    计算list_to_markdown结果的长度，不生成字符串
+    :param datas:
+    :return:
+    """
+    if not datas:
+        return 0
+
+    def _row_length(cell_len_sum, cell_num):
+        # "| " + " | ".join(cells) + " |\n"
+        return 2 + cell_len_sum + 3 * max(cell_num - 1, 0) + 3
+
+    headers = datas[0]
+    length = _row_length(sum(len(_cell_str(head)) for head in headers), len(headers))
+    length += _row_length(3 * len(headers), len(headers))
+    for row in datas[1:]:
+        length += _row_length(sum(len(_cell_str(cell)) for cell in row), len(row))
+    return length
 
-    html_table += "</table>"
-    return html_table
+
+def html_table_length(datas: List[List[str]]) -> int:
+    """
+    计算list_to_html结果的长度，不生成字符串
+    :param datas:
+    :return:
+    """
+    if not datas:
+        return 0
+    # "<table>\n" + "</table>"，每行"<tr>" + "</tr>\n"，每个单元格"<th></th>"或"<td></td>"
+    length = 8 + 8
+    for row in datas:
+        length += 4 + 6 + sum(9 + len(_cell_str(cell)) for cell in row)
+    return length
 
 
 def format_table_lst(table_lst: List[List[str]], format_type=TABLE_FORMAT) -> str:
@@ -69,6 +124,79 @@ def format_table_lst(table_lst: List[List[str]], format_type=TABLE_FORMAT) -> st
     return table_str
 
 
+def format_table_length(table_lst: List[List[str]], format_type=TABLE_FORMAT) -> int:
+    """
+    计算format_table_lst结果的长度，不生成字符串
+
+    :param table_lst:
+    :param format_type:
+    :return:
+    """
+    if format_type == 'markdown':
+        return markdown_table_length(table_lst)
+    elif format_type == 'html':
+        return html_table_length(table_lst)
+    return 0
+
+
+class TableRenderCache:
+    """
+    一批页内的表格渲染缓存，以表格对象和格式为key，多个切割长度、多种格式之间复用渲染结果和长度；
+    缓存中保留表格对象的引用，保证其id在缓存有效期内不会被复用；占位符只在批内回填，
+    缓存随批创建、随批释放，流式切割时内存不随页数增长
+    """
+
+    def __init__(self):
+        self._rendered: Dict[Tuple[int, str], Tuple[list, str]] = dict()
+        self._lengths: Dict[Tuple[int, str], Tuple[list, int]] = dict()
+
+    def render(self, table_lst: List[List[str]], format_type=TABLE_FORMAT) -> str:
+        key = (id(table_lst), format_type)
+        cached = self._rendered.get(key)
+        if cached is None:
+            cached = (table_lst, format_table_lst(table_lst, format_type=format_type))
+            self._rendered[key] = cached
+        return cached[1]
+
+    def length(self, table_lst: List[List[str]], format_type=TABLE_FORMAT) -> int:
+        key = (id(table_lst), format_type)
+        cached = self._lengths.get(key)
+        if cached is None:
+            rendered = self._rendered.get(key)
+            table_len = len(rendered[1]) if rendered is not None else format_table_length(table_lst, format_type)
+            cached = (table_lst, table_len)
+            self._lengths[key] = cached
+        return cached[1]
+
+
+class TableMap:
+    """
+    表格占位符到表格的映射，切割时只用到渲染后的长度，回填时才按需渲染
+    """
+
+    def __init__(self, format_type='markdown', render_cache: Optional[TableRenderCache] = None):
+        self.format_type = format_type
+        self.render_cache = render_cache if render_cache is not None else TableRenderCache()
+        self.tables: Dict[str, List[List[str]]] = dict()
+        self.lengths: Dict[str, int] = dict()
+
+    def add(self, table_id: str, table_lst: List[List[str]]) -> None:
+        self.tables[table_id] = table_lst
+        self.lengths[table_id] = self.render_cache.length(table_lst, self.format_type)
+
+    def get(self, table_id: str, default: Optional[str] = None) -> Optional[str]:
+        table_lst = self.tables.get(table_id)
+        if table_lst is None:
+            return default
+        return self.render_cache.render(table_lst, self.format_type)
+
+    def __contains__(self, table_id: str) -> bool:
+        return table_id in self.tables
+
+    def __len__(self) -> int:
+        return len(self.tables)
+
+
 def length_function(text: str, table_map: Dict[str, str]) -> int:
     """
     检测'@{page_number}_{element_no}@'是否存在，若存在，先替换为table_lst，再计算长度
@@ -84,58 +212,157 @@ def length_function(text: str, table_map: Dict[str, str]) -> int:
     return len(text)
 
 
-def split_pdf_page_lst(page_lst: List[PdfPage],
-                       chunk_size: int = 4000,
-                       chunk_overlap: int = 200,
-                       format_type='markdown',
-                       sum_num: int = 100,
-                       separators: Optional[List[str]] = None,
-                       ) -> List[Document]:
-    table_map: Dict[str, str] = dict()
-    texts = []
-    metadatas = []
-    block_index = defaultdict(list)
-
-    res_lst = split_datas(page_lst, sum_num)
-    for i, res in enumerate(res_lst):
-        res_texts = []
-        for one_page in res:
-            page_number = one_page.page_number
-            page_elements = one_page.page_elements
-            page_text_lst = []
-            for one_element in page_elements:
-                element_type = one_element.element_type
-                if element_type == ElementType.text:
-                    text = one_element.element_value
-                    page_text_lst.append(text)
-
-                elif element_type == ElementType.table:
-                    element_no = one_element.element_no
-                    table_id = f'@page_{page_number}_element_{element_no}_table@'
-
-                    table_map[table_id] = format_table_lst(one_element.element_value, format_type=format_type)
-                    page_text_lst.append(table_id)
-
-                elif element_type == ElementType.image:
-                    element_no = one_element.element_no
-                    table_id = f'@page_{page_number}_element_{element_no}_image@'
-
-                    table_map[table_id] = one_element.element_value
-                    page_text_lst.append(table_id)
-            res_texts.append(''.join(page_text_lst))
-            block_index[i].append({
-                'page_number': page_number,
-                'start_index': len(''.join(res_texts[:-1])),
-                'end_index': len(''.join(res_texts))
-            })
-        texts.append(''.join(res_texts))
-        metadatas.append({
-            'block_number': i
-        })
-
-    length_function_new = partial(length_function, table_map=table_map)
-
-    split_docs = simple_split_text_list(texts, metadatas,
+# 表格、图片占位符
+PLACEHOLDER_PATTERN = re.compile(r'@page_\d+_element_\d+_(?:table|image)@')
+
+
+class PlaceholderLength:
+    """
+    length_function的快速实现：用一个正则找出文本中的占位符，加上预先计算的替换后长度差，
+    不生成替换后的字符串，结果与length_function一致
+    """
+
+    def __init__(self, table_map: Union[Dict[str, str], TableMap]):
+        if isinstance(table_map, TableMap):
+            table_lengths = table_map.lengths
+        else:
+            table_lengths = {table_id: len(table_str) for table_id, table_str in table_map.items()}
+        self.extra_map = {table_id: table_len - len(table_id) for table_id, table_len in table_lengths.items()}
+
+    def __call__(self, text: str) -> int:
+        length = len(text)
+        if '@' not in text:
+            return length
+        for table_id in PLACEHOLDER_PATTERN.findall(text):
+            length += self.extra_map.get(table_id, 0)
+        return length
+
+
+def render_placeholders(text: str, table_map: Union[Dict[str, str], TableMap],
+                        rendered_ids: Optional[set] = None) -> str:
+    """
+    用一次正则替换将文本中的表格占位符替换为表格内容
+
+    :param text:
+    :param table_map: 占位符到表格内容的映射，不在其中的占位符（如图片）保持原样
+    :param rendered_ids: 已在之前的文档中渲染过的占位符，这些占位符保持原样，本次渲染的占位符会加入其中；
+                         为None时每次都渲染
+    :return:
+    """
+    if '@' not in text:
+        return text
+
+    chunk_ids = set()
+
+    def _replace(match):
+        table_id = match.group(0)
+        table_str = table_map.get(table_id)
+        if table_str is None or (rendered_ids is not None and table_id in rendered_ids):
+            return table_id
+        chunk_ids.add(table_id)
+        return table_str
+
+    text = PLACEHOLDER_PATTERN.sub(_replace, text)
+    if rendered_ids is not None:
+        rendered_ids.update(chunk_ids)
+    return text
+
+
+class PageIndex:
+    """ 一批页拼接后的文本中，每页的起始位置，用二分查找定位文本位置所在的页 """
+
+    def __init__(self):
+        self.page_numbers: List[int] = []
+        self.start_lst: List[int] = []
+        self.end_lst: List[int] = []
+
+    def add(self, page_number: int, start_index: int, end_index: int) -> None:
+        self.page_numbers.append(page_number)
+        self.start_lst.append(start_index)
+        self.end_lst.append(end_index)
+
+    def locate(self, index: int) -> Optional[Tuple[int, int]]:
+        """
+        定位文本位置所在的页，空页不包含任何位置
+        :param index: 在拼接后文本中的位置
+        :return: 页码、在该页中的位置，不在任何页中时返回None
+        """
+        k = bisect_right(self.start_lst, index) - 1
+        if k < 0 or index >= self.end_lst[k]:
+            return None
+        return self.page_numbers[k], index - self.start_lst[k]
+
+
+def build_batch_text(page_lst: List[Union[PdfPage, PdfPageRecord]], format_type='markdown',
+                     render_cache: Optional[TableRenderCache] = None) -> Tuple[str, TableMap, PageIndex]:
+    """
+    将一批页拼接为一段文本，表格、图片以占位符代替
+
+    :param page_lst:
+    :param format_type:
+    :param render_cache: 批内的表格渲染缓存，为None时新建
+    :return: 拼接后的文本、表格占位符到表格内容的映射、每页在文本中的起止位置
+    """
+    table_map = TableMap(format_type=format_type, render_cache=render_cache)
+    block_index = PageIndex()
+    res_texts = []
+    text_len = 0
+    for one_page in page_lst:
+        page_number = one_page.page_number
+        page_elements = one_page.page_elements
+        page_text_lst = []
+        for one_element in page_elements:
+            element_type = one_element.element_type
+            if element_type == ElementType.text:
+                text = one_element.element_value
+                page_text_lst.append(text)
+
+            elif element_type == ElementType.table:
+                element_no = one_element.element_no
+                table_id = f'@page_{page_number}_element_{element_no}_table@'
+
+                table_map.add(table_id, one_element.element_value)
+                page_text_lst.append(table_id)
+
+            elif element_type == ElementType.image:
+                element_no = one_element.element_no
+                table_id = f'@page_{page_number}_element_{element_no}_image@'
+
+                # 图片在切割结果中保留占位符
+                page_text_lst.append(table_id)
+        page_text = ''.join(page_text_lst)
+        res_texts.append(page_text)
+        block_index.add(page_number, text_len, text_len + len(page_text))
+        text_len += len(page_text)
+
+    return ''.join(res_texts), table_map, block_index
+
+
+def split_batch_text(text: str,
+                     table_map: Union[Dict[str, str], TableMap],
+                     block_index: PageIndex,
+                     block_number: int = 0,
+                     chunk_size: int = 4000,
+                     chunk_overlap: int = 200,
+                     separators: Optional[List[str]] = None,
+                     repeat_overlap_table: bool = False,
+                     ) -> List[Document]:
+    """
+    切割build_batch_text得到的文本，切割结果回填表格并映射回页码；不修改传入的table_map，可对同一文本按不同长度重复切割
+
+    :param text:
+    :param table_map:
+    :param block_index:
+    :param block_number: 批次编号
+    :param chunk_size:
+    :param chunk_overlap:
+    :param separators:
+    :param repeat_overlap_table: 表格出现在多个文档（重叠部分）中时，是否在每个文档中都渲染，默认只渲染第一个
+    :return:
+    """
+    length_function_new = PlaceholderLength(table_map)
+
+    split_docs = simple_split_text_list([text], [{'block_number': block_number}],
                                         chunk_size=chunk_size,
                                         chunk_overlap=chunk_overlap,
                                         add_start_index=True,
@@ -143,93 +370,325 @@ def split_pdf_page_lst(page_lst: List[PdfPage],
                                         separators=separators)
 
     # 将split_docs中的table_id替换为table_str
+    # 表格落在相邻文档的重叠部分时，默认只在第一个文档中渲染，之后的文档保留占位符
+    rendered_ids = None if repeat_overlap_table else set()
     for doc in split_docs:
-        page_text = doc.page_content
-        table_id_lst = []
-        for table_id, table_str in table_map.items():
-            if table_id in page_text:
-                page_text = page_text.replace(table_id, table_str)
-                table_id_lst.append(table_id)
-
-        for table_id in table_id_lst:
-            table_map.pop(table_id)
-        doc.page_content = page_text
-
-        block_number = doc.metadata['block_number']
+        chunk_len = len(doc.page_content)
+        doc.page_content = render_placeholders(doc.page_content, table_map, rendered_ids)
+
         start_index = doc.metadata['start_index']
-        block_index_lst = block_index[block_number]
-        for one_block_index in block_index_lst:
-            if one_block_index['start_index'] <= start_index < one_block_index['end_index']:
-                doc.metadata['page_number'] = one_block_index['page_number']
-                doc.metadata['start_index'] = start_index - one_block_index['start_index']
-                doc.metadata.pop('block_number')
-                break
+        start_page = block_index.locate(start_index)
+        if start_page is not None:
+            doc.metadata['page_number'], doc.metadata['start_index'] = start_page
+            doc.metadata.pop('block_number')
+            # 跨页的文档记录结束页码
+            end_page = block_index.locate(start_index + max(chunk_len - 1, 0))
+            doc.metadata['end_page_number'] = end_page[0] if end_page is not None else start_page[0]
 
     return split_docs
 
 
-def parse_and_split_pdf(pdf_path: str,
+def _split_batch_multi(batch: List[Union[PdfPage, PdfPageRecord]],
+                       block_number: int,
+                       chunk_params: List[Tuple[int, int]],
+                       format_type: str,
+                       separators: Optional[List[str]],
+                       repeat_overlap_table: bool,
+                       stats: Optional[ParseStats] = None) -> List[List[Document]]:
+    # 一批页只拼接一次，依次按各切割长度切割，返回与chunk_params一一对应的文档列表；
+    # 表格渲染缓存只在批内有效，批处理完即释放
+    with stats_stage(stats, 'build_text'):
+        text, table_map, block_index = build_batch_text(batch, format_type=format_type)
+    batch_docs_lst = []
+    for chunk_size, chunk_overlap in chunk_params:
+        with stats_stage(stats, 'split'):
+            split_docs = split_batch_text(text, table_map, block_index, block_number,
+                                          chunk_size=chunk_size,
+                                          chunk_overlap=chunk_overlap,
+                                          separators=separators,
+                                          repeat_overlap_table=repeat_overlap_table)
+        for doc in split_docs:
+            doc.metadata['chunk_size'] = chunk_size
+        batch_docs_lst.append(split_docs)
+        if stats is not None:
+            stats.count('chunks', len(split_docs))
+    return batch_docs_lst
+
+
+def split_pdf_page_lst_multi(page_lst: Iterable[Union[PdfPage, PdfPageRecord]],
+                             chunk_size_lst: List[int],
+                             chunk_overlap_lst: List[int],
+                             format_type='markdown',
+                             sum_num: int = 100,
+                             separators: Optional[List[str]] = None,
+                             repeat_overlap_table: bool = False,
+                             stats: Optional[ParseStats] = None,
+                             ) -> List[Document]:
+    """
+    按多个切割长度切割页列表，每批页只拼接一次，再依次按各切割长度切割；
+    返回结果按切割长度分组排列，与逐个调用split_pdf_page_lst拼接的结果一致，
+    每个文档的metadata中记录chunk_size
+
+    :param page_lst:
+    :param chunk_size_lst: 切割长度列表
+    :param chunk_overlap_lst: 与chunk_size_lst一一对应的重叠长度列表
+    :param format_type:
+    :param sum_num: 每批的页数
+    :param separators:
+    :param repeat_overlap_table: 表格出现在多个文档中时，是否在每个文档中都渲染
+    :param stats: 统计拼接、切割耗时和文档数，为None时不统计
+    :return:
+    """
+    chunk_params = list(zip(chunk_size_lst, chunk_overlap_lst))
+    split_docs_lst: List[List[Document]] = [[] for _ in chunk_params]
+
+    for block_number, batch in enumerate(iter_split_datas(page_lst, sum_num)):
+        batch_docs_lst = _split_batch_multi(batch, block_number, chunk_params, format_type, separators,
+                                            repeat_overlap_table, stats=stats)
+        for k, split_docs in enumerate(batch_docs_lst):
+            split_docs_lst[k].extend(split_docs)
+
+    return [doc for split_docs in split_docs_lst for doc in split_docs]
+
+
+def iter_split_pdf_page_lst_multi(page_lst: Iterable[Union[PdfPage, PdfPageRecord]],
+                                  chunk_size_lst: List[int],
+                                  chunk_overlap_lst: List[int],
+                                  format_type='markdown',
+                                  sum_num: int = 100,
+                                  separators: Optional[List[str]] = None,
+                                  repeat_overlap_table: bool = False,
+                                  stats: Optional[ParseStats] = None,
+                                  ) -> Iterator[Document]:
+    """
+    split_pdf_page_lst_multi的流式版本，每批页切割完即输出，不等待整个文档解析完成；
+    输出顺序为按批排列、批内按切割长度分组，文档内容与split_pdf_page_lst_multi一致
+
+    :param page_lst:
+    :param chunk_size_lst: 切割长度列表
+    :param chunk_overlap_lst: 与chunk_size_lst一一对应的重叠长度列表
+    :param format_type:
+    :param sum_num: 每批的页数
+    :param separators:
+    :param repeat_overlap_table: 表格出现在多个文档中时，是否在每个文档中都渲染
+    :param stats: 统计拼接、切割耗时和文档数，为None时不统计
+    :return:
+    """
+    chunk_params = list(zip(chunk_size_lst, chunk_overlap_lst))
+    for block_number, batch in enumerate(iter_split_datas(page_lst, sum_num)):
+        for split_docs in _split_batch_multi(batch, block_number, chunk_params, format_type, separators,
+                                             repeat_overlap_table, stats=stats):
+            yield from split_docs
+
+
+def split_pdf_page_lst(page_lst: Iterable[Union[PdfPage, PdfPageRecord]],
+                       chunk_size: int = 4000,
+                       chunk_overlap: int = 200,
+                       format_type='markdown',
+                       sum_num: int = 100,
+                       separators: Optional[List[str]] = None,
+                       repeat_overlap_table: bool = False,
+                       stats: Optional[ParseStats] = None,
+                       ) -> List[Document]:
+    """
+    切割页列表，每sum_num页为一批切割，批与批之间相互独立；
+    page_lst可以是iter_pdf_pages返回的迭代器，此时同一时间只在内存中保留一批页
+
+    :param page_lst:
+    :param chunk_size:
+    :param chunk_overlap:
+    :param format_type:
+    :param sum_num: 每批的页数
+    :param separators:
+    :param repeat_overlap_table: 表格出现在多个文档中时，是否在每个文档中都渲染
+    :param stats: 统计拼接、切割耗时和文档数，为None时不统计
+    :return:
+    """
+    split_docs = []
+    for block_number, batch in enumerate(iter_split_datas(page_lst, sum_num)):
+        with stats_stage(stats, 'build_text'):
+            text, table_map, block_index = build_batch_text(batch, format_type=format_type)
+        with stats_stage(stats, 'split'):
+            batch_docs = split_batch_text(text, table_map, block_index, block_number,
+                                          chunk_size=chunk_size,
+                                          chunk_overlap=chunk_overlap,
+                                          separators=separators,
+                                          repeat_overlap_table=repeat_overlap_table)
+        split_docs.extend(batch_docs)
+        if stats is not None:
+            stats.count('chunks', len(batch_docs))
+
+    return split_docs
+
+
+def parse_and_split_pdf(pdf_path: PdfSource,
                         chunk_size: int = 4000,
                         chunk_overlap: int = 200,
                         format_type='markdown',
                         sum_num: int = 100,
                         separators: Optional[List[str]] = None,
+                        repeat_overlap_table: bool = False,
+                        image_mode: Union[str, ImageMode] = IMAGE_MODE,
+                        table_strategy: Union[str, TableStrategy] = TABLE_STRATEGY,
+                        pages: Union[str, int, Iterable[int], None] = None,
+                        stats: Optional[ParseStats] = None,
                         ) -> List[Document]:
     """
     切割pdf，返回切割后的文档列表
 
-    :param pdf_path:
+    :param pdf_path: pdf路径、pdf内容或以二进制模式打开的文件对象
     :param chunk_size:
     :param chunk_overlap:
     :param format_type:
     :param sum_num:
     :param separators:
-    :param split_type: 切割规则，默认按照原系统切割，1：自定义；2：fastgpt切割规则
+    :param repeat_overlap_table: 表格出现在多个文档中时，是否在每个文档中都渲染
+    :param image_mode: 图片处理方式，切割只用到图片占位符，不需要图片内容时可用skip或reference
+    :param table_strategy: 表格识别策略
+    :param pages: 要解析的页码，从1开始，如"1-20,45"，为None时解析全部页
+    :param stats: 统计解析、切割各阶段的耗时、数量、内存，见ParseStats，为None时不统计
     :return:
     """
-    all_pdf_pages = parse_pdf(pdf_path)
-    page_lst = all_pdf_pages.pdf_pages
+    if stats is not None:
+        stats.start()
+    page_lst = iter_page_records(pdf_path, image_mode=image_mode, table_strategy=table_strategy, pages=pages,
+                                 stats=stats)
     split_docs = split_pdf_page_lst(page_lst,
                                     chunk_size=chunk_size,
                                     chunk_overlap=chunk_overlap,
                                     format_type=format_type,
                                     sum_num=sum_num,
                                     separators=separators,
+                                    repeat_overlap_table=repeat_overlap_table,
+                                    stats=stats,
                                     )
+    if stats is not None:
+        stats.stop()
+
+    return split_docs
+
+
+def parse_and_split_pdf_multi(pdf_path: PdfSource,
+                              chunk_size_lst: List[int],
+                              chunk_overlap_lst: List[int],
+                              format_type='markdown',
+                              sum_num: int = 100,
+                              separators: Optional[List[str]] = None,
+                              repeat_overlap_table: bool = False,
+                              image_mode: Union[str, ImageMode] = IMAGE_MODE,
+                              table_strategy: Union[str, TableStrategy] = TABLE_STRATEGY,
+                              pages: Union[str, int, Iterable[int], None] = None,
+                              use_cache: bool = True,
+                              stats: Optional[ParseStats] = None,
+                              ) -> List[Document]:
+    """
+    只解析一次pdf，按多个切割长度切割，返回切割后的文档列表
+
+    :param pdf_path: pdf路径、pdf内容或以二进制模式打开的文件对象
+    :param chunk_size_lst: 切割长度列表
+    :param chunk_overlap_lst: 与chunk_size_lst一一对应的重叠长度列表
+    :param format_type:
+    :param sum_num:
+    :param separators:
+    :param repeat_overlap_table: 表格出现在多个文档中时，是否在每个文档中都渲染
+    :param image_mode: 图片处理方式，切割只用到图片占位符，不需要图片内容时可用skip或reference
+    :param table_strategy: 表格识别策略
+    :param pages: 要解析的页码，从1开始，如"1-20,45"，为None时解析全部页
+    :param use_cache: 是否使用解析缓存
+    :param stats: 统计解析、切割各阶段的耗时、数量、内存，见ParseStats，为None时不统计
+    :return:
+    """
+    if stats is not None:
+        stats.start()
+    page_lst = iter_page_records(pdf_path, use_cache=use_cache, image_mode=image_mode, table_strategy=table_strategy,
+                                 pages=pages, stats=stats)
+    split_docs = split_pdf_page_lst_multi(page_lst,
+                                          chunk_size_lst=chunk_size_lst,
+                                          chunk_overlap_lst=chunk_overlap_lst,
+                                          format_type=format_type,
+                                          sum_num=sum_num,
+                                          separators=separators,
+                                          repeat_overlap_table=repeat_overlap_table,
+                                          stats=stats,
+                                          )
+    if stats is not None:
+        stats.stop()
 
     return split_docs
 
 
-def parse_pdf_chunk(file_path: str, ud_chunk_size: int = None, separators: Optional[List[str]] = None, split_type: int = None) -> List[Document]:
+def get_chunk_params(ud_chunk_size: int = None) -> Tuple[List[int], List[int]]:
     """
-    解析pdf
-    :param file_path:
+    获取切割长度和重叠长度列表，未指定用户自定义长度时使用环境变量配置
+    :param ud_chunk_size: 用户自定义的切割长度
+    :return:
+    """
+    if not ud_chunk_size:
+        return CHUNK_SIZE_LIST, CHUNK_OVERLAP_LIST
+    return [ud_chunk_size], [ud_chunk_size // 5]
+
+
+def parse_pdf_chunk(file_path: PdfSource, ud_chunk_size: int = None, separators: Optional[List[str]] = None, split_type: int = None,
+                    pages: Union[str, int, Iterable[int], None] = None,
+                    stats: Optional[ParseStats] = None) -> List[Document]:
+    """
+    解析pdf，只解析一次，按各切割长度切割，每个文档的metadata中记录chunk_size
+    :param file_path: pdf路径、pdf内容或以二进制模式打开的文件对象
     :param ud_chunk_size: 用户自定义的切割长度
     :param separators: 用户自定义的切割符号
     :param split_type: 切割规则，默认按照原系统切割，1：自定义；2：fastgpt切割规则
+    :param pages: 要解析的页码，从1开始，如"1-20,45"，为None时解析全部页
+    :param stats: 统计解析、切割各阶段的耗时、数量、内存，见ParseStats，为None时不统计
     :return:
     """
-    all_split_docs = []
-    if not ud_chunk_size:
-        for chunk_size, chunk_overlap in zip(CHUNK_SIZE_LIST, CHUNK_OVERLAP_LIST):
-            split_docs = parse_and_split_pdf(file_path,
-                                             chunk_size=chunk_size,
-                                             chunk_overlap=chunk_overlap,
-                                             format_type=TABLE_FORMAT,
-                                             sum_num=DOC_SUM_NUM,
-                                             separators=separators,
-                                             split_type=split_type,
-                                             )
-            all_split_docs.extend(split_docs)
-    else:
-        all_split_docs = parse_and_split_pdf(file_path,
-                                             chunk_size=ud_chunk_size,
-                                             chunk_overlap=ud_chunk_size // 5,
+    chunk_size_lst, chunk_overlap_lst = get_chunk_params(ud_chunk_size)
+
+    all_split_docs = parse_and_split_pdf_multi(file_path,
+                                               chunk_size_lst=chunk_size_lst,
+                                               chunk_overlap_lst=chunk_overlap_lst,
+                                               format_type=TABLE_FORMAT,
+                                               sum_num=DOC_SUM_NUM,
+                                               separators=separators,
+                                               repeat_overlap_table=REPEAT_OVERLAP_TABLE,
+                                               pages=pages,
+                                               stats=stats,
+                                               )
+
+    return all_split_docs
+
+
+def iter_pdf_chunks(file_path: PdfSource, ud_chunk_size: int = None, separators: Optional[List[str]] = None,
+                    split_type: int = None, pages: Union[str, int, Iterable[int], None] = None,
+                    workers: int = 1,
+                    image_mode: Union[str, ImageMode] = IMAGE_MODE,
+                    table_strategy: Union[str, TableStrategy] = TABLE_STRATEGY,
+                    stats: Optional[ParseStats] = None) -> Iterator[Document]:
+    """
+    parse_pdf_chunk的流式版本，每DOC_SUM_NUM页切割完即输出，输出顺序见iter_split_pdf_page_lst_multi
+    :param file_path: pdf路径、pdf内容或以二进制模式打开的文件对象
+    :param ud_chunk_size: 用户自定义的切割长度
+    :param separators: 用户自定义的切割符号
+    :param split_type: 切割规则，默认按照原系统切割，1：自定义；2：fastgpt切割规则
+    :param pages: 要解析的页码，从1开始，如"1-20,45"，为None时解析全部页
+    :param workers: 并行解析的进程数
+    :param image_mode: 图片处理方式，切割只用到图片占位符，不需要图片内容时可用skip或reference
+    :param table_strategy: 表格识别策略
+    :param stats: 统计解析、切割各阶段的耗时、数量、内存，见ParseStats，为None时不统计
+    :return:
+    """
+    chunk_size_lst, chunk_overlap_lst = get_chunk_params(ud_chunk_size)
+    if stats is not None:
+        stats.start()
+    page_lst = iter_page_records(file_path, workers=workers, image_mode=image_mode, table_strategy=table_strategy,
+                                 pages=pages, stats=stats)
+    yield from iter_split_pdf_page_lst_multi(page_lst,
+                                             chunk_size_lst=chunk_size_lst,
+                                             chunk_overlap_lst=chunk_overlap_lst,
                                              format_type=TABLE_FORMAT,
                                              sum_num=DOC_SUM_NUM,
                                              separators=separators,
-                                             split_type=split_type,
+                                             repeat_overlap_table=REPEAT_OVERLAP_TABLE,
+                                             stats=stats,
                                              )
-
-    return all_split_docs
-
+    if stats is not None:
+        stats.stop()
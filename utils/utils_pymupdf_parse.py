@@ -1,10 +1,25 @@
 
+import io
 import re
+import math
+import mmap
+import hashlib
 import fitz
+import threading
 from enum import Enum
-from typing import Union, List, Tuple
+from typing import Union, List, Tuple, Iterable, Iterator, Optional, Sequence, BinaryIO, Callable
 from pydantic import BaseModel, Field
 from pathlib import Path
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from loguru import logger
+
+from utils.utils_cache import get_parse_cache, source_sha256
+from utils.utils_stats import ParseStats, stats_stage
+from utils.env import IMAGE_MODE, TABLE_STRATEGY
+
 
 class ElementType(str, Enum):
     text = 'text'
@@ -12,11 +27,38 @@ class ElementType(str, Enum):
     table = 'table'
 
 
+class ImageMode(str, Enum):
+    # 不输出图片元素
+    skip = 'skip'
+    # 只输出图片的xref、坐标等信息，需要时通过load_image读取图片；为保证块的合并与inline一致，
+    # 解析时仍由get_text("dict")完整解码每张图片，只是不保留在结果中，节省的是内存和输出，不是解析时间
+    reference = 'reference'
+    # 输出图片内容
+    inline = 'inline'
+
+
+class TableStrategy(str, Enum):
+    # 每页都做表格识别
+    always = 'always'
+    # 页内有足够的横线、竖线时才做表格识别
+    auto = 'auto'
+    # 不做表格识别
+    never = 'never'
+
+
+class ImageRef(BaseModel):
+    xref: int = Field(description='图片xref，为0时表示内嵌图片，按坐标截取')
+    page_number: int = Field(description='页码')
+    bbox: Tuple[float, ...] = Field(description='图片坐标')
+    width: int = Field(description='图片宽度')
+    height: int = Field(description='图片高度')
+
+
 class PdfElement(BaseModel):
     element_no: int = Field(description='元素编号')
     element_type: ElementType = Field(description='元素类型')
     element_bbox: Tuple[float, ...] = Field(description='元素坐标')
-    element_value: Union[str, bytes, list] = Field(description='元素内容')
+    element_value: Union[str, bytes, list, ImageRef] = Field(description='元素内容')
 
 
 class PdfPage(BaseModel):
@@ -31,6 +73,48 @@ class AllPdfPage(BaseModel):
     pdf_pages: List[PdfPage] = Field(description='pdf页列表')
 
 
+# parse_pdf等接口支持的pdf输入：路径，内存中的pdf内容，以二进制模式打开的文件对象
+PdfSource = Union[str, Path, bytes, bytearray, memoryview, mmap.mmap, BinaryIO]
+
+
+class PdfElementRecord:
+    """ PdfElement的轻量表示，不做校验，供解析、切割流程内部使用，需要时通过to_model转换 """
+    __slots__ = ('element_no', 'element_type', 'element_bbox', 'element_value')
+
+    def __init__(self, element_no: int, element_type: ElementType, element_bbox: Tuple[float, ...],
+                 element_value: Union[str, bytes, list, ImageRef]):
+        self.element_no = element_no
+        self.element_type = element_type
+        self.element_bbox = element_bbox
+        self.element_value = element_value
+
+    def to_model(self) -> PdfElement:
+        return PdfElement(element_no=self.element_no,
+                          element_type=self.element_type,
+                          element_bbox=self.element_bbox,
+                          element_value=self.element_value)
+
+
+class PdfPageRecord:
+    """ PdfPage的轻量表示，不做校验，供解析、切割流程内部使用，需要时通过to_model转换 """
+    __slots__ = ('page_number', 'page_height', 'page_width', 'page_elements', 'table_skipped')
+
+    def __init__(self, page_number: int, page_height: float, page_width: float,
+                 page_elements: List[PdfElementRecord], table_skipped: bool = False):
+        self.page_number = page_number
+        self.page_height = page_height
+        self.page_width = page_width
+        self.page_elements = page_elements
+        # 是否跳过了表格识别，只用于统计，不输出到PdfPage
+        self.table_skipped = table_skipped
+
+    def to_model(self) -> PdfPage:
+        return PdfPage(page_number=self.page_number,
+                       page_height=self.page_height,
+                       page_width=self.page_width,
+                       page_elements=[element.to_model() for element in self.page_elements])
+
+
 def bbox_include(bbox1, bbox2):
     """
     判断bbox1是否包含bbox2
@@ -75,45 +159,90 @@ def parse_block_content(block) -> dict:
         }
 
 
+@lru_cache(maxsize=1024)
+def _nest_table_pattern(first_row: str, last_row: str) -> re.Pattern:
+    # 内层表格在外层单元格中的文本：从首行内容开始，到末行内容结束
+    return re.compile(re.escape(first_row) + '.*?' + re.escape(last_row), re.S)
+
+
+def nest_table_pattern(table_text: list) -> re.Pattern:
+    """
+    根据内层表格的首行、末行生成匹配其在外层表格单元格中文本的正则
+    :param table_text:
+    :return:
+    """
+    return _nest_table_pattern(' '.join([d for d in table_text[0] if d is not None]).strip(),
+                               ' '.join([d for d in table_text[-1] if d is not None]).strip())
+
+
+def find_table_include(table_lst) -> List[List[int]]:
+    """
+    计算每个表格包含的其他表格，按x0排序后二分查找候选表格
+    :param table_lst:
+    :return: 每个表格包含的表格下标列表，下标升序
+    """
+    order = sorted(range(len(table_lst)), key=lambda k: table_lst[k]['bbox'][0])
+    x0_lst = [table_lst[k]['bbox'][0] for k in order]
+    include_lst = []
+    for i, table in enumerate(table_lst):
+        x0, _, x1, _ = table['bbox']
+        # 被包含的表格的x0必然在[x0, x1]之间
+        lo = bisect_left(x0_lst, x0)
+        hi = bisect_right(x0_lst, x1)
+        include = [order[k] for k in range(lo, hi)
+                   if order[k] != i and bbox_include(table['bbox'], table_lst[order[k]]['bbox'])]
+        include.sort()
+        include_lst.append(include)
+    return include_lst
+
+
 def deal_table_nest(table_lst):
     # 处理表格嵌套的问题
+    include_lst = find_table_include(table_lst)
+
+    # table_no -> text_dict中包含该table_no的第一个表格的下标
+    holder = dict()
+    for k, table in enumerate(table_lst):
+        for table_no in table['text_dict']:
+            holder.setdefault(table_no, k)
+
+    def _add_text_dict(k, table):
+        table_lst[k]['text_dict'][table['table_no']] = (table['bbox'], table['text'])
+        if k < holder.get(table['table_no'], len(table_lst)):
+            holder[table['table_no']] = k
+
     for i, table1 in enumerate(table_lst):
-        one_bbox = table1['bbox']
-        one_text = table1['text']
-        for j, table2 in enumerate(table_lst):
-            if i == j:
-                continue
-            two_bbox = table2['bbox']
-            two_text = table2['text']
-            if bbox_include(one_bbox, two_bbox):
-                re_rep = re.compile(
-                    re.escape(' '.join([d for d in two_text[0] if d is not None]).strip()) +
-                    '.*?' +
-                    re.escape(' '.join([d for d in two_text[-1] if d is not None]).strip()),
-                    re.S
-                )
-                for w, col in enumerate(one_text):
-                    for z, row in enumerate(col):
-                        if not row:
-                            continue
-                        row_lst = re_rep.findall(row)
-                        if row_lst:
-                            table1['text'][w][z] = re_rep.sub('', row)
-
-                if table1['is_nest'] == 2:
-                    temp_tables = list(filter(lambda x: table1['table_no'] in x['text_dict'], table_lst))
-                    if not temp_tables:
-                        continue
-
-                    temp_table = temp_tables[0]
-                    temp_table['text_dict'][table2['table_no']] = (two_bbox, table2['text'])
-                    temp_table['text_dict'][table1['table_no']] = (one_bbox, table1['text'])
-                    table2['is_nest'] = 2
-                else:
-                    table1['text_dict'][table1['table_no']] = (one_bbox, table1['text'])
-                    table1['text_dict'][table2['table_no']] = (two_bbox, table2['text'])
-                    table1['is_nest'] = 1
-                    table2['is_nest'] = 2
+        include = include_lst[i]
+        if not include:
+            continue
+
+        # 去掉外层表格单元格中内层表格的文本，每个单元格只遍历一次
+        patterns = [nest_table_pattern(table_lst[j]['text']) for j in include]
+        for col in table1['text']:
+            for z, row in enumerate(col):
+                new_row = row
+                for re_rep in patterns:
+                    if not new_row:
+                        break
+                    new_row = re_rep.sub('', new_row)
+                if new_row != row:
+                    col[z] = new_row
+
+        for j in include:
+            table2 = table_lst[j]
+            if table1['is_nest'] == 2:
+                k = holder.get(table1['table_no'])
+                if k is None:
+                    continue
+
+                _add_text_dict(k, table2)
+                _add_text_dict(k, table1)
+                table2['is_nest'] = 2
+            else:
+                _add_text_dict(i, table1)
+                _add_text_dict(i, table2)
+                table1['is_nest'] = 1
+                table2['is_nest'] = 2
 
     # 筛序掉嵌套的表格
     table_lst = list(filter(lambda x: x['is_nest'] != 2, table_lst))
@@ -121,15 +250,53 @@ def deal_table_nest(table_lst):
     return table_lst
 
 
+class TableIndex:
+    """ 表格bbox的网格索引，用于快速查找包含某个bbox的第一个表格 """
+
+    def __init__(self, table_lst, cell_size: float = 50):
+        self.table_lst = table_lst
+        self.cell_size = cell_size
+        self.grid = defaultdict(list)
+        for idx, table in enumerate(table_lst):
+            x0, y0, x1, y1 = table['bbox']
+            for gx in range(self._cell(x0), self._cell(x1) + 1):
+                for gy in range(self._cell(y0), self._cell(y1) + 1):
+                    self.grid[(gx, gy)].append(idx)
+
+    def _cell(self, value: float) -> int:
+        return math.floor(value / self.cell_size)
+
+    def find_include(self, bbox):
+        """
+        查找包含bbox的表格，存在多个时返回table_lst中最靠前的一个
+        :param bbox:
+        :return:
+        """
+        x0, y0, x1, y1 = bbox
+        if x0 > x1 or y0 > y1:
+            # 不规范的bbox无法用左上角定位，逐个比较
+            candidates = range(len(self.table_lst))
+        else:
+            # 包含bbox的表格必然覆盖bbox的左上角，只需检查左上角所在网格中的表格
+            candidates = self.grid.get((self._cell(x0), self._cell(y0)), [])
+        for idx in candidates:
+            table = self.table_lst[idx]
+            if bbox_include(table['bbox'], bbox):
+                return table
+        return None
+
+
 def deal_block_include_table(block_lst, table_lst):
     # 处理block_lst包含的表格
     element_lst = []
+    table_index = TableIndex(table_lst)
+    table_no_set = set()
     for block in block_lst:
-        for table in table_lst:
-            if block['block_type'] == 0 and bbox_include(table['bbox'], block['bbox']):
-                if table['table_no'] not in element_lst:
-                    element_lst.append(table['table_no'])
-                break
+        table = table_index.find_include(block['bbox']) if block['block_type'] == 0 else None
+        if table is not None:
+            if table['table_no'] not in table_no_set:
+                table_no_set.add(table['table_no'])
+                element_lst.append(table['table_no'])
         else:
             element_lst.append({
                 'bbox': block['bbox'],
@@ -141,7 +308,7 @@ def deal_block_include_table(block_lst, table_lst):
     return element_lst
 
 
-def format_element_lst(element_lst, table_lst) -> List[PdfElement]:
+def format_element_lst(element_lst, table_lst) -> List[PdfElementRecord]:
     # 格式化element_lst
     element_list_res = []
     t = 1
@@ -150,123 +317,617 @@ def format_element_lst(element_lst, table_lst) -> List[PdfElement]:
         if isinstance(element, int):
             table_element = table_map[element]
             if table_element['is_nest'] == 0:
-                element_list_res.append(PdfElement(element_no=t,
-                                                   element_type=ElementType.table,
-                                                   element_bbox=table_element['bbox'],
-                                                   element_value=table_element['text']))
+                element_list_res.append(PdfElementRecord(t, ElementType.table,
+                                                         table_element['bbox'], table_element['text']))
             elif table_element['is_nest'] == 1:
                 for _, table_element_temp in table_element['text_dict'].items():
-                    element_list_res.append(PdfElement(element_no=t,
-                                                       element_type=ElementType.table,
-                                                       element_bbox=table_element_temp[0],
-                                                       element_value=table_element_temp[1]))
+                    element_list_res.append(PdfElementRecord(t, ElementType.table,
+                                                             table_element_temp[0], table_element_temp[1]))
                     t += 1
         elif isinstance(element['text'], str):
-            element_list_res.append(PdfElement(element_no=t,
-                                               element_type=ElementType.text,
-                                               element_bbox=element['bbox'],
-                                               element_value=element['text']))
-        elif isinstance(element['text'], bytes):
+            element_list_res.append(PdfElementRecord(t, ElementType.text, element['bbox'], element['text']))
+        elif isinstance(element['text'], (bytes, ImageRef)):
             # 处理图片
-            try:
-                element_list_res.append(PdfElement(element_no=t,
-                                                   element_type=ElementType.image,
-                                                   element_bbox=element['bbox'],
-                                                   element_value=element['text']))
-            except:
-                pass
+            element_list_res.append(PdfElementRecord(t, ElementType.image, element['bbox'], element['text']))
 
         t += 1
 
     return element_list_res
 
 
-def parse_pdf(path: Union[str, Path]) -> AllPdfPage:
+# 不提取图片内容的get_text("dict")参数
+TEXTFLAGS_DICT_NO_IMAGES = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+
+
+def get_page_blocks(page: fitz.Page, num_page: int, image_mode: ImageMode = ImageMode.inline) -> list:
     """
-    解析pdf
+    获取页内的块，skip模式不让PyMuPDF提取图片内容，reference模式将图片内容替换为ImageRef，不随结果返回；
+    reference模式与inline模式一样由get_text("dict")解码全部图片，图片的解码耗时不变
+
+    :param page: fitz页对象
+    :param num_page: 页索引，从0开始
+    :param image_mode:
+    :return:
+    """
+    if image_mode == ImageMode.skip:
+        return page.get_text("dict", flags=TEXTFLAGS_DICT_NO_IMAGES).get('blocks')
+
+    # 图片块会影响相邻文本块的合并，reference模式与inline模式使用同一次提取，保证块的顺序和数量一致
+    blocks = page.get_text("dict").get('blocks')
+    if image_mode == ImageMode.inline:
+        return blocks
+
+    # get_image_info中的number与块列表中图片块的number一致，用于取得图片的xref
+    xrefs = {info['number']: info['xref'] for info in page.get_image_info(xrefs=True)}
+    for block in blocks:
+        if block['type'] == 1:
+            block['image'] = ImageRef(xref=xrefs.get(block['number'], 0),
+                                      page_number=num_page + 1,
+                                      bbox=block['bbox'],
+                                      width=block['width'],
+                                      height=block['height'])
+    return blocks
+
+
+def load_pdf_source(source: PdfSource) -> Union[str, bytes]:
+    """
+    将pdf输入统一为路径或bytes，路径由MuPDF按需读取，不整体读入内存；
+    PyMuPDF的stream参数只接受bytes，bytearray、memoryview、mmap需要复制一次
+
+    :param source:
+    :return:
+    """
+    if isinstance(source, (str, bytes)):
+        return source
+    if isinstance(source, Path):
+        return str(source)
+    if isinstance(source, (bytearray, memoryview, mmap.mmap)):
+        return bytes(source)
+    if isinstance(source, io.TextIOBase):
+        raise TypeError('文件对象需要以二进制模式打开')
+    if hasattr(source, 'read'):
+        return bytes(source.read())
+    raise TypeError(f'不支持的pdf输入类型：{type(source)}')
+
+
+def open_pdf(source: Union[str, bytes]) -> fitz.Document:
+    """
+    打开load_pdf_source返回的pdf输入
+    :param source:
+    :return:
+    """
+    if isinstance(source, bytes):
+        return fitz.open(stream=source, filetype='pdf')
+    return fitz.open(source)
+
+
+def load_image(path: PdfSource, image_ref: ImageRef) -> bytes:
+    """
+    读取reference模式下图片的内容；有xref时返回pdf中保存的原始图片，否则按坐标截取为png
+
     :param path:
+    :param image_ref:
+    :return:
+    """
+    with open_pdf(load_pdf_source(path)) as pdf:
+        if image_ref.xref > 0:
+            return pdf.extract_image(image_ref.xref)['image']
+        page = pdf[image_ref.page_number - 1]
+        return page.get_pixmap(clip=image_ref.bbox).tobytes('png')
+
+
+def page_may_have_table(page: fitz.Page, tolerance: float = 3) -> bool:
+    """
+    根据页内的矢量线条判断是否可能存在表格；
+    find_tables默认只根据直线、矩形、四边形的边识别表格，一个单元格至少需要两条横线和两条竖线，
+    不满足时find_tables必然找不到表格，可以跳过
+
+    :param page:
+    :param tolerance: 判断横线、竖线的容差，与find_tables的snap_tolerance默认值一致
+    :return:
+    """
+    horizontal, vertical = 0, 0
+    for path in page.get_cdrawings():
+        items = path['items']
+        for item in items:
+            if item[0] == 'l':
+                (x0, y0), (x1, y1) = item[1], item[2]
+                if abs(y0 - y1) <= tolerance:
+                    horizontal += 1
+                elif abs(x0 - x1) <= tolerance:
+                    vertical += 1
+            elif item[0] in ('re', 'qu'):
+                horizontal += 2
+                vertical += 2
+        # 闭合路径会补上首尾之间的一条边，不区分方向，两边都计数
+        if path.get('closePath') and items and items[0][0] == 'l' and items[-1][0] == 'l':
+            horizontal += 1
+            vertical += 1
+        if horizontal >= 2 and vertical >= 2:
+            return True
+    return False
+
+
+def find_page_tables(page: fitz.Page) -> list:
+    """
+    识别页内的表格
+    :param page:
+    :return:
+    """
+    # PyMuPDF的表格识别会修改全局的small_glyph_heights且可能不还原，
+    # 这里手动还原，保证每页get_text的结果与解析顺序、进程无关
+    old_small = fitz.TOOLS.set_small_glyph_heights()
+    try:
+        tabs = page.find_tables()
+        table_lst = []
+        for i, tab in enumerate(tabs):
+            bbox = tab.bbox
+            tab_value = tab.extract()
+            table_lst.append({
+                'bbox': bbox,
+                'text': tab_value,
+                'block_lst': [],
+                'table_no': i,
+                'is_nest': 0,
+                'text_dict': dict()
+            })
+    finally:
+        fitz.TOOLS.set_small_glyph_heights(old_small)
+    return table_lst
+
+
+# PyMuPDF的表格识别使用模块级的全局变量，并会修改全局的small_glyph_heights，
+# 同一进程中多个线程同时解析时结果会互相影响，页的解析需要串行
+_PAGE_PARSE_LOCK = threading.Lock()
+
+
+def parse_page(page: fitz.Page, num_page: int, image_mode: ImageMode = ImageMode.inline,
+               table_strategy: TableStrategy = TableStrategy.auto,
+               stats: Optional[ParseStats] = None) -> PdfPageRecord:
+    """
+    解析单页pdf，返回轻量的PdfPageRecord；线程安全，同一进程中的多个线程依次解析
+    :param page: fitz页对象
+    :param num_page: 页索引，从0开始
+    :param image_mode: 图片处理方式
+    :param table_strategy: 表格识别策略
+    :param stats: 统计各阶段耗时、数量，为None时不统计
+    :return:
+    """
+    with _PAGE_PARSE_LOCK:
+        return _parse_page(page, num_page, image_mode=image_mode, table_strategy=table_strategy, stats=stats)
+
+
+def _parse_page(page: fitz.Page, num_page: int, image_mode: ImageMode, table_strategy: TableStrategy,
+                stats: Optional[ParseStats]) -> PdfPageRecord:
+    if stats is not None:
+        stats.begin_page(num_page + 1)
+
+    with stats_stage(stats, 'get_text'):
+        blocks = get_page_blocks(page, num_page, image_mode=image_mode)
+        block_lst = []
+        for block in blocks:
+            block_lst.append(parse_block_content(block))
+
+    with stats_stage(stats, 'table_check'):
+        need_find_tables = table_strategy == TableStrategy.always or (
+                table_strategy == TableStrategy.auto and page_may_have_table(page))
+    if need_find_tables:
+        with stats_stage(stats, 'find_tables'):
+            table_lst = find_page_tables(page)
+        table_skipped = False
+    else:
+        table_lst = []
+        table_skipped = True
+
+    # 处理表格嵌套的问题
+    with stats_stage(stats, 'table_nest'):
+        table_lst = deal_table_nest(table_lst)
+
+    # 处理block_lst包含的表格
+    with stats_stage(stats, 'block_include'):
+        element_lst = deal_block_include_table(block_lst, table_lst)
+
+    # 格式化element_lst
+    with stats_stage(stats, 'format'):
+        element_list_res = format_element_lst(element_lst, table_lst)
+
+    _, _, width, height = page.bound()
+    page_model = PdfPageRecord(page_number=num_page + 1,
+                               page_height=height,
+                               page_width=width,
+                               page_elements=element_list_res,
+                               table_skipped=table_skipped)
+
+    if stats is not None:
+        stats.count('blocks', len(block_lst))
+        stats.count('elements', len(element_list_res))
+        for element in element_list_res:
+            stats.count(element.element_type.value + 's')
+        stats.count('table_skipped', int(table_skipped))
+        stats.end_page()
+    return page_model
+
+
+def parse_page_range(path: Union[str, bytes], start: int, end: int,
+                     image_mode: ImageMode = ImageMode.inline,
+                     table_strategy: TableStrategy = TableStrategy.auto) -> List[PdfPageRecord]:
+    """
+    解析pdf中[start, end)范围内的页，每次调用独立打开文档，供多进程解析使用
+    :param path:
+    :param start: 起始页索引，从0开始
+    :param end: 结束页索引（不包含）
+    :param image_mode: 图片处理方式
+    :param table_strategy: 表格识别策略
+    :return:
+    """
+    return parse_page_list(path, range(start, end), image_mode=image_mode, table_strategy=table_strategy)
+
+
+def parse_page_list(path: Union[str, bytes], page_indices: Iterable[int],
+                    image_mode: ImageMode = ImageMode.inline,
+                    table_strategy: TableStrategy = TableStrategy.auto,
+                    stats: Optional[ParseStats] = None) -> List[PdfPageRecord]:
+    """
+    解析pdf中指定的页，只加载这些页，每次调用独立打开文档，供多进程解析使用
+    :param path: pdf路径或pdf内容
+    :param page_indices: 页索引，从0开始
+    :param image_mode: 图片处理方式
+    :param table_strategy: 表格识别策略
+    :param stats: 统计各阶段耗时、数量，为None时不统计
     :return:
     """
     page_lst = []
-    with fitz.open(path) as pdf:
-        for num_page, page in enumerate(pdf):
-            blocks = page.get_text("dict").get('blocks')
-            block_lst = []
-            for block in blocks:
-                block_lst.append(parse_block_content(block))
-
-            tabs = page.find_tables()
-            table_lst = []
-            for i, tab in enumerate(tabs):
-                bbox = tab.bbox
-                tab_value = tab.extract()
-                table_lst.append({
-                    'bbox': bbox,
-                    'text': tab_value,
-                    'block_lst': [],
-                    'table_no': i,
-                    'is_nest': 0,
-                    'text_dict': dict()
-                })
-
-            # 处理表格嵌套的问题
-            table_lst = deal_table_nest(table_lst)
-
-            # 处理block_lst包含的表格
-            element_lst = deal_block_include_table(block_lst, table_lst)
-
-            # 格式化element_lst
-            element_list_res = format_element_lst(element_lst, table_lst)
-
-            _, _, width, height = page.bound()
-            page_model = PdfPage(page_number=num_page + 1,
-                                 page_height=height,
-                                 page_width=width,
-                                 page_elements=element_list_res)
-            page_lst.append(page_model)
+    with stats_stage(stats, 'open'):
+        pdf = open_pdf(path)
+    with pdf:
+        for num_page in page_indices:
+            with stats_stage(stats, 'load_page'):
+                page = pdf[num_page]
+            page_lst.append(parse_page(page, num_page, image_mode=image_mode,
+                                       table_strategy=table_strategy, stats=stats))
+    return page_lst
+
+
+def _parse_page_list_with_stats(path: Union[str, bytes], page_indices: Iterable[int],
+                                image_mode: ImageMode, table_strategy: TableStrategy,
+                                trace_memory: bool) -> Tuple[List[PdfPageRecord], ParseStats]:
+    # 工作进程中单独统计，结果返回给主进程合并
+    stats = ParseStats(trace_memory=trace_memory)
+    stats.start()
+    page_lst = parse_page_list(path, page_indices, image_mode=image_mode, table_strategy=table_strategy, stats=stats)
+    stats.stop()
+    return page_lst, stats
+
+
+def resolve_pages(pages: Union[str, int, Iterable[int], None], page_count: int) -> List[int]:
+    """
+    将页码选择解析为升序、去重的页索引列表，超出文档页数的页码忽略
+
+    :param pages: 页码从1开始，可以是"1-20,45"、"50-"（到最后一页）形式的字符串，单个页码或页码列表；为None时选择全部页
+    :param page_count: 文档页数
+    :return: 页索引，从0开始
+    """
+    if pages is None:
+        return list(range(page_count))
+
+    if isinstance(pages, int):
+        page_numbers = [pages]
+    elif isinstance(pages, str):
+        page_numbers = []
+        for part in pages.split(','):
+            part = part.strip()
+            if not part:
+                continue
+            if '-' in part:
+                start, _, end = part.partition('-')
+                start = int(start) if start.strip() else 1
+                end = int(end) if end.strip() else page_count
+                if start > end:
+                    raise ValueError(f'页码范围错误：{part}')
+                page_numbers.extend(range(start, min(end, page_count) + 1))
+            else:
+                page_numbers.append(int(part))
+    else:
+        page_numbers = list(pages)
+
+    invalid = [n for n in page_numbers if n < 1 or n > page_count]
+    if invalid:
+        logger.warning(f'忽略超出页数范围的页码：{invalid[:10]}，文档页数：{page_count}')
+    return sorted({n - 1 for n in page_numbers if 1 <= n <= page_count})
+
+
+def split_page_ranges(page_count: int, workers: int) -> List[Tuple[int, int]]:
+    """
+    将页数尽量均匀地切分为workers个连续区间
+    :param page_count:
+    :param workers:
+    :return:
+    """
+    workers = max(1, min(workers, page_count))
+    step, rest = divmod(page_count, workers)
+    ranges = []
+    start = 0
+    for i in range(workers):
+        end = start + step + (1 if i < rest else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def _iter_parse_pages(path: Union[str, bytes], workers: int = 1,
+                      image_mode: ImageMode = ImageMode.inline,
+                      table_strategy: TableStrategy = TableStrategy.auto,
+                      page_indices: Optional[Sequence[int]] = None,
+                      stats: Optional[ParseStats] = None) -> Iterator[PdfPageRecord]:
+    if workers > 1:
+        if page_indices is None:
+            with open_pdf(path) as pdf:
+                page_indices = range(pdf.page_count)
+        # 选中的页按顺序切分为连续的几段，分配给各进程
+        ranges = split_page_ranges(len(page_indices), workers)
+
+        with ProcessPoolExecutor(max_workers=len(ranges)) as executor:
+            if stats is None:
+                futures = [executor.submit(parse_page_list, path, page_indices[start:end], image_mode, table_strategy)
+                           for start, end in ranges]
+                for future in futures:
+                    yield from future.result()
+            else:
+                futures = [executor.submit(_parse_page_list_with_stats, path, page_indices[start:end],
+                                           image_mode, table_strategy, stats.trace_memory)
+                           for start, end in ranges]
+                for future in futures:
+                    page_lst, worker_stats = future.result()
+                    stats.merge(worker_stats)
+                    yield from page_lst
+    else:
+        with stats_stage(stats, 'open'):
+            pdf = open_pdf(path)
+        with pdf:
+            if page_indices is None:
+                page_indices = range(pdf.page_count)
+            for num_page in page_indices:
+                with stats_stage(stats, 'load_page'):
+                    page = pdf[num_page]
+                yield parse_page(page, num_page, image_mode=image_mode, table_strategy=table_strategy, stats=stats)
+
+
+def _log_table_skipped(page_iter: Iterator[PdfPageRecord]) -> Iterator[PdfPageRecord]:
+    # 统计跳过表格识别的页数，全部页返回后输出
+    page_count, skipped = 0, 0
+    for page_model in page_iter:
+        page_count += 1
+        skipped += page_model.table_skipped
+        yield page_model
+    logger.debug(f'跳过表格识别页数：{skipped}/{page_count}')
+
+
+def _iter_parse_selected_pages(path: Union[str, bytes], workers: int, image_mode: ImageMode,
+                               table_strategy: TableStrategy, pages: Union[str, int, Iterable[int], None],
+                               stats: Optional[ParseStats]) -> Iterator[PdfPageRecord]:
+    # 未命中缓存时解析，选择了部分页时先打开pdf解析页码
+    page_indices = None
+    if pages is not None:
+        with open_pdf(path) as pdf:
+            page_indices = resolve_pages(pages, pdf.page_count)
+    yield from _log_table_skipped(_iter_parse_pages(path, workers=workers, image_mode=image_mode,
+                                                    table_strategy=table_strategy, page_indices=page_indices,
+                                                    stats=stats))
+
+
+def _pages_cache_option(pages: Union[str, int, Iterable[int]]) -> Union[str, List[int]]:
+    # 页码选择在缓存key中的表示，与文档页数无关
+    if isinstance(pages, str):
+        return re.sub(r'\s+', '', pages)
+    if isinstance(pages, int):
+        return [pages]
+    return sorted(set(pages))
+
+
+def _iter_cached_pages(cache, key: str, positions: Optional[Sequence[int]], stats: Optional[ParseStats],
+                       parse_from: Callable[[int], Iterator[PdfPageRecord]]) -> Iterator[PdfPageRecord]:
+    # 读取过程中该条缓存被淘汰（其他进程写入时触发）时按未命中处理，由parse_from解析尚未返回的页
+    logger.debug(f'命中解析缓存：{key}')
+    count = 0
+    try:
+        for page_model in cache.iter_pages(key, positions):
+            if stats is not None:
+                stats.count('cache_pages')
+            count += 1
+            yield page_model
+    except FileNotFoundError:
+        logger.debug(f'解析缓存已被淘汰：{key}，从第{count + 1}个选中的页开始解析')
+        yield from parse_from(count)
+
+
+def iter_page_records(path: PdfSource, workers: int = 1, use_cache: bool = True,
+                      image_mode: Union[str, ImageMode] = IMAGE_MODE,
+                      table_strategy: Union[str, TableStrategy] = TABLE_STRATEGY,
+                      pages: Union[str, int, Iterable[int], None] = None,
+                      stats: Optional[ParseStats] = None) -> Iterator[PdfPageRecord]:
+    """
+    逐页解析pdf，返回PdfPageRecord，每解析完一页即返回，不在内存中保留整份文档的解析结果；
+    配置了PARSE_CACHE_DIR时，相同内容的文件直接从缓存读取，不再调用PyMuPDF；
+    已缓存整个文档时，任意页码选择都从该缓存读取
+    :param path: pdf路径、pdf内容（bytes、bytearray、memoryview、mmap）或以二进制模式打开的文件对象
+    :param workers: 并行解析的进程数，大于1时按连续页区间分配给各进程，按页序依次返回
+    :param use_cache: 是否使用解析缓存
+    :param image_mode: 图片处理方式，skip：不输出图片；reference：只输出ImageRef，通过load_image读取；inline：输出图片内容
+    :param table_strategy: 表格识别策略，always：每页都识别；auto：页内没有可构成表格的线条时跳过；never：不识别
+    :param pages: 要解析的页码，从1开始，如"1-20,45"，为None时解析全部页；未选中的页不会被加载，输出保留原页码
+    :param stats: 统计各阶段耗时、数量，为None时不统计
+    :return:
+    """
+    image_mode = ImageMode(image_mode)
+    table_strategy = TableStrategy(table_strategy)
+    with stats_stage(stats, 'load_source'):
+        path = load_pdf_source(path)
+    if pages is not None and not isinstance(pages, (str, int)):
+        # 页码列表在生成缓存key和解析页码时各用一次
+        pages = list(pages)
+    cache = get_parse_cache() if use_cache else None
+    if cache is None:
+        yield from _iter_parse_selected_pages(path, workers, image_mode, table_strategy, pages, stats)
+        return
+
+    options = {'image_mode': image_mode.value, 'table_strategy': table_strategy.value}
+    with stats_stage(stats, 'cache_key'):
+        sha256 = source_sha256(path)
+        doc_key = cache.make_key(path, options=options, sha256=sha256)
+
+    def _parse_from(skip: int) -> Iterator[PdfPageRecord]:
+        with open_pdf(path) as pdf:
+            page_indices = resolve_pages(pages, pdf.page_count)[skip:]
+        yield from _log_table_skipped(_iter_parse_pages(path, workers=workers, image_mode=image_mode,
+                                                        table_strategy=table_strategy, page_indices=page_indices,
+                                                        stats=stats))
+
+    # 整个文档的缓存可以满足任意页码选择，页码按缓存中记录的页数解析，不需要打开pdf
+    try:
+        doc_meta = cache.meta(doc_key) if cache.has(doc_key) else None
+    except FileNotFoundError:
+        doc_meta = None
+    if doc_meta is not None:
+        page_indices = None if pages is None else resolve_pages(pages, doc_meta['page_count'])
+        yield from _iter_cached_pages(cache, doc_key, page_indices, stats, _parse_from)
+        return
+
+    key = doc_key
+    if pages is not None:
+        # 只解析部分页时以页码选择本身为key，命中时同样不需要打开pdf
+        with stats_stage(stats, 'cache_key'):
+            key = cache.make_key(path, options=dict(options, pages=_pages_cache_option(pages)), sha256=sha256)
+        if cache.has(key):
+            yield from _iter_cached_pages(cache, key, None, stats, _parse_from)
+            return
+
+    writer = cache.writer(key)
+    try:
+        for page_model in _iter_parse_selected_pages(path, workers, image_mode, table_strategy, pages, stats):
+            writer.add(page_model)
+            yield page_model
+    except BaseException:
+        writer.abort()
+        raise
+    writer.commit()
+
+
+def iter_pdf_pages(path: PdfSource, workers: int = 1, use_cache: bool = True,
+                   image_mode: Union[str, ImageMode] = IMAGE_MODE,
+                   table_strategy: Union[str, TableStrategy] = TABLE_STRATEGY,
+                   pages: Union[str, int, Iterable[int], None] = None,
+                   stats: Optional[ParseStats] = None) -> Iterator[PdfPage]:
+    """
+    逐页解析pdf，每解析完一页即返回PdfPage，不在内存中保留整份文档的解析结果
+    :param path: pdf路径、pdf内容或以二进制模式打开的文件对象
+    :param workers: 并行解析的进程数，大于1时按连续页区间分配给各进程，按页序依次返回
+    :param use_cache: 是否使用解析缓存
+    :param image_mode: 图片处理方式
+    :param table_strategy: 表格识别策略
+    :param pages: 要解析的页码，从1开始，如"1-20,45"，为None时解析全部页
+    :param stats: 统计各阶段耗时、数量，为None时不统计
+    :return:
+    """
+    for page_record in iter_page_records(path, workers=workers, use_cache=use_cache, image_mode=image_mode,
+                                         table_strategy=table_strategy, pages=pages, stats=stats):
+        with stats_stage(stats, 'model'):
+            page_model = page_record.to_model()
+        yield page_model
 
+
+def get_pdf_name(path: PdfSource) -> str:
+    """
+    获取pdf名称；文件对象取其name或filename属性的文件名，pdf内容以内容的sha256前16位命名
+
+    :param path:
+    :return:
+    """
     pdf_name = ''
     if isinstance(path, str):
         pdf_name = Path(path).name
     elif isinstance(path, Path):
         pdf_name = path.name
+    elif isinstance(path, (bytes, bytearray, memoryview, mmap.mmap)):
+        pdf_name = f'{hashlib.sha256(path).hexdigest()[:16]}.pdf'
+    elif isinstance(path, io.BytesIO):
+        pdf_name = f'{hashlib.sha256(path.getbuffer()).hexdigest()[:16]}.pdf'
+    else:
+        name = getattr(path, 'filename', None) or getattr(path, 'name', None)
+        if isinstance(name, str):
+            pdf_name = Path(name).name
+    return pdf_name
+
+
+def parse_pdf(path: PdfSource, workers: int = 1, use_cache: bool = True,
+              image_mode: Union[str, ImageMode] = IMAGE_MODE,
+              table_strategy: Union[str, TableStrategy] = TABLE_STRATEGY,
+              pages: Union[str, int, Iterable[int], None] = None,
+              pdf_name: Optional[str] = None,
+              stats: Optional[ParseStats] = None) -> AllPdfPage:
+    """
+    解析pdf
+    :param path: pdf路径、pdf内容（bytes、bytearray、memoryview、mmap）或以二进制模式打开的文件对象
+    :param workers: 并行解析的进程数，大于1时按连续页区间分配给各进程，结果与串行解析一致
+    :param use_cache: 是否使用解析缓存
+    :param image_mode: 图片处理方式，skip：不输出图片；reference：只输出ImageRef，通过load_image读取；inline：输出图片内容
+    :param table_strategy: 表格识别策略，always：每页都识别；auto：页内没有可构成表格的线条时跳过；never：不识别
+    :param pages: 要解析的页码，从1开始，如"1-20,45"，为None时解析全部页；输出保留原页码
+    :param pdf_name: pdf名称，为None时根据输入获取，见get_pdf_name
+    :param stats: 统计各阶段耗时、数量、内存，见ParseStats，为None时不统计
+    :return:
+    """
+    if stats is not None:
+        stats.start()
+    if pdf_name is None:
+        pdf_name = get_pdf_name(path)
+    page_lst = list(iter_pdf_pages(path, workers=workers, use_cache=use_cache, image_mode=image_mode,
+                                   table_strategy=table_strategy, pages=pages, stats=stats))
+    if stats is not None:
+        stats.stop()
 
     all_pdf_pages = AllPdfPage(pdf_name=pdf_name,
                                pdf_pages=page_lst)
     return all_pdf_pages
 
 
-def save_pdf_data(page_lst: List[PdfPage], path: Union[str, Path] = 'test.txt') -> None:
+def write_txt_page(page: Union[PdfPage, PdfPageRecord], write: Callable[[str], object]) -> None:
     """
-    将解析结果保存成txt文件
-    :param page_lst:
+    将一页解析结果按save_pdf_data的文本格式写入write，如文件的write
+    :param page:
+    :param write:
+    :return:
+    """
+    write(f'page_number: {page.page_number}\n')
+    for page_element in page.page_elements:
+        if page_element.element_type == ElementType.text:
+            write(page_element.element_value)
+        elif page_element.element_type == ElementType.image:
+            write('========= image ===========')
+            write('\n')
+        elif page_element.element_type == ElementType.table:
+            # page_element.element_value列表为一个二维列表，转换为md的表格格式
+            table_lst = page_element.element_value
+            table_fa = [i if i else '' for i in table_lst[0]]
+            table_header = '|'.join(['-' * 10] * len(table_fa)) + '\n'
+            write(table_header)
+            # 表头内容
+            table_header_content = '|'.join(table_fa) + '\n'
+            write(table_header_content)
+            write(table_header)
+            # 表格内容
+            for table_content in table_lst[1:]:
+                table_content = [i if i else '' for i in table_content]
+                table_content = '|'.join(table_content) + '\n'
+                write(table_content)
+
+
+def save_pdf_data(page_lst: Iterable[PdfPage], path: Union[str, Path] = 'test.txt') -> None:
+    """
+    将解析结果保存成txt文件，其他输出格式、压缩见utils_writer
+    :param page_lst: 页列表，也可以是iter_pdf_pages返回的迭代器，逐页写入
     :param path:
     :return:
     """
     with open(path, 'w') as f:
         for page in page_lst:
-            page_number = page.page_number
-            page_elements = page.page_elements
-            f.write(f'page_number: {page_number}\n')
-            for page_element in page_elements:
-                if page_element.element_type == ElementType.text:
-                    f.write(page_element.element_value)
-                elif page_element.element_type == ElementType.image:
-                    f.write('========= image ===========')
-                    f.write('\n')
-                elif page_element.element_type == ElementType.table:
-                    # page_element.element_value列表为一个二维列表，转换为md的表格格式
-                    table_lst = page_element.element_value
-                    table_fa = [i if i else '' for i in table_lst[0]]
-                    table_header = '|'.join(['-' * 10] * len(table_fa)) + '\n'
-                    f.write(table_header)
-                    # 表头内容
-                    table_header_content = '|'.join(table_fa) + '\n'
-                    f.write(table_header_content)
-                    f.write(table_header)
-                    # 表格内容
-                    for table_content in table_lst[1:]:
-                        table_content = [i if i else '' for i in table_content]
-                        table_content = '|'.join(table_content) + '\n'
-                        f.write(table_content)
-
+            write_txt_page(page, f.write)
@@ -0,0 +1,349 @@
+
+import json
+import time
+import signal
+import asyncio
+import threading
+from typing import Optional, Iterator, AsyncIterator, Callable, Dict
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import fitz
+from loguru import logger
+
+from utils.utils_async import AsyncPdfParser
+from utils.utils_pymupdf_parse import ImageMode, TableStrategy
+from utils.utils_writer import write_jsonl_page
+from utils.utils_stats import ParseStats
+from utils.env import SERVER_HOST, SERVER_PORT, SERVER_WORKERS, SERVER_QUEUE_SIZE, SERVER_MAX_BODY_SIZE, \
+    ASYNC_TIMEOUT
+
+_END = object()
+
+
+class ParseService:
+    """
+    HTTP服务使用的解析服务：工作进程池常驻并预先启动，同时解析的文档数为workers，
+    最多再有queue_size个请求排队，超出时拒绝；解析结果逐页、逐批返回
+    """
+
+    def __init__(self, workers: int = SERVER_WORKERS,
+                 queue_size: int = SERVER_QUEUE_SIZE,
+                 timeout: Optional[float] = ASYNC_TIMEOUT or None,
+                 max_body_size: int = SERVER_MAX_BODY_SIZE):
+        """
+        :param workers: 工作进程数
+        :param queue_size: 排队请求数上限
+        :param timeout: 单个文档的默认超时时间（秒），为None时不限制
+        :param max_body_size: 请求体（pdf）大小上限
+        """
+        self.workers = workers
+        self.queue_size = queue_size
+        self.max_body_size = max_body_size
+        self.parser = AsyncPdfParser(max_concurrency=workers, executor_type='process', timeout=timeout)
+        # 解析在独立线程的事件循环中调度，请求处理线程通过_iter_sync取结果
+        self._loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(target=self._loop.run_forever, name='parse_service_loop', daemon=True)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.start_time = time.time()
+        self.counts: Dict[str, int] = {
+            'requests': 0, 'rejected': 0, 'documents': 0, 'failed': 0, 'pages': 0, 'chunks': 0, 'bytes_received': 0,
+        }
+        self.responses: Dict[int, int] = dict()
+        self.parse_seconds = 0.0
+
+    def start(self) -> None:
+        self._loop_thread.start()
+        self.parser.warm_up()
+        self.start_time = time.time()
+
+    def close(self) -> None:
+        self.parser.shutdown(wait=False)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def try_acquire(self) -> bool:
+        """ 占用一个请求名额，正在解析和排队的请求已满时返回False """
+        with self._lock:
+            if self.in_flight >= self.workers + self.queue_size:
+                self.counts['rejected'] += 1
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def count(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self.counts[name] += value
+
+    def record(self, status: int, seconds: Optional[float] = None) -> None:
+        with self._lock:
+            self.responses[status] = self.responses.get(status, 0) + 1
+            if seconds is not None:
+                self.parse_seconds += seconds
+
+    def _iter_sync(self, item_aiter: AsyncIterator) -> Iterator:
+        # 在请求处理线程中逐个取异步迭代器的结果；提前退出时关闭迭代器，解析随之停止
+        try:
+            while True:
+                try:
+                    item = asyncio.run_coroutine_threadsafe(item_aiter.__anext__(), self._loop).result()
+                except StopAsyncIteration:
+                    return
+                yield item
+        finally:
+            asyncio.run_coroutine_threadsafe(item_aiter.aclose(), self._loop).result()
+
+    def iter_pdf_pages(self, data: bytes, timeout: Optional[float] = None, **kwargs) -> Iterator:
+        return self._iter_sync(self.parser.iter_pdf_pages(data, timeout=timeout, **kwargs))
+
+    def iter_pdf_chunks(self, data: bytes, timeout: Optional[float] = None, **kwargs) -> Iterator:
+        return self._iter_sync(self.parser.iter_pdf_chunks(data, timeout=timeout, **kwargs))
+
+    def health(self) -> dict:
+        running = self.parser.running
+        return {
+            'status': 'ok',
+            'workers': self.workers,
+            'running': running,
+            'queue_depth': max(self.in_flight - running, 0),
+            'queue_size': self.queue_size,
+        }
+
+    def metrics(self) -> dict:
+        uptime = max(time.time() - self.start_time, 1e-9)
+        with self._lock:
+            counts = dict(self.counts)
+            responses = {str(status): count for status, count in sorted(self.responses.items())}
+            parse_seconds = self.parse_seconds
+            in_flight = self.in_flight
+        finished = counts['documents'] + counts['failed']
+        return dict(self.health(),
+                    in_flight=in_flight,
+                    uptime_seconds=round(uptime, 2),
+                    responses=responses,
+                    pages_per_second=round(counts['pages'] / uptime, 2),
+                    documents_per_second=round(counts['documents'] / uptime, 4),
+                    avg_document_seconds=round(parse_seconds / finished, 4) if finished else 0.0,
+                    **counts)
+
+
+def _render_page(page) -> str:
+    buffer = []
+    write_jsonl_page(page, buffer.append)
+    return ''.join(buffer)
+
+
+def _render_chunk(doc) -> str:
+    return json.dumps({'page_content': doc.page_content, 'metadata': doc.metadata}, ensure_ascii=False) + '\n'
+
+
+class ParseRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET /health：服务状态、排队数
+    GET /metrics：请求数、拒绝数、吞吐等统计
+    POST /parse：请求体为pdf内容，逐页返回NDJSON，每个元素一行，格式见write_jsonl_page；
+        查询参数pages、image_mode（默认reference，不返回图片内容）、table_strategy、workers、timeout
+    POST /chunk：请求体为pdf内容，逐批返回NDJSON，每个文档一行；
+        查询参数pages、ud_chunk_size、image_mode（默认reference）、table_strategy、workers、timeout
+    """
+    protocol_version = 'HTTP/1.1'
+    server_version = 'PdfParseServer'
+
+    @property
+    def service(self) -> ParseService:
+        return self.server.service
+
+    def log_message(self, format, *args):
+        logger.info(f'{self.address_string()} {format % args}')
+
+    def _send_json(self, status: int, data: dict, headers: Optional[dict] = None) -> None:
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or dict()).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error_json(self, status: int, error: str, close: bool = False) -> None:
+        headers = {'Connection': 'close'} if close else None
+        if close:
+            self.close_connection = True
+        self._send_json(status, {'error': error}, headers)
+
+    def _fail(self, status: int, error: str, close: bool = False) -> None:
+        """ 解析开始前的错误：计入失败数并返回错误 """
+        self.service.count('failed')
+        self.service.record(status)
+        self._send_error_json(status, error, close=close)
+
+    def _write_chunk(self, text: str) -> None:
+        data = text.encode('utf-8')
+        self.wfile.write(f'{len(data):X}\r\n'.encode('ascii') + data + b'\r\n')
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == '/health':
+            self._send_json(200, self.service.health())
+        elif path == '/metrics':
+            self._send_json(200, self.service.metrics())
+        else:
+            self._send_error_json(404, f'未知路径：{path}')
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path not in ('/parse', '/chunk'):
+            self._send_error_json(404, f'未知路径：{url.path}', close=True)
+            return
+        # 每个解析请求计入requests，之后计入rejected（503）、failed或documents之一
+        self.service.count('requests')
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            self._fail(400, f'Content-Length不是整数：{self.headers.get("Content-Length")}', close=True)
+            return
+        if length <= 0:
+            self._fail(411, '请求体需要为pdf内容，并指定Content-Length', close=True)
+            return
+        if length > self.service.max_body_size:
+            self._fail(413, f'pdf大小超过上限：{self.service.max_body_size}', close=True)
+            return
+        # 请求已满时直接拒绝，不读取请求体
+        if not self.service.try_acquire():
+            self.service.record(503)
+            self._send_json(503, {'error': '服务繁忙，请稍后重试'}, {'Retry-After': '1', 'Connection': 'close'})
+            self.close_connection = True
+            return
+        try:
+            data = self.rfile.read(length)
+            self.service.count('bytes_received', len(data))
+            try:
+                query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+                timeout = float(query['timeout']) if 'timeout' in query else None
+                workers = int(query.get('workers', 1))
+                if workers < 1:
+                    raise ValueError(f'workers需要大于0：{workers}')
+                kwargs = dict(pages=query.get('pages'), workers=workers,
+                              image_mode=ImageMode(query.get('image_mode', ImageMode.reference)),
+                              table_strategy=TableStrategy(query.get('table_strategy', TableStrategy.auto)))
+                if url.path == '/chunk':
+                    kwargs['ud_chunk_size'] = int(query['ud_chunk_size']) if 'ud_chunk_size' in query else None
+            except ValueError as e:
+                self._fail(400, str(e))
+                return
+            # 页数从stats取，/parse、/chunk按同样的方式统计
+            stats = ParseStats()
+            if url.path == '/parse':
+                item_iter = self.service.iter_pdf_pages(data, timeout=timeout, stats=stats, **kwargs)
+                self._stream_ndjson(item_iter, _render_page, None, stats)
+            else:
+                item_iter = self.service.iter_pdf_chunks(data, timeout=timeout, stats=stats, **kwargs)
+                self._stream_ndjson(item_iter, _render_chunk, 'chunks', stats)
+        finally:
+            self.service.release()
+
+    def _stream_ndjson(self, item_iter: Iterator, render: Callable[[object], str], count_name: Optional[str],
+                       stats: ParseStats) -> None:
+        """
+        以chunked编码逐个返回结果；等到第一个结果后才发送响应头，解析开始前的错误返回对应的状态码，
+        之后的错误写为最后一行{"error": ...}；文档解析完后按stats统计页数
+        """
+        start_time = time.time()
+        try:
+            item = next(item_iter, _END)
+        except TimeoutError:
+            self.service.count('failed')
+            self.service.record(504, time.time() - start_time)
+            self._send_error_json(504, '解析超时')
+            return
+        except (ValueError, fitz.FileDataError) as e:
+            self.service.count('failed')
+            self.service.record(400, time.time() - start_time)
+            self._send_error_json(400, f'{type(e).__name__}: {e}')
+            return
+        except Exception as e:
+            logger.exception(e)
+            self.service.count('failed')
+            self.service.record(500, time.time() - start_time)
+            self._send_error_json(500, f'{type(e).__name__}: {e}')
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson; charset=utf-8')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        status = 200
+        try:
+            while item is not _END:
+                self._write_chunk(render(item))
+                if count_name is not None:
+                    self.service.count(count_name)
+                item = next(item_iter, _END)
+            self.service.count('documents')
+            self.service.count('pages', stats.page_count)
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端断开，关闭迭代器停止解析
+            item_iter.close()
+            self.close_connection = True
+            self.service.count('failed')
+            self.service.record(499, time.time() - start_time)
+            return
+        except Exception as e:
+            status = 504 if isinstance(e, TimeoutError) else 500
+            self.service.count('failed')
+            self._write_chunk(json.dumps({'error': f'{type(e).__name__}: {e}'}, ensure_ascii=False) + '\n')
+        self.wfile.write(b'0\r\n\r\n')
+        self.service.record(status, time.time() - start_time)
+
+
+def create_server(service: ParseService, host: str = SERVER_HOST, port: int = SERVER_PORT) -> ThreadingHTTPServer:
+    """
+    创建HTTP服务，由调用方执行serve_forever；port为0时使用系统分配的端口，见server.server_port
+    :param service: 已启动的解析服务
+    :param host:
+    :param port:
+    :return:
+    """
+    server = ThreadingHTTPServer((host, port), ParseRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def serve(host: str = SERVER_HOST,
+          port: int = SERVER_PORT,
+          workers: int = SERVER_WORKERS,
+          queue_size: int = SERVER_QUEUE_SIZE,
+          timeout: Optional[float] = ASYNC_TIMEOUT or None,
+          max_body_size: int = SERVER_MAX_BODY_SIZE) -> None:
+    """
+    启动HTTP解析服务，阻塞直到Ctrl+C或收到SIGTERM；服务没有鉴权，默认只监听本机
+    :param host:
+    :param port:
+    :param workers: 工作进程数
+    :param queue_size: 排队请求数上限，超出时返回503
+    :param timeout: 单个文档的默认超时时间（秒），为None时不限制
+    :param max_body_size: 请求体（pdf）大小上限
+    :return:
+    """
+    if host not in ('127.0.0.1', 'localhost', '::1'):
+        logger.warning(f'服务没有鉴权，监听{host}时其他机器也可以访问')
+    service = ParseService(workers=workers, queue_size=queue_size, timeout=timeout, max_body_size=max_body_size)
+    service.start()
+    server = create_server(service, host, port)
+    # serve_forever所在线程不能调用shutdown，在新线程中停止
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+    logger.info(f'解析服务已启动：http://{host}:{server.server_port}，工作进程数：{workers}，排队上限：{queue_size}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        logger.info('解析服务已停止')
@@ -1,7 +1,9 @@
 
 import re
 import copy
-from typing import List, Callable, Iterable, Optional
+from collections import deque
+from itertools import accumulate
+from typing import List, Callable, Iterable, Optional, Deque, Tuple
 from loguru import logger
 
 from pydantic import BaseModel, Field
@@ -58,6 +60,8 @@ class RecursiveCharacterTextSplitter:
         self._strip_whitespace = strip_whitespace
         self._length_function = length_function
         self._add_start_index = add_start_index
+        # 预编译的分隔符正则，key为分隔符
+        self._separator_patterns = dict()
 
     def _init_separators(self, separators):
         _separators = self.default_separators
@@ -73,7 +77,7 @@ class RecursiveCharacterTextSplitter:
                     _separators.append(separator)
         return _separators
 
-    def _join_docs(self, docs: List[str], separator: str) -> Optional[str]:
+    def _join_docs(self, docs: Iterable[str], separator: str) -> Optional[str]:
         text = separator.join(docs)
         if self._strip_whitespace:
             text = text.strip()
@@ -82,16 +86,51 @@ class RecursiveCharacterTextSplitter:
         else:
             return text
 
-    def _merge_splits(self, splits: Iterable[str], separator: str) -> List[str]:
+    def _join_docs_with_offset(self, docs: Deque[str], offsets: Deque[int],
+                               separator: str) -> Optional[Tuple[str, int]]:
+        # 与_join_docs一致，同时返回结果在原文本中的起始位置
+        text = self._join_docs(docs, separator)
+        if text is None:
+            return None
+
+        offset = offsets[0]
+        if self._strip_whitespace:
+            # 跳过开头被去掉的空白，定位到第一个非空白字符所在的片段或分隔符
+            separator_stripped = separator.lstrip()
+            for d, d_offset in zip(docs, offsets):
+                d_stripped = d.lstrip()
+                if d_stripped:
+                    offset = d_offset + len(d) - len(d_stripped)
+                    break
+                if separator_stripped:
+                    offset = d_offset + len(d) + len(separator) - len(separator_stripped)
+                    break
+        return text, offset
+
+    def _merge_splits(self, splits: Iterable[str], separator: str,
+                      lengths: Optional[Iterable[int]] = None) -> List[str]:
+        splits = list(splits)
+        merged = self._merge_splits_with_offsets(splits, [0] * len(splits), separator, lengths)
+        return [doc for doc, _ in merged]
+
+    def _merge_splits_with_offsets(self, splits: Iterable[str], offsets: Iterable[int], separator: str,
+                                   lengths: Optional[Iterable[int]] = None) -> List[Tuple[str, int]]:
         # We now want to combine these smaller pieces into medium size
         # chunks to send to the LLM.
+        # offsets: 与splits对应的起始位置，合并后的文档起始位置为其第一个片段的起始位置
+        # lengths: 与splits对应的长度，已经计算过时传入，避免重复调用length_function
         separator_len = self._length_function(separator)
+        if lengths is None:
+            splits = list(splits)
+            lengths = [self._length_function(d) for d in splits]
 
         docs = []
-        current_doc: List[str] = []
+        # 用deque滑动重叠窗口，并缓存每个片段的长度，弹出时不再重新计算
+        current_doc: Deque[str] = deque()
+        current_len: Deque[int] = deque()
+        current_offset: Deque[int] = deque()
         total = 0
-        for d in splits:
-            _len = self._length_function(d)
+        for d, offset, _len in zip(splits, offsets, lengths):
             if (
                     total + _len + (separator_len if len(current_doc) > 0 else 0)
                     > self._chunk_size
@@ -102,7 +141,7 @@ class RecursiveCharacterTextSplitter:
                         f"which is longer than the specified {self._chunk_size}"
                     )
                 if len(current_doc) > 0:
-                    doc = self._join_docs(current_doc, separator)
+                    doc = self._join_docs_with_offset(current_doc, current_offset, separator)
                     if doc is not None:
                         docs.append(doc)
                     # Keep on popping if:
@@ -113,60 +152,129 @@ class RecursiveCharacterTextSplitter:
                             > self._chunk_size
                             and total > 0
                     ):
-                        total -= self._length_function(current_doc[0]) + (
+                        total -= current_len[0] + (
                             separator_len if len(current_doc) > 1 else 0
                         )
-                        current_doc = current_doc[1:]
+                        current_doc.popleft()
+                        current_len.popleft()
+                        current_offset.popleft()
             current_doc.append(d)
+            current_len.append(_len)
+            current_offset.append(offset)
             total += _len + (separator_len if len(current_doc) > 1 else 0)
-        doc = self._join_docs(current_doc, separator)
-        if doc is not None:
-            docs.append(doc)
+        if current_doc:
+            doc = self._join_docs_with_offset(current_doc, current_offset, separator)
+            if doc is not None:
+                docs.append(doc)
         return docs
 
+    def _get_separator_pattern(self, separator: str) -> re.Pattern:
+        pattern = self._separator_patterns.get(separator)
+        if pattern is None:
+            _separator = separator if self._is_separator_regex else re.escape(separator)
+            # The parentheses in the pattern keep the delimiters in the result.
+            pattern = re.compile(f"({_separator})" if self._keep_separator else _separator)
+            self._separator_patterns[separator] = pattern
+        return pattern
+
+    def _has_separator(self, text: str, separator: str) -> bool:
+        if self._is_separator_regex:
+            return self._get_separator_pattern(separator).search(text) is not None
+        return separator in text
+
+    def _split_text_with_separator(self, text: str, separator: str) -> List[str]:
+        """ 与_split_text_with_regex结果一致，普通分隔符直接用str.split，正则分隔符用预编译的正则 """
+        if not separator:
+            splits = list(text)
+        elif self._is_separator_regex:
+            _splits = self._get_separator_pattern(separator).split(text)
+            if self._keep_separator:
+                splits = [_splits[i] + _splits[i + 1] for i in range(0, len(_splits) - 1, 2)]  # 调整分割符到行末
+                if len(_splits) % 2 == 0:
+                    splits += _splits[-1:]
+                splits = splits + [_splits[-1]]  # 调整分割符到行末
+            else:
+                splits = _splits
+        else:
+            _splits = text.split(separator)
+            if self._keep_separator:
+                splits = [_s + separator for _s in _splits[:-1]]  # 调整分割符到行末
+                splits.append(_splits[-1])
+            else:
+                splits = _splits
+        return [s for s in splits if s != ""]
+
     def _split_text(self, text: str, separators: List[str]) -> List[str]:
         """Split incoming text and return chunks."""
+        return [chunk for chunk, _ in self._split_text_with_offsets(text, separators)]
+
+    def _split_text_with_offsets(self, text: str, separators: List[str]) -> List[Tuple[str, int]]:
+        """Split incoming text and return chunks with their start index in text."""
         final_chunks = []
         # Get appropriate separator to use
+        # 上一层只传入所选分隔符之后的分隔符，更靠前的分隔符在上一层文本中已确认不存在，片段无需再检查
         separator = separators[-1]
         new_separators = []
         for i, _s in enumerate(separators):
-            _separator = _s if self._is_separator_regex else re.escape(_s)
             if _s == "":
                 separator = _s
                 break
-            if re.search(_separator, text):
+            if self._has_separator(text, _s):
                 separator = _s
                 new_separators = separators[i + 1:]
                 break
 
-        _separator = separator if self._is_separator_regex else re.escape(separator)
-        splits = _split_text_with_regex(text, _separator, self._keep_separator)
+        splits = self._split_text_with_separator(text, separator)
+
+        if (self._keep_separator and not self._is_separator_regex) or not separator:
+            # 片段首尾相接，起始位置即之前片段的长度之和
+            offsets = list(accumulate(map(len, splits[:-1]), initial=0)) if splits else []
+        else:
+            # 片段按顺序出现在text中，从上一个片段的结束位置开始查找即可得到每个片段的起始位置
+            offsets = []
+            index = 0
+            for s in splits:
+                index = text.find(s, index)
+                offsets.append(index)
+                index += len(s)
 
         # Now go merging things, recursively splitting longer texts.
         _good_splits = []
+        _good_offsets = []
+        _good_lengths = []
         _separator = "" if self._keep_separator else separator
-        for s in splits:
-            if self._length_function(s) < self._chunk_size:
+        for s, offset in zip(splits, offsets):
+            _len = self._length_function(s)
+            if _len < self._chunk_size:
                 _good_splits.append(s)
+                _good_offsets.append(offset)
+                _good_lengths.append(_len)
             else:
                 if _good_splits:
-                    merged_text = self._merge_splits(_good_splits, _separator)
+                    merged_text = self._merge_splits_with_offsets(_good_splits, _good_offsets,
+                                                                  _separator, _good_lengths)
                     final_chunks.extend(merged_text)
                     _good_splits = []
+                    _good_offsets = []
+                    _good_lengths = []
                 if not new_separators:
-                    final_chunks.append(s)
+                    final_chunks.append((s, offset))
                 else:
-                    other_info = self._split_text(s, new_separators)
-                    final_chunks.extend(other_info)
+                    other_info = self._split_text_with_offsets(s, new_separators)
+                    final_chunks.extend((chunk, offset + start) for chunk, start in other_info)
         if _good_splits:
-            merged_text = self._merge_splits(_good_splits, _separator)
+            merged_text = self._merge_splits_with_offsets(_good_splits, _good_offsets,
+                                                          _separator, _good_lengths)
             final_chunks.extend(merged_text)
         return final_chunks
 
     def split_text(self, text: str) -> List[str]:
         return self._split_text(text, self._separators)
 
+    def split_text_with_offsets(self, text: str) -> List[Tuple[str, int]]:
+        """ 切割文本，返回切割后的文本及其在原文本中的起始位置 """
+        return self._split_text_with_offsets(text, self._separators)
+
     def create_documents(
             self, texts: List[str], metadatas: Optional[List[dict]] = None
     ) -> List[Document]:
@@ -174,11 +282,9 @@ class RecursiveCharacterTextSplitter:
         _metadatas = metadatas or [{}] * len(texts)
         documents = []
         for i, text in enumerate(texts):
-            index = -1
-            for chunk in self.split_text(text):
+            for chunk, index in self.split_text_with_offsets(text):
                 metadata = copy.deepcopy(_metadatas[i])
                 if self._add_start_index:
-                    index = text.find(chunk, index + 1)
                     metadata["start_index"] = index
                 new_doc = Document(page_content=chunk, metadata=metadata)
                 documents.append(new_doc)
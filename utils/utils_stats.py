@@ -0,0 +1,215 @@
+
+import sys
+import json
+import time
+import tracemalloc
+from pathlib import Path
+from contextlib import contextmanager, nullcontext
+from collections import defaultdict
+from typing import Dict, List, Optional, Union, ContextManager
+
+try:
+    # resource只在Unix下可用，Windows下不统计RSS峰值
+    import resource
+except ImportError:
+    resource = None
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """ 当前进程的RSS峰值（字节），不支持的平台返回None """
+    if resource is None:
+        return None
+    # Linux下ru_maxrss单位为KB，macOS下为字节
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+class ParseStats:
+    """
+    解析、切割流程的耗时、数量、内存统计，作为stats参数传给parse_pdf、parse_pdf_chunk等接口；
+    多进程解析时各工作进程分别统计，由主进程通过merge合并
+    """
+
+    def __init__(self, trace_memory: bool = False):
+        """
+        :param trace_memory: 是否用tracemalloc统计每页的Python内存分配峰值，开启后解析会明显变慢
+        """
+        self.trace_memory = trace_memory
+        # 阶段名 -> [耗时, 次数]
+        self.stages: Dict[str, List[float]] = defaultdict(lambda: [0.0, 0])
+        self.counts: Dict[str, int] = defaultdict(int)
+        self.pages: List[dict] = []
+        self.start_time: Optional[float] = None
+        self.end_time: Optional[float] = None
+        self.memory_peak = 0
+        self._page: Optional[dict] = None
+        self._page_start = 0.0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['stages'] = dict(self.stages)
+        state['counts'] = dict(self.counts)
+        return state
+
+    def __setstate__(self, state):
+        stages, counts = state.pop('stages'), state.pop('counts')
+        self.__dict__.update(state)
+        self.stages = defaultdict(lambda: [0.0, 0], stages)
+        self.counts = defaultdict(int, counts)
+
+    def start(self) -> None:
+        """ 开始统计，重复调用时以第一次为准 """
+        if self.start_time is None:
+            self.start_time = time.perf_counter()
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stop(self) -> None:
+        self.end_time = time.perf_counter()
+        if self.trace_memory and tracemalloc.is_tracing():
+            self.memory_peak = max(self.memory_peak, tracemalloc.get_traced_memory()[1])
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        统计一个阶段的耗时，在页内调用时同时计入该页
+        :param name: 阶段名
+        :return:
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            stage = self.stages[name]
+            stage[0] += seconds
+            stage[1] += 1
+            if self._page is not None:
+                page_stages = self._page['stages']
+                page_stages[name] = page_stages.get(name, 0.0) + seconds
+
+    def count(self, name: str, value: int = 1) -> None:
+        self.counts[name] += value
+        if self._page is not None:
+            self._page['counts'][name] = self._page['counts'].get(name, 0) + value
+
+    def begin_page(self, page_number: int) -> None:
+        self._page = {'page_number': page_number, 'stages': dict(), 'counts': dict()}
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        self._page_start = time.perf_counter()
+
+    def end_page(self) -> None:
+        page = self._page
+        page['seconds'] = time.perf_counter() - self._page_start
+        if self.trace_memory and tracemalloc.is_tracing():
+            page['memory_peak'] = tracemalloc.get_traced_memory()[1]
+            self.memory_peak = max(self.memory_peak, page['memory_peak'])
+        self.pages.append(page)
+        self._page = None
+
+    def merge(self, other: 'ParseStats') -> None:
+        """
+        合并工作进程的统计结果
+        :param other:
+        :return:
+        """
+        for name, (seconds, count) in other.stages.items():
+            stage = self.stages[name]
+            stage[0] += seconds
+            stage[1] += count
+        for name, value in other.counts.items():
+            self.counts[name] += value
+        self.pages.extend(other.pages)
+        self.memory_peak = max(self.memory_peak, other.memory_peak)
+        # 在其他进程中完成的整个解析，取其起止时间
+        if other.start_time is not None and (self.start_time is None or other.start_time < self.start_time):
+            self.start_time = other.start_time
+        if other.end_time is not None and (self.end_time is None or other.end_time > self.end_time):
+            self.end_time = other.end_time
+
+    @property
+    def page_count(self) -> int:
+        """ 已处理的页数，包括从解析缓存读取的页 """
+        return len(self.pages) + self.counts.get('cache_pages', 0)
+
+    @property
+    def total_seconds(self) -> float:
+        if self.start_time is None:
+            return 0.0
+        end_time = self.end_time if self.end_time is not None else time.perf_counter()
+        return end_time - self.start_time
+
+    def summary(self, slowest: int = 5) -> dict:
+        """
+        汇总统计结果
+        :param slowest: 输出耗时最长的页数
+        :return:
+        """
+        total_seconds = self.total_seconds
+        # 多进程解析时各阶段耗时为所有进程之和，占比可能大于1
+        page_count = self.page_count
+        stages = {
+            name: {
+                'seconds': round(seconds, 4),
+                'count': count,
+                'share': round(seconds / total_seconds, 4) if total_seconds else 0.0,
+            }
+            for name, (seconds, count) in sorted(self.stages.items(), key=lambda x: -x[1][0])
+        }
+        slowest_pages = sorted(self.pages, key=lambda x: -x['seconds'])[:slowest]
+        rss_peak = peak_rss_bytes()
+        return {
+            'total_seconds': round(total_seconds, 4),
+            'pages': page_count,
+            'pages_per_second': round(page_count / total_seconds, 2) if total_seconds else 0.0,
+            'stages': stages,
+            'counts': dict(self.counts),
+            'memory': {
+                'tracemalloc_peak_mb': round(self.memory_peak / 1024 / 1024, 2) if self.trace_memory else None,
+                'rss_peak_mb': round(rss_peak / 1024 / 1024, 2) if rss_peak is not None else None,
+            },
+            'slowest_pages': [{'page_number': page['page_number'], 'seconds': round(page['seconds'], 4)}
+                              for page in slowest_pages],
+        }
+
+    def summary_line(self) -> str:
+        """ 一行的摘要，用于日志 """
+        summary = self.summary()
+        stages = '，'.join(f"{name}：{stage['seconds']}s" for name, stage in list(summary['stages'].items())[:5])
+        memory = summary['memory']
+        line = (f"页数：{summary['pages']}，耗时：{summary['total_seconds']}s，{summary['pages_per_second']}页/s，"
+                f"阶段耗时：{stages}，表格：{summary['counts'].get('tables', 0)}，"
+                f"跳过表格识别页数：{summary['counts'].get('table_skipped', 0)}")
+        if memory['rss_peak_mb'] is not None:
+            line += f"，RSS峰值：{memory['rss_peak_mb']}MB"
+        if 'chunks' in summary['counts']:
+            line += f"，文档数：{summary['counts']['chunks']}"
+        if memory['tracemalloc_peak_mb'] is not None:
+            line += f"，单页分配峰值：{memory['tracemalloc_peak_mb']}MB"
+        return line
+
+    def report(self) -> dict:
+        """ 完整的统计结果，包含每页的耗时、数量 """
+        report = self.summary()
+        report['page_details'] = sorted(
+            [dict(page, seconds=round(page['seconds'], 6),
+                  stages={name: round(seconds, 6) for name, seconds in page['stages'].items()})
+             for page in self.pages],
+            key=lambda x: x['page_number'])
+        return report
+
+    def save(self, path: Union[str, Path]) -> None:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+
+
+def stats_stage(stats: Optional[ParseStats], name: str) -> ContextManager:
+    """
+    stats为None时不统计，返回空的上下文管理器
+    :param stats:
+    :param name:
+    :return:
+    """
+    if stats is None:
+        return nullcontext()
+    return stats.stage(name)
@@ -0,0 +1,211 @@
+
+import io
+import gzip
+import json
+import base64
+from enum import Enum
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Union, Iterable, Iterator, Optional, Callable, TextIO, Dict
+
+from utils.utils_pymupdf_parse import PdfPage, PdfPageRecord, ElementType, ImageRef, write_txt_page
+from utils.utils_pdf import write_markdown_table
+from utils.utils_split_text import Document
+from utils.utils_stats import ParseStats, stats_stage
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ZSTD_AVAILABLE = zstandard is not None
+
+# 写缓冲区大小，攒够后再写入文件或压缩流
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+
+
+class OutputFormat(str, Enum):
+    txt = 'txt'
+    jsonl = 'jsonl'
+    markdown = 'markdown'
+    chunks = 'chunks'
+
+
+class Compression(str, Enum):
+    none = 'none'
+    gzip = 'gzip'
+    zstd = 'zstd'
+
+
+FORMAT_SUFFIX = {
+    OutputFormat.txt: '.txt',
+    OutputFormat.jsonl: '.jsonl',
+    OutputFormat.markdown: '.md',
+    OutputFormat.chunks: '.chunks.jsonl',
+}
+
+COMPRESSION_SUFFIX = {
+    Compression.none: '',
+    Compression.gzip: '.gz',
+    Compression.zstd: '.zst',
+}
+
+
+def output_suffix(output_format: Union[str, OutputFormat] = OutputFormat.txt,
+                  compression: Union[str, Compression, None] = None) -> str:
+    """
+    输出文件的后缀，如.jsonl.gz
+    :param output_format:
+    :param compression:
+    :return:
+    """
+    return FORMAT_SUFFIX[OutputFormat(output_format)] + COMPRESSION_SUFFIX[Compression(compression or Compression.none)]
+
+
+def infer_compression(path: Union[str, Path]) -> Compression:
+    """ 按文件后缀判断压缩方式 """
+    suffix = Path(path).suffix.lower()
+    for compression, compression_suffix in COMPRESSION_SUFFIX.items():
+        if compression_suffix and suffix == compression_suffix:
+            return compression
+    return Compression.none
+
+
+@contextmanager
+def open_output(path: Union[str, Path],
+                compression: Union[str, Compression, None] = None,
+                buffer_size: int = DEFAULT_BUFFER_SIZE) -> Iterator[TextIO]:
+    """
+    以带缓冲的文本模式打开输出文件，可选gzip、zstd压缩
+    :param path:
+    :param compression: 压缩方式，为None时按文件后缀判断
+    :param buffer_size: 写缓冲区大小
+    :return:
+    """
+    compression = infer_compression(path) if compression is None else Compression(compression)
+    if compression == Compression.none:
+        f = open(path, 'w', encoding='utf-8', buffering=buffer_size)
+    else:
+        if compression == Compression.gzip:
+            raw = gzip.open(path, 'wb')
+        else:
+            if not ZSTD_AVAILABLE:
+                raise ImportError('zstd压缩需要安装zstandard：pip install zstandard')
+            raw = zstandard.ZstdCompressor().stream_writer(open(path, 'wb'))
+        f = io.TextIOWrapper(io.BufferedWriter(raw, buffer_size=buffer_size), encoding='utf-8')
+    try:
+        yield f
+    finally:
+        f.close()
+
+
+def _element_value_json(element_value: Union[str, bytes, list, ImageRef]) -> Union[str, list, dict]:
+    if isinstance(element_value, bytes):
+        return base64.b64encode(element_value).decode('ascii')
+    if isinstance(element_value, ImageRef):
+        return element_value.model_dump()
+    return element_value
+
+
+def write_jsonl_page(page: Union[PdfPage, PdfPageRecord], write: Callable[[str], object]) -> None:
+    """
+    将一页解析结果写为JSONL，每个元素一行，包含页码、页面尺寸、元素类型和坐标；
+    inline模式的图片内容为base64编码，reference模式为ImageRef的字段
+    :param page:
+    :param write:
+    :return:
+    """
+    for element in page.page_elements:
+        record = {
+            'page_number': page.page_number,
+            'page_width': page.page_width,
+            'page_height': page.page_height,
+            'element_no': element.element_no,
+            'element_type': element.element_type.value,
+            'element_bbox': list(element.element_bbox),
+            'element_value': _element_value_json(element.element_value),
+        }
+        write(json.dumps(record, ensure_ascii=False))
+        write('\n')
+
+
+def write_markdown_page(page: Union[PdfPage, PdfPageRecord], write: Callable[[str], object]) -> None:
+    """
+    将一页解析结果写为Markdown，表格与切割时使用相同的渲染，图片以引用代替
+    :param page:
+    :param write:
+    :return:
+    """
+    write(f'<!-- page_number: {page.page_number} -->\n\n')
+    for element in page.page_elements:
+        if element.element_type == ElementType.text:
+            write(element.element_value)
+        elif element.element_type == ElementType.table:
+            write('\n')
+            write_markdown_table(element.element_value, write)
+            write('\n')
+        elif element.element_type == ElementType.image:
+            write(f'\n![image](page_{page.page_number}_element_{element.element_no})\n\n')
+    write('\n')
+
+
+PAGE_WRITERS: Dict[OutputFormat, Callable[[Union[PdfPage, PdfPageRecord], Callable[[str], object]], None]] = {
+    OutputFormat.txt: write_txt_page,
+    OutputFormat.jsonl: write_jsonl_page,
+    OutputFormat.markdown: write_markdown_page,
+}
+
+
+def save_pages(page_lst: Iterable[Union[PdfPage, PdfPageRecord]],
+               path: Union[str, Path],
+               output_format: Union[str, OutputFormat] = OutputFormat.txt,
+               compression: Union[str, Compression, None] = None,
+               buffer_size: int = DEFAULT_BUFFER_SIZE,
+               stats: Optional[ParseStats] = None) -> int:
+    """
+    逐页写入解析结果，page_lst为iter_pdf_pages返回的迭代器时边解析边写入，
+    缓冲区写满即落盘，下游可以在解析完成前开始读取
+    :param page_lst:
+    :param path:
+    :param output_format: 输出格式，txt、jsonl、markdown
+    :param compression: 压缩方式，none、gzip、zstd，为None时按文件后缀判断
+    :param buffer_size: 写缓冲区大小
+    :param stats: 统计写入耗时，为None时不统计
+    :return: 写入的页数
+    """
+    output_format = OutputFormat(output_format)
+    if output_format not in PAGE_WRITERS:
+        raise ValueError(f'{output_format.value}不是页的输出格式，切割结果请使用save_chunks')
+    write_page = PAGE_WRITERS[output_format]
+    page_count = 0
+    with open_output(path, compression=compression, buffer_size=buffer_size) as f:
+        for page in page_lst:
+            with stats_stage(stats, 'write'):
+                write_page(page, f.write)
+            page_count += 1
+    return page_count
+
+
+def save_chunks(docs: Iterable[Document],
+                path: Union[str, Path],
+                compression: Union[str, Compression, None] = None,
+                buffer_size: int = DEFAULT_BUFFER_SIZE,
+                stats: Optional[ParseStats] = None) -> int:
+    """
+    将parse_pdf_chunk等接口的切割结果写为JSONL，每个文档一行，包含page_content和metadata；
+    docs为iter_pdf_chunks返回的迭代器时边解析边写入
+    :param docs:
+    :param path:
+    :param compression: 压缩方式，none、gzip、zstd，为None时按文件后缀判断
+    :param buffer_size: 写缓冲区大小
+    :param stats: 统计写入耗时，为None时不统计
+    :return: 写入的文档数
+    """
+    doc_count = 0
+    with open_output(path, compression=compression, buffer_size=buffer_size) as f:
+        for doc in docs:
+            with stats_stage(stats, 'write'):
+                f.write(json.dumps({'page_content': doc.page_content, 'metadata': doc.metadata}, ensure_ascii=False))
+                f.write('\n')
+            doc_count += 1
+    return doc_count